@@ -1,5 +1,80 @@
 import numpy as np
-import pdb
+from functools import cached_property
+
+# np.trapz was renamed in numpy 2
+trapz = getattr(np, 'trapezoid', None) or np.trapz
+
+# Points on each side of a grid extremum fitted by the local splines
+splineWindow = 5
+
+def local_spline(x, f, i, window = splineWindow):
+    """
+    Cubic spline through the grid points around the point i
+    """
+    from scipy.interpolate import CubicSpline
+    lo = max(i - window, 0)
+    hi = min(i + window + 1, len(x))
+    return CubicSpline(x[lo:hi], f[lo:hi]), x[lo], x[hi - 1]
+
+def spline_extremum(x, f, i, kind = 'min', derivative = 0, window = splineWindow):
+    """
+    Position of the extremum (min or max) of f, or of its derivative, near
+    the grid extremum i, from the roots of the derivative of a local cubic
+    spline. Returns the position and the spline, the grid point if the
+    spline has no extremum inside its window.
+    """
+    x = np.asarray(x, dtype=float)
+    f = np.asarray(f, dtype=float)
+    spline, x0, x1 = local_spline(x, f, i, window)
+    target = spline.derivative(derivative) if derivative else spline
+    roots = target.derivative().roots(extrapolate=False)
+    candidates = np.concatenate([[x[i]], roots[(roots >= x0) & (roots <= x1)]])
+    values = target(candidates)
+    best = values.argmin() if kind == 'min' else values.argmax()
+    return candidates[best], spline
+
+class ProfileFeatures:
+    """
+    FEATURES OF ONE PROFILE
+    Velocity gradient, strain rate points, mass flux and progress variable,
+    computed once on first use and shared by the reference planes and by
+    PreHeat and Reaction. columns holds the other profiles (DataFrame or
+    dict), read as arrays by features[name].
+    """
+    def __init__(self, x, velocity, rho, columns = None):
+        self.x = np.asarray(x, dtype=float)
+        self.velocity = np.asarray(velocity, dtype=float)
+        self.rho = np.asarray(rho, dtype=float)
+        self.columns = {} if columns is None else columns
+
+    def __getitem__(self, name):
+        return np.asarray(self.columns[name], dtype=float)
+
+    @cached_property
+    def velocityGradient(self):
+        return np.gradient(self.velocity, self.x)
+
+    @cached_property
+    def strainRatePoints(self):
+        """
+        Max. strain rate, min. velocity upstream of it and max. strain rate
+        upstream of the min. velocity (characteristic strain rate)
+        """
+        Ku = abs(self.velocityGradient)
+        maxStrLocation = Ku.argmax()
+        minVelocityPoint = self.velocity[:maxStrLocation].argmin()
+        strainRatePoint = Ku[:minVelocityPoint].argmax()
+        return maxStrLocation, minVelocityPoint, strainRatePoint
+
+    @cached_property
+    def massFlux(self):
+        return self.rho*self.velocity
+
+    @cached_property
+    def progress(self):
+        """ Progress variable c = (T - Tu)/(Tb - Tu) """
+        T = self['T']
+        return (T - T[0])/(T[-1] - T[0])
 
 class PreHeat:
     """
@@ -7,11 +82,15 @@ class PreHeat:
     Obtain the location of the max. strain rate upstream of the pre-heat zone
     and the extrapolated flame speed. 
     """
-    def __init__(self,ref_Scalar,x,velocity,rho):
+    def __init__(self,ref_Scalar,x,velocity,rho,method = 'grid',features = None):
         """
         Reference plane:
         Any scalar to use as reference. Here, it was suggested the maximum value
         of O2 consumption
+        method: 'grid' takes the extrema at the grid points, 'spline' locates
+        them on local cubic splines of the profiles, so that the speeds and
+        strain rates do not depend on the grid resolution
+        features: ProfileFeatures of the profile, shared between reference planes
         """
         self.ref_Scalar = ref_Scalar
         self.refPoint = self.ref_Scalar.argmin()
@@ -19,37 +98,58 @@ class PreHeat:
         self.x = x
         self.velocity = velocity
         self.rho = rho
+        self.method = method
+        self.features = features or ProfileFeatures(x, velocity, rho)
 
     def flameSpeed_Ku(self):
-        Ku = np.gradient(self.velocity,self.x)
-        maxStrLocation = abs(Ku).argmax()
-        minVelocityPoint = self.velocity[:maxStrLocation].argmin()
+        if self.method == 'spline':
+            return self.flameSpeed_Ku_spline()
 
-        # S_mass = m(x)/rho_u
-        S_mass_u = self.rho*self.velocity/self.rho[0]
+        f = self.features
+        maxStrLocation, minVelocityPoint, strainRatePoint = f.strainRatePoints
 
         # Characteristic Strain Rate = K
-        strainRatePoint = abs(Ku[:minVelocityPoint]).argmax()
-        self.Ku_local = abs(Ku[strainRatePoint])
-
-        # Characteristic Flame Speed Su
-        Su_ = self.velocity[strainRatePoint] - self.Ku_local*(self.x[strainRatePoint:] - self.x[strainRatePoint])
-        try:
-            self.Su = Su_[self.refPoint]
-        except:
+        self.Ku_local = abs(f.velocityGradient[strainRatePoint])
+
+        # Characteristic Flame Speed Su, extrapolated to the reference plane
+        if strainRatePoint > self.refPoint:
+            self.Su = np.nan
+            self.Ku_local = np.nan
+            return
+        self.Su = f.velocity[strainRatePoint] - self.Ku_local*(f.x[self.refPoint] - f.x[strainRatePoint])
+
+    def flameSpeed_Ku_spline(self):
+        """
+        Same extrema as flameSpeed_Ku, located on local splines: the
+        reference plane (min. of ref_Scalar) and the max. strain rate
+        upstream of the min. velocity (extremum of du/dx)
+        """
+        f = self.features
+        x, velocity, Ku = f.x, f.velocity, f.velocityGradient
+        maxStrLocation, minVelocityPoint, strainRatePoint = f.strainRatePoints
+        if strainRatePoint > self.refPoint:
             self.Su = np.nan
             self.Ku_local = np.nan
+            return
+
+        x_ref, _ = spline_extremum(x, self.ref_Scalar, self.refPoint, 'min')
+        kind = 'min' if Ku[strainRatePoint] < 0 else 'max'
+        x_K, spline = spline_extremum(x, velocity, strainRatePoint, kind, derivative = 1)
+        self.Ku_local = abs(float(spline(x_K, 1)))
+        self.Su = float(spline(x_K)) - self.Ku_local*(x_ref - x_K)
   
     def strain_rate_u(self):
         # characteristic Strain Rate = K
-        self.flameSpeed_Ku()
+        if not hasattr(self, 'Ku_local'):
+            self.flameSpeed_Ku()
         return self.Ku_local
 
     def flame_speed_u(self):
         """
         Su is taken as an extroplation of local strain rate
         """
-        self.flameSpeed_Ku()
+        if not hasattr(self, 'Su'):
+            self.flameSpeed_Ku()
         return self.Su
 
 class Reaction():
@@ -58,11 +158,12 @@ class Reaction():
     Obtained from the extrapolation of mass frow at burnt gas. 
     """
 
-    def __init__(self,ref_Scalar,x,velocity,rho):
+    def __init__(self,ref_Scalar,x,velocity,rho,method = 'grid',features = None):
         """
         Reference plane:
         Any scalar to use as reference. Here, it was suggested the maximum value
         of O2 consumption
+        method and features as in PreHeat
         """
         self.ref_Scalar = ref_Scalar
         self.refPoint = self.ref_Scalar.argmin()
@@ -70,32 +171,56 @@ class Reaction():
         self.x = x
         self.velocity = velocity
         self.rho = rho
+        self.method = method
+        self.features = features or ProfileFeatures(x, velocity, rho)
 
     def flameSpeed_Kb(self):
+        if self.method == 'spline':
+            return self.flameSpeed_Kb_spline()
+
+        f = self.features
+        ref = self.refPoint
+        rho = f.rho
+        if ref > f.x.size - 3:
+            raise ValueError('reference plane at the end of the profile')
 
         # S_mass = m(x)/rho_b
-        S_mass = self.rho*self.velocity/self.rho[self.rho.size-1]
+        S_mass = f.massFlux[ref]/rho[rho.size-1]
 
-        """ Kb = 1/rho*(grad(rho*u)) """
-        grad = np.gradient(self.rho[self.refPoint:-1]*self.velocity[self.refPoint:-1],self.x[self.refPoint:-1])
-        #Kb = np.array(-(1./(self.rho[self.refPoint:-1]*grad)))
-        Kb = np.array(-(1./(self.rho[self.refPoint:-1]))*grad)
-        self.Kb_local = Kb[0]
+        """ Kb = 1/rho*(grad(rho*u)), forward difference at the reference plane """
+        grad = (f.massFlux[ref+1] - f.massFlux[ref])/(f.x[ref+1] - f.x[ref])
+        self.Kb_local = -(1./rho[ref])*grad
 
         # Weighted displacement speed
-        self.Sl_d = self.rho[self.x.size-1]*S_mass[self.refPoint]/self.rho[0]
+        self.Sl_d = rho[rho.size-1]*S_mass/rho[0]
+
+    def flameSpeed_Kb_spline(self):
+        """
+        Kb and Sl_d at the reference plane located on a local spline, from
+        the splines of the mass flux and density
+        """
+        f = self.features
+        x, rho, massFlux = f.x, f.rho, f.massFlux
+
+        x_ref, _ = spline_extremum(x, self.ref_Scalar, self.refPoint, 'min')
+        mSpline = local_spline(x, massFlux, self.refPoint)[0]
+        rhoSpline = local_spline(x, rho, self.refPoint)[0]
+        self.Kb_local = -float(mSpline(x_ref, 1))/float(rhoSpline(x_ref))
+        self.Sl_d = float(mSpline(x_ref))/rho[0]
 
     def strain_rate_b(self):
         # characteristic Strain Rate = K
-        self.flameSpeed_Kb()
+        if not hasattr(self, 'Kb_local'):
+            self.flameSpeed_Kb()
         return self.Kb_local
 
     def flame_speed_b(self):
         """
         Sb is taken as an extroplation of local strain rate
         """
-        self.flameSpeed_Kb()
-        return self.Sl_d    
+        if not hasattr(self, 'Sl_d'):
+            self.flameSpeed_Kb()
+        return self.Sl_d
 
 class FlameSpeeds:
 
@@ -110,8 +235,114 @@ class FlameSpeeds:
         Yb = self.Y[self.Y.size-1]
         Yu = self.Y[0]
         rho_u = self.rho[0]
-        integral_wdot = np.trapz(self.wdot, self.x)
+        integral_wdot = trapz(self.wdot, self.x)
         Sc = abs(integral_wdot)/(Yu - Yb)/rho_u
 
         return Sc
 
+
+def pad_profiles(values, offsets):
+    """
+    Ragged profiles (concatenated, profile i in values[offsets[i]:offsets[i+1]])
+    to a 2-D array padded with nan, and the size of each profile
+    """
+    values = np.asarray(values, dtype=float)
+    offsets = np.asarray(offsets)
+    lengths = np.diff(offsets)
+    padded = np.full((lengths.size, lengths.max()), np.nan)
+    row = np.repeat(np.arange(lengths.size), lengths)
+    col = np.arange(values.size) - np.repeat(offsets[:-1], lengths)
+    padded[row, col] = values[offsets[0]:offsets[-1]]
+    return padded, lengths
+
+
+def _gradient(f, x, lengths):
+    """
+    np.gradient(f, x) along each row of the padded profiles
+    """
+    rows = np.arange(f.shape[0])
+    last = lengths - 1
+    df = np.full(f.shape, np.nan)
+
+    # second order inner points, as np.gradient on non-uniform grids
+    dx1 = x[:, 1:-1] - x[:, :-2]
+    dx2 = x[:, 2:] - x[:, 1:-1]
+    a = -dx2/(dx1*(dx1 + dx2))
+    b = (dx2 - dx1)/(dx1*dx2)
+    c = dx1/(dx2*(dx1 + dx2))
+    df[:, 1:-1] = a*f[:, :-2] + b*f[:, 1:-1] + c*f[:, 2:]
+
+    # first order boundaries
+    df[:, 0] = (f[:, 1] - f[:, 0])/(x[:, 1] - x[:, 0])
+    df[rows, last] = (f[rows, last] - f[rows, last - 1])/(x[rows, last] - x[rows, last - 1])
+    return df
+
+
+def stretch_batch(ref_Scalar, x, velocity, rho, Y = None, wdot = None,
+                  offsets = None, lengths = None):
+    """
+    Flame speeds and strain rates of many profiles in one pass, the same as
+    PreHeat, Reaction and FlameSpeeds for each profile.
+    The profiles are either 2-D arrays (one profile per row, padded with nan
+    after lengths[i] points) or ragged 1-D arrays split by offsets.
+    Y and wdot (fuel mass fraction and consumption) are optional, for the
+    consumption speed.
+    Returns a structured array with the fields Su, Ku, Sl_d, Kb and Sc, nan
+    where the profile does not have the expected shape.
+    """
+    profiles = [ref_Scalar, x, velocity, rho]
+    if Y is not None:
+        profiles += [Y, wdot]
+    if offsets is not None:
+        profiles = [pad_profiles(p, offsets)[0] for p in profiles]
+        lengths = np.diff(offsets)
+    else:
+        profiles = [np.atleast_2d(np.asarray(p, dtype=float)) for p in profiles]
+        if lengths is None:
+            lengths = np.sum(~np.isnan(profiles[1]), axis=1)
+    ref_Scalar, x, velocity, rho = profiles[:4]
+    lengths = np.asarray(lengths)
+
+    nProfiles, nPoints = x.shape
+    rows = np.arange(nProfiles)
+    points = np.arange(nPoints)
+    valid = points < lengths[:, None]
+    last = lengths - 1
+
+    results = np.full(nProfiles, np.nan, dtype=[('Su', float), ('Ku', float),
+                                                 ('Sl_d', float), ('Kb', float),
+                                                 ('Sc', float)])
+
+    # Reference plane
+    refPoint = np.where(valid, ref_Scalar, np.inf).argmin(axis=1)
+
+    # PRE-HEAT ZONE
+    Ku = np.abs(_gradient(velocity, x, lengths))
+    maxStrLocation = np.where(valid, Ku, -np.inf).argmax(axis=1)
+    minVelocityPoint = np.where(points < maxStrLocation[:, None], velocity,
+                                np.inf).argmin(axis=1)
+    strainRatePoint = np.where(points < minVelocityPoint[:, None], Ku,
+                               -np.inf).argmax(axis=1)
+    Ku_local = Ku[rows, strainRatePoint]
+    Su = velocity[rows, strainRatePoint] - Ku_local*(x[rows, refPoint] - x[rows, strainRatePoint])
+    found = (maxStrLocation > 0) & (minVelocityPoint > 0) & (refPoint >= strainRatePoint)
+    results['Ku'] = np.where(found, Ku_local, np.nan)
+    results['Su'] = np.where(found, Su, np.nan)
+
+    # REACTION ZONE
+    # first point of np.gradient over [refPoint:-1] is a forward difference
+    found = refPoint + 2 < lengths
+    r0 = np.minimum(refPoint, last)
+    r1 = np.minimum(refPoint + 1, last)
+    grad = (rho[rows, r1]*velocity[rows, r1] - rho[rows, r0]*velocity[rows, r0])/(x[rows, r1] - x[rows, r0])
+    results['Kb'] = np.where(found, -grad/rho[rows, r0], np.nan)
+    results['Sl_d'] = np.where(found, rho[rows, r0]*velocity[rows, r0]/rho[:, 0], np.nan)
+
+    # CONSUMPTION SPEED
+    if Y is not None:
+        Y, wdot = profiles[4:]
+        segments = np.where(valid[:, 1:], 0.5*(wdot[:, 1:] + wdot[:, :-1])*np.diff(x, axis=1), 0.)
+        integral_wdot = segments.sum(axis=1)
+        results['Sc'] = np.abs(integral_wdot)/(Y[:, 0] - Y[rows, last])/rho[:, 0]
+
+    return results
@@ -0,0 +1,300 @@
+#!/usr/bin/env python3
+"""
+Benchmarks of the solve and post-processing pipeline.
+
+Every case runs in a new process and records the wall time of its stages,
+the peak memory and its numerical outputs (flame speeds, strain rates,
+Markstein numbers). The results are compared with the stored baseline,
+benchmarkBaseline.json: outputs out of the case tolerances are failures,
+times and memory above the baseline by more than --time-tolerance are
+reported as slower.
+
+    python benchmarks.py                      # all the cases
+    python benchmarks.py --quick              # post-processing cases only
+    python benchmarks.py --cases stretch-large --save   # update the baseline
+
+The pipeline cases solve a short velocity sweep (premixedCounterflow), its
+flame speeds (postProcessingFlameStretch) and Markstein numbers
+(postProcessingMarksteinNumber). The stretch cases run the StretchRate
+classes and stretch_batch on large synthetic profiles.
+"""
+
+import numpy as np
+import pandas as pd
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import contextlib
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+baselineFile = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                            'benchmarkBaseline.json')
+
+
+#----------------------------------------------------------
+# CASES
+
+def synthetic_profiles(nPoints, nProfiles = 1, seed = 0):
+    """
+    Counter-flow like profiles: decelerating inlet flow, expansion through
+    the flame at xf and stagnation plane at x = L, with a small
+    perturbation of the flame position and thickness by profile
+    """
+    rng = np.random.default_rng(seed)
+    L = 0.025
+    x = np.linspace(0., L, nPoints)[None, :]
+    xf = L*(0.6 + 0.05*rng.uniform(-1, 1, (nProfiles, 1)))
+    d = 2e-4*(1 + 0.1*rng.uniform(-1, 1, (nProfiles, 1)))
+    u0 = 2. + rng.uniform(0, 1, (nProfiles, 1))
+
+    s = 0.5*(1 + np.tanh((x - xf)/d))
+    velocity = u0*(1 - x/L) + 3.*u0*s*(L - x)/(L - xf)
+    rho = 1.1 - 0.95*s
+    Y = 0.055*(1 - s)
+    wdot = -800.*np.exp(-((x - xf)/d)**2)
+    wdotO2 = 4.*wdot
+    return {'x': np.broadcast_to(x, velocity.shape), 'velocity': velocity,
+            'rho': rho, 'Y': Y, 'wdot': wdot, 'wdotO2': wdotO2}
+
+
+def stretch_case(nPoints = 200000, nProfiles = 1, repeat = 3):
+    """
+    PreHeat, Reaction and FlameSpeeds on each profile, and stretch_batch on
+    all of them
+    """
+    from StretchRate import PreHeat, Reaction, FlameSpeeds, stretch_batch
+    p = synthetic_profiles(nPoints, nProfiles)
+
+    def classes():
+        rows = []
+        for i in range(nProfiles):
+            # the columns of the profiles, as read by the post-processing
+            data = pd.DataFrame({name: values[i] for name, values in p.items()})
+            ph = PreHeat(data['wdotO2'], data['x'], data['velocity'], data['rho'])
+            rz = Reaction(data['wdotO2'], data['x'], data['velocity'], data['rho'])
+            fs = FlameSpeeds(data['x'], data['rho'], data['Y'], data['wdot'])
+            rows.append([ph.flame_speed_u(), ph.strain_rate_u(), rz.flame_speed_b(),
+                         rz.strain_rate_b(), fs.consumption_speed()])
+        return np.array(rows)
+
+    def batch():
+        return stretch_batch(p['wdotO2'], p['x'], p['velocity'], p['rho'],
+                             p['Y'], p['wdot'])
+
+    times = {'classes': np.inf, 'batch': np.inf}
+    for i in range(repeat):
+        start = time.time()
+        rows = classes()
+        times['classes'] = min(times['classes'], time.time() - start)
+        start = time.time()
+        results = batch()
+        times['batch'] = min(times['batch'], time.time() - start)
+
+    outputs = {}
+    for j, name in enumerate(['Su', 'Ku', 'Sl_d', 'Kb', 'Sc']):
+        outputs[name] = rows[:, j].tolist()
+        outputs['batch_' + name] = results[name].tolist()
+    return times, outputs
+
+
+def pipeline_case(mechanism, fuel, phi, velocities, threshold = 10):
+    """
+    Velocity sweep, flame speeds and Markstein numbers of one mixture, in a
+    temporary folder
+    """
+    from mechanismRegistry import get_solution
+    from premixedCounterflow import velocity_sweep
+    from profileStore import ProfileStore
+    from postProcessingFlameStretch import update_results
+    from postProcessingMarksteinNumber import markstein_numbers
+    from flamesProps import compute_flame_props
+
+    times = {}
+    start = time.time()
+    gas = get_solution(mechanism)
+    times['mechanism'] = time.time() - start
+
+    with tempfile.TemporaryDirectory() as folder:
+        path = os.path.join(folder, 'profiles') + '/'
+        store = ProfileStore(path, run = {'mechanism': mechanism, 'fuel': fuel,
+                                          'phi': phi})
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            start = time.time()
+            velocity_sweep(gas, phi, fuel, np.asarray(velocities, dtype=float),
+                           path, loglevel = 0, store = store)
+            times['solve'] = time.time() - start
+
+            start = time.time()
+            results = update_results(path, folder + '/', fuel)
+            times['stretch'] = time.time() - start
+
+            start = time.time()
+            props = compute_flame_props(mechanism, fuel, phi)
+            times['flame_props'] = time.time() - start
+
+            start = time.time()
+            fits = markstein_numbers([results], props['D_th']/props['Sl_o'],
+                                     props['Sl_o'], threshold)[0]
+            times['markstein'] = time.time() - start
+
+        info = [store.info(label) for label in store.labels]
+
+    outputs = {'Sl_o': float(props['Sl_o']), 'D_th': float(props['D_th']),
+               'T_max': [p['T_max'] for p in info],
+               'grid_points': [p['grid_points'] for p in info]}
+    for column in ['Su', 'Ku', 'Su_b', 'Kb', 'Sc']:
+        outputs[column] = results[column].tolist()
+    for name in fits.dtype.names:
+        outputs['Ma_' + name] = float(fits[name]['Ma'])
+        outputs['intercept_' + name] = float(fits[name]['intercept'])
+    return times, outputs
+
+
+# name: (function, arguments, relative and absolute tolerances of the outputs)
+cases = {
+    'stretch-large': (stretch_case, {'nPoints': 1000000}, (1e-9, 1e-12)),
+    'stretch-batch': (stretch_case, {'nPoints': 5000, 'nProfiles': 400},
+                      (1e-9, 1e-12)),
+    'CH4-kee-0.80': (pipeline_case, {'mechanism': 'chemicalMechanism/kee.xml',
+                                     'fuel': 'CH4', 'phi': 0.8,
+                                     'velocities': [1., 2., 3., 4., 5.]}, (1e-3, 1e-6)),
+    'CH4-kee-1.00': (pipeline_case, {'mechanism': 'chemicalMechanism/kee.xml',
+                                     'fuel': 'CH4', 'phi': 1.0,
+                                     'velocities': [1., 2., 3., 4., 5.]}, (1e-3, 1e-6)),
+    'CH4-kee-1.20': (pipeline_case, {'mechanism': 'chemicalMechanism/kee.xml',
+                                     'fuel': 'CH4', 'phi': 1.2,
+                                     'velocities': [1., 2., 3., 4., 5.]}, (1e-3, 1e-6)),
+    'H2-Li-0.50': (pipeline_case, {'mechanism': 'chemicalMechanism/Li.xml',
+                                   'fuel': 'H2', 'phi': 0.5,
+                                   'velocities': [2., 4., 6., 8., 10.]}, (1e-3, 1e-6)),
+    'NH3-mecNH3-1.00': (pipeline_case, {'mechanism': 'chemicalMechanism/mecNH3.xml',
+                                        'fuel': 'NH3', 'phi': 1.0,
+                                        'velocities': [0.1, 0.15, 0.2, 0.25, 0.3]},
+                        (1e-3, 1e-6)),
+}
+quickCases = ['stretch-large', 'stretch-batch']
+
+
+def run_case(name):
+    """
+    Run one case in the current process (a new one for each case)
+    """
+    from sweepTelemetry import peak_memory
+    function, arguments, tolerances = cases[name]
+    start = time.time()
+    times, outputs = function(**arguments)
+    times['total'] = time.time() - start
+    return {'times': times, 'peak_memory': peak_memory(), 'outputs': outputs}
+
+
+def versions():
+    import cantera as ct
+    import scipy
+    return {'python': sys.version.split()[0], 'numpy': np.__version__,
+            'scipy': scipy.__version__, 'pandas': pd.__version__,
+            'cantera': ct.__version__}
+
+
+#----------------------------------------------------------
+# COMPARISON
+
+def compare_outputs(result, reference, tolerances):
+    """
+    Names of the outputs out of the tolerances
+    """
+    rtol, atol = tolerances
+    failed = []
+    for name, value in reference.items():
+        if name not in result:
+            failed.append(name)
+            continue
+        a = np.asarray(result[name], dtype=float)
+        b = np.asarray(value, dtype=float)
+        if a.shape != b.shape or not np.allclose(a, b, rtol=rtol, atol=atol,
+                                                 equal_nan=True):
+            failed.append(name)
+    return failed
+
+
+def compare(name, result, reference, timeTolerance):
+    """
+    Print the comparison of one case with its baseline, return True if the
+    outputs match
+    """
+    failed = compare_outputs(result['outputs'], reference['outputs'], cases[name][2])
+    print('** {}: {}'.format(name, 'outputs OK' if not failed else
+                             'OUTPUTS CHANGED: ' + ', '.join(failed)))
+    for stage, value in result['times'].items():
+        base = reference['times'].get(stage)
+        if base is None:
+            print('   {:<12s} {:9.3f} s'.format(stage, value))
+            continue
+        flag = ' SLOWER' if value > base*timeTolerance and value - base > 0.05 else ''
+        print('   {:<12s} {:9.3f} s  baseline {:9.3f} s  x{:.2f}{}'.format(
+              stage, value, base, base/value if value > 0 else np.inf, flag))
+    base = reference['peak_memory']
+    flag = ' LARGER' if result['peak_memory'] > base*timeTolerance else ''
+    print('   {:<12s} {:9.1f} MB baseline {:9.1f} MB{}'.format(
+          'peak memory', result['peak_memory'], base, flag))
+    return not failed
+
+
+def main(argv = None):
+
+    parser = argparse.ArgumentParser(description='Benchmarks of the solve and '
+                                     'post-processing pipeline')
+    parser.add_argument('--cases', nargs='+', choices=sorted(cases),
+                        help='cases to run, all by default')
+    parser.add_argument('--quick', action='store_true',
+                        help='only the post-processing cases (no solve)')
+    parser.add_argument('--baseline', default=baselineFile)
+    parser.add_argument('--save', action='store_true',
+                        help='store the results of the cases in the baseline')
+    parser.add_argument('--time-tolerance', type=float, default=1.25,
+                        help='ratio to the baseline time and memory reported '
+                        'as slower')
+    parser.add_argument('--list', action='store_true')
+    args = parser.parse_args(argv)
+
+    if args.list:
+        for name in cases:
+            print(name)
+        return
+
+    names = args.cases or (quickCases if args.quick else list(cases))
+    baseline = {'versions': {}, 'cases': {}}
+    if os.path.isfile(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    current = versions()
+    if baseline['versions'] and baseline['versions'] != current:
+        print('Baseline from other versions: {}\n'.format(baseline['versions']))
+
+    # one new process by case, for its peak memory
+    context = multiprocessing.get_context('spawn')
+    ok = True
+    for name in names:
+        with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+            result = pool.submit(run_case, name).result()
+        if name in baseline['cases']:
+            ok &= compare(name, result, baseline['cases'][name], args.time_tolerance)
+        else:
+            print('** {}: no baseline, {:.3f} s, {:.1f} MB'.format(
+                  name, result['times']['total'], result['peak_memory']))
+        baseline['cases'][name] = result
+
+    if args.save:
+        baseline['versions'] = current
+        with open(args.baseline, 'w') as f:
+            json.dump(baseline, f, indent=1)
+        print('\nBaseline saved: ' + args.baseline)
+    if not ok:
+        sys.exit(1)
+
+
+if __name__=='__main__':
+    main()
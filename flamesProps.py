@@ -1,3 +1,7 @@
+import numpy as np
+import pandas as pd
+import os
+
 flamesProp_CH4 = { 1.4  : {'D_th': 2.29e-05, 'Sl_o': 0.1212},
                  1.38 : {'D_th': 2.29e-05, 'Sl_o': 0.1443},
                  1.35 : {'D_th': 2.29e-05, 'Sl_o': 0.1964},
@@ -24,3 +28,94 @@ flamesProp_H2 = {1.4  : {'D_th': 5.35e-05, 'Sl_o': 2.9573},
                  0.5  : {'D_th': 3.66e-05, 'Sl_o': 0.5517},
                  0.4  : {'D_th': 3.42e-05, 'Sl_o': 0.2330}
   }
+
+
+#----------------------------------------------------------
+# Computed properties
+# D_th (thermal diffusivity of the reactants) and Sl_o (speed of the
+# unstretched flame, from ct.FreeFlame) are computed once and kept in
+# propsFile, keyed by the mechanism hash, fuel, phi, T, p and transport model.
+
+propsFile = './mechanismCache/flamesProps.csv'
+propsKeys = ['hash', 'fuel', 'phi', 'T', 'p', 'transport_model']
+
+def compute_flame_props(mechanism, fuel, phi, T = 300., p = 101325.,
+                        transport_model = 'Mix'):
+  """
+  D_th and Sl_o of a freely propagating flame
+  """
+  import cantera as ct
+  from mechanismRegistry import get_solution
+  from premixedCounterflow import set_transport
+
+  gas = get_solution(mechanism)
+  gas.set_equivalence_ratio(phi, fuel, {'O2':1.0, 'N2':3.76})
+  gas.TP = T, p
+
+  flame = ct.FreeFlame(gas, width=0.03)
+  set_transport(flame, transport_model)
+  D_th = gas.thermal_conductivity/(gas.density*gas.cp_mass)
+  flame.set_refine_criteria(ratio=3, slope=0.06, curve=0.12)
+  flame.solve(loglevel=0, auto=True)
+
+  return {'D_th': D_th, 'Sl_o': flame.velocity[0]}
+
+def read_props():
+  """
+  Table of the computed properties, the last entry of a key wins
+  """
+  if not os.path.isfile(propsFile):
+    return pd.DataFrame(columns=['mechanism'] + propsKeys + ['D_th', 'Sl_o'])
+  table = pd.read_csv(propsFile, index_col=None, dtype={'hash': str})
+  return table.drop_duplicates(subset=propsKeys, keep='last')
+
+def save_props(mechanism, key, props):
+  folder = os.path.dirname(propsFile)
+  if folder and not os.path.isdir(folder):
+    os.makedirs(folder, exist_ok=True)
+  row = dict(key, mechanism=mechanism, **props)
+  df = pd.DataFrame([row], columns=['mechanism'] + propsKeys + ['D_th', 'Sl_o'])
+  # one line appended by entry, so that parallel runs can share the file
+  df.to_csv(propsFile, mode='a', index=False, header=not os.path.isfile(propsFile))
+
+def flame_props(fuel, phi, mechanism = 'kee', T = 300., p = 101325.,
+                transport_model = 'Mix', interpolate = False, compute = True):
+  """
+  D_th and Sl_o of a laminar flame, as the dicts above.
+  Looked up in propsFile, else interpolated in phi between the stored points
+  (if interpolate), else computed and stored (if compute), else None.
+  """
+  from mechanismRegistry import mechanism_hash
+  from premixedCounterflow import transport_name
+
+  transport_model = transport_name(transport_model)
+  key = {'hash': mechanism_hash(mechanism), 'fuel': fuel, 'phi': float(phi),
+         'T': float(T), 'p': float(p), 'transport_model': transport_model}
+  table = read_props()
+  same = np.ones(len(table), dtype=bool)
+  for name in propsKeys:
+    if name != 'phi':
+      same &= (table[name] == key[name]).values
+  table = table[same].sort_values('phi')
+
+  found = np.isclose(table['phi'].values.astype(float), phi, rtol=0., atol=1e-8)
+  if found.any():
+    row = table[found].iloc[-1]
+    return {'D_th': row['D_th'], 'Sl_o': row['Sl_o']}
+
+  if interpolate and len(table) > 1 and table['phi'].min() < phi < table['phi'].max():
+    return {'D_th': np.interp(phi, table['phi'], table['D_th']),
+            'Sl_o': np.interp(phi, table['phi'], table['Sl_o'])}
+
+  if not compute:
+    return None
+  print('Computing the laminar flame: {} phi={} ({})'.format(fuel, phi, mechanism))
+  props = compute_flame_props(mechanism, fuel, phi, T, p, transport_model)
+  save_props(mechanism, key, props)
+  return props
+
+def fill_props(fuel, phis, mechanism = 'kee', **conditions):
+  """
+  Compute the missing points of a phi map
+  """
+  return {phi: flame_props(fuel, phi, mechanism, **conditions) for phi in phis}
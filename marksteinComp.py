@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+"""
+Single entry point of the pipeline, one subcommand by stage:
+
+    python marksteinComp.py solve --fuels CH4 --phis 0.8 1.0 --velocity 1 5 10
+    python marksteinComp.py stretch --fuel CH4 --phi 1.0 --no-plot
+    python marksteinComp.py markstein --no-plot
+    python marksteinComp.py plot stretchResults/ --format png pdf
+    python marksteinComp.py database fill --fuels H2 --phis 0.5 0.6 0.7
+
+The arguments after the subcommand are those of the stage script
+(python marksteinComp.py stretch --help). Only the modules of the stage are
+imported, so the post-processing commands start without Cantera, and
+without matplotlib unless they plot.
+"""
+
+import sys
+import argparse
+import importlib
+
+# subcommand: (module, description)
+commands = {
+    'solve': ('sweepDriver', 'counter-flow sweeps of many mixtures, in parallel'),
+    'stretch': ('postProcessingFlameStretch', 'flame speeds and stretch rates of a sweep'),
+    'markstein': ('postProcessingMarksteinNumber', 'Markstein numbers of the results'),
+    'plot': ('plotResults', 'figures of the results folders (headless)'),
+    'database': ('resultsDatabase', 'Markstein maps of the results database'),
+    'pipeline': ('marksteinPipeline', 'one sweep and its Ma, in memory'),
+    'sensitivity': ('marksteinSensitivity', 'sensitivity of Ma to the reaction rates'),
+    'telemetry': ('sweepTelemetry', 'report of the sweep telemetry'),
+    'benchmark': ('benchmarks', 'benchmarks of the pipeline'),
+}
+
+
+def main(argv = None):
+
+    parser = argparse.ArgumentParser(
+        description='Markstein numbers of premixed counter-flow twin flames',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog='commands:\n' + '\n'.join('  {:<10s} {}'.format(name, description)
+                                         for name, (_, description) in commands.items()))
+    parser.add_argument('command', choices=list(commands))
+    parser.add_argument('arguments', nargs=argparse.REMAINDER,
+                        help='arguments of the command (COMMAND --help)')
+    args = parser.parse_args(argv)
+
+    module = importlib.import_module(commands[args.command][0])
+    # usage messages of the stage named after the subcommand
+    sys.argv[0] = '{} {}'.format(parser.prog, args.command)
+    module.main(args.arguments)
+
+
+if __name__=='__main__':
+    main()
@@ -0,0 +1,265 @@
+#!/usr/bin/env python3
+"""
+The three stages in one process, without intermediate files.
+
+Each burning flame of the sweep goes to OnlineMarkstein as soon as it is
+solved: its flame speeds and stretch rates are computed from the flame
+arrays (postProcessingFlameStretch.stretch_flame) and the Markstein numbers
+are fitted again, so an estimate of Ma is shown from the third point on.
+With --save, the profiles (binary store), results.csv and case.json are
+also written, as by the three stages, for the plots and the database.
+
+With --tolerance, the sweep stops as soon as the next flames are not
+needed by the fit: once the confidence interval of Ma is narrower than the
+tolerance, or once the Karlovitz number of the flames (with the D_th and
+Sl_o of flamesProps) is above the threshold of the fit, since the points
+of higher stretch never enter it. An adaptive sweep with
+--until-extinction goes on to the extinction instead, with growing steps.
+
+    python marksteinPipeline.py --fuel H2 --phi 0.6 --mechanism Li --velocity 1 10 10
+"""
+
+import numpy as np
+import pandas as pd
+import os
+import argparse
+from contextlib import nullcontext
+
+
+class OnlineMarkstein:
+    """
+    MARKSTEIN NUMBERS UPDATED FLAME BY FLAME
+    add(oppFlame, gas, u) computes the flame speeds and stretch rates of one
+    flame (the columns of results.csv) and fits the Markstein numbers of the
+    burnt gas, unburnt gas and consumption speeds again
+    (postProcessingMarksteinNumber.markstein_numbers). As the stretch stage,
+    the first flame of the sweep is left out of the fits, and finish() also
+    leaves out the last one.
+    With a tolerance, add() returns True once the flames of higher stretch
+    are not needed anymore (see done). resume() adds the flames already
+    solved by a restarted sweep.
+    """
+
+    def __init__(self, fuel, deltaL, Sl_o, threshold = 10., method = 'ols',
+                 extrema = 'grid', planes = ('O2',), verbose = True,
+                 tolerance = None, definition = 'burnt', minPoints = 3):
+        self.fuel = fuel
+        self.deltaL = deltaL
+        self.Sl_o = Sl_o
+        self.threshold = threshold
+        self.method = method
+        self.extrema = extrema
+        self.planes = list(planes)
+        self.verbose = verbose
+        self.tolerance = tolerance
+        self.definition = definition
+        self.minPoints = minPoints
+        self.rows = []
+        self.fits = None
+        self.stopped = None
+
+    def results(self, dropEnds = False):
+        """
+        Flame speeds and stretch rates so far, as results.csv, sorted by
+        inlet velocity, without the first flame (and the last one if
+        dropEnds)
+        """
+        from postProcessingFlameStretch import result_columns
+
+        data = pd.DataFrame(self.rows, columns=['u'] + result_columns(self.planes))
+        data = data.iloc[np.argsort(data['u'].astype(float).values)]
+        data = data.iloc[1:-1] if dropEnds else data.iloc[1:]
+        return data.reset_index(drop=True)
+
+    def fit(self, dropEnds = False):
+        from postProcessingMarksteinNumber import markstein_numbers
+
+        return markstein_numbers([self.results(dropEnds)], self.deltaL, self.Sl_o,
+                                 self.threshold, self.method)[0]
+
+    def row(self, oppFlame, gas, u):
+        """ Flame speeds and stretch rates of one flame, as results.csv """
+        from postProcessingFlameStretch import stretch_flame, result_columns
+
+        row = {'u': '{:.3f}'.format(u)}
+        try:
+            row.update(stretch_flame(oppFlame, gas, self.fuel, self.extrema, self.planes))
+        except ValueError as error:
+            print('No flame speed at {:.3f} m/s: {}'.format(u, error))
+            row.update(dict.fromkeys(result_columns(self.planes), np.nan))
+        return row
+
+    def add(self, oppFlame, gas, u):
+        """
+        Process one flame, then fit the Markstein numbers again. Returns
+        True if the sweep can stop
+        """
+        self.rows.append(self.row(oppFlame, gas, u))
+        self.fits = self.fit()
+        if self.verbose:
+            self.show(u, self.fits)
+        return self.done()
+
+    def resume(self, manifest, gas, width = 0.025, transport_model = 'Mix'):
+        """
+        Process the converged flames of a restarted sweep (its SweepManifest)
+        and fit them. gas must be in the state of the sweep. Returns True if
+        the sweep can stop
+        """
+        from premixedCounterflow import create_flame
+
+        points = sorted([point for point in manifest.points
+                         if point['status'] == 'converged' and point.get('solution')],
+                        key=lambda point: point['u'])
+        if not points:
+            return False
+        T, p, Y = gas.T, gas.P, gas.Y
+        for point in points:
+            oppFlame = create_flame(gas, gas.density*point['u'], width, transport_model)
+            oppFlame.restore(manifest.solution(point), name = 'solution')
+            self.rows.append(self.row(oppFlame, gas, point['u']))
+            gas.TPY = T, p, Y
+        self.fits = self.fit()
+        if self.verbose:
+            self.show(points[-1]['u'], self.fits)
+        return self.done()
+
+    def done(self):
+        """
+        True once the Ma of definition is known within the tolerance (width of
+        its confidence interval, on the points finish() keeps, at least
+        minPoints), or once the last flame is above the Karlovitz threshold of
+        the fit. Always False without tolerance.
+        """
+        if self.tolerance is None:
+            return False
+        if self.stopped is not None:
+            return True
+        u = float(self.rows[-1]['u'])
+        Ka = self.rows[-1]['Kb']*self.deltaL/self.Sl_o
+        fit = self.fit(dropEnds = True)[self.definition] if len(self.rows) > 2 else None
+        if fit is not None and fit['points'] >= self.minPoints and \
+           fit['Ma_high'] - fit['Ma_low'] <= self.tolerance:
+            self.stopped = {'u': u, 'reason': 'Ma {} +/- {:.3f}'.format(
+                self.definition, 0.5*(fit['Ma_high'] - fit['Ma_low']))}
+        elif len(self.rows) > 1 and Ka > self.threshold:
+            self.stopped = {'u': u, 'reason': 'Ka = {:.3g} above the threshold'.format(Ka)}
+        if self.stopped is not None:
+            print('No more points needed after {:.3f} m/s: {}'.format(u, self.stopped['reason']))
+        return self.stopped is not None
+
+    def show(self, u, fits):
+        fit = fits[self.definition]
+        print('u = {:.3f} m/s, Ka = {:.3g}: Ma = {:.3f} [{:.3f}, {:.3f}] ({} points)'.format(
+              u, self.rows[-1]['Kb']*self.deltaL/self.Sl_o, fit['Ma'], fit['Ma_low'],
+              fit['Ma_high'], fit['points']))
+
+    def finish(self):
+        """ Final fits, on the points the stretch stage keeps """
+        self.fits = self.fit(dropEnds = True)
+        return self.fits
+
+
+def run_pipeline(fuel, phi, mechanism, axial_velocity, width = 0.025,
+                 transport_model = 'Mix', T = 300., p = 101325., adaptive = False,
+                 path = None, threshold = 10., method = 'ols', extrema = 'grid',
+                 planes = ('O2',), verbose = True, tolerance = None,
+                 untilExtinction = False):
+    """
+    Solve one sweep and fit its Markstein numbers as the flames are solved.
+    Nothing is written unless path: then the profiles go to the store of
+    path (in the background), and results.csv and case.json to
+    path/stretchResults. With a tolerance, the sweep stops once the fit has
+    converged (OnlineMarkstein.done), unless adaptive and untilExtinction.
+    Returns the OnlineMarkstein of the sweep, with its final fits.
+    """
+    from flamesProps import flame_props
+    from mechanismRegistry import get_solution
+    from premixedCounterflow import velocity_sweep, adaptive_sweep, transport_name
+    from profileStore import ProfileStore
+    from profileWriter import ProfileWriter
+    from plotResults import write_case
+
+    transport_model = transport_name(transport_model)
+    props = flame_props(fuel, phi, mechanism, T, p, transport_model)
+    online = OnlineMarkstein(fuel, props['D_th']/props['Sl_o'], props['Sl_o'],
+                             threshold, method, extrema, planes, verbose, tolerance)
+    gas = get_solution(mechanism)
+    store = None
+    if path is not None:
+        store = ProfileStore(path, run = {'mechanism': mechanism, 'fuel': fuel,
+                                          'phi': phi, 'width': width, 'T': T, 'p': p,
+                                          'transport_model': transport_model})
+    u = np.asarray(axial_velocity, dtype=float)
+    with ProfileWriter(path, store) if path is not None else nullcontext() as writer:
+        options = dict(width = width, transport_model = transport_model, loglevel = 0,
+                       store = store, writer = writer, T = T, p = p,
+                       onFlame = online.add)
+        if adaptive:
+            adaptive_sweep(gas, phi, fuel, path, u_start = u[0], u_max = u[-1],
+                           du = u[1] - u[0], untilExtinction = untilExtinction,
+                           **options)
+        else:
+            velocity_sweep(gas, phi, fuel, u, path, **options)
+    fits = online.finish()
+
+    if path is not None:
+        pathToSave = os.path.join(path, 'stretchResults')
+        if not os.path.isdir(pathToSave):
+            os.makedirs(pathToSave)
+        online.results(dropEnds = True).to_csv(os.path.join(pathToSave, 'results.csv'),
+                                               index = False)
+        write_case(pathToSave, path, fuel, phi, mechanism, T = T, p = p,
+                   transport_model = transport_model, extrema = extrema,
+                   planes = list(planes))
+    print('\nMarkstein numbers ({} flames):'.format(len(online.rows)))
+    for name in fits.dtype.names:
+        print('  {:12s} Ma = {:.3f} [{:.3f}, {:.3f}], {} points'.format(
+              name, fits[name]['Ma'], fits[name]['Ma_low'], fits[name]['Ma_high'],
+              fits[name]['points']))
+    return online
+
+
+def main(argv = None):
+
+    parser = argparse.ArgumentParser(description='Markstein numbers of a '
+                                     'counter-flow sweep, fitted as the flames '
+                                     'are solved')
+    parser.add_argument('--fuel', default='CH4')
+    parser.add_argument('--phi', type=float, default=1.)
+    parser.add_argument('--mechanism', default='chemicalMechanism/kee.xml')
+    parser.add_argument('--velocity', nargs=3, type=float, default=[1., 5., 10],
+                        metavar=('START', 'STOP', 'NUM'),
+                        help='inlet velocity range (m/s), as np.linspace')
+    parser.add_argument('--adaptive', action='store_true',
+                        help='adaptive steps up to extinction, the velocity '
+                        'range gives the first point, first step and max.')
+    parser.add_argument('--transport', default='Mix')
+    parser.add_argument('--T', type=float, default=300., help='reactants temperature (K)')
+    parser.add_argument('--p', type=float, default=1., help='pressure (atm)')
+    parser.add_argument('--width', type=float, default=0.025)
+    parser.add_argument('--save', default=None, metavar='PATH',
+                        help='also write the profiles and results.csv in PATH')
+    parser.add_argument('--threshold', type=float, default=10.,
+                        help='largest Karlovitz number of the linear fit')
+    parser.add_argument('--method', default='ols', choices=['ols', 'huber', 'theil-sen'])
+    parser.add_argument('--extrema', choices=['grid', 'spline'], default='grid')
+    parser.add_argument('--planes', nargs='+', default=['O2'])
+    parser.add_argument('--tolerance', type=float, default=None,
+                        help='stop the sweep once the confidence interval of '
+                        'Ma (burnt gas) is narrower, or the flames are above '
+                        'the threshold')
+    parser.add_argument('--until-extinction', action='store_true',
+                        help='with --adaptive and --tolerance, go on to the '
+                        'extinction once the fit has converged')
+    args = parser.parse_args(argv)
+
+    u = np.linspace(args.velocity[0], args.velocity[1], int(args.velocity[2]))
+    run_pipeline(args.fuel, args.phi, args.mechanism, u, args.width, args.transport,
+                 args.T, args.p*101325., args.adaptive, args.save, args.threshold,
+                 args.method, args.extrema, args.planes, tolerance = args.tolerance,
+                 untilExtinction = args.until_extinction)
+
+
+if __name__=='__main__':
+    main()
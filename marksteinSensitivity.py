@@ -0,0 +1,266 @@
+#!/usr/bin/env python3
+"""
+Sensitivity of the Markstein numbers to the reaction rates.
+
+The base sweep of the mixture is solved first (as by sweepDriver, with its
+manifest and saved flames). The rate of each reaction is then multiplied by
+factor (Solution.set_multiplier) and the points of the Markstein fit are
+solved again, each one starting from the base flame of the same velocity.
+The perturbed sweeps run in parallel, one reaction by task; the flame
+speeds are taken from the flame arrays (postProcessingFlameStretch.
+stretch_flame) and the Markstein numbers of all the reactions are fitted in
+one call, so nothing is written but the base sweep and the results.
+
+The sensitivities dMa/dln(k) = (Ma(factor k) - Ma(k))/ln(factor) are
+ranked by magnitude. The base flames are solved again as the perturbed
+ones, and the extrema are taken on local splines by default, so that the
+differences are those of the rates and not of the grids (with the
+refineCriteria of premixedCounterflow, a reaction without effect gets
+|dMa/dln(k)| below 0.01). Every perturbed reaction is kept in
+<case>/sensitivity.jsonl, so an interrupted run only solves the reactions
+left. A reaction whose perturbed flames do not all converge (failed solve,
+extinction, no flame speed) is kept there with the velocities that
+failed; it is listed with the others but without Markstein numbers, as its
+fit would not be on the velocities of the base one.
+
+    python marksteinSensitivity.py --fuel H2 --phi 0.6 --mechanism Li --velocity 1 10 10
+"""
+
+import numpy as np
+import pandas as pd
+import os
+import json
+import time
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+sensitivityFile = 'sensitivity.jsonl'
+
+
+def perturbed_points(task):
+    """
+    Flame speeds and stretch rates of the velocities of task, with the rate
+    of reaction task['reaction'] multiplied by task['factor'] (None for the
+    base flames), and the laminar flame properties (D_th, Sl_o) of the
+    perturbed mechanism. Every point starts from the base flame. The
+    velocities not solved are given in failed, with the reason.
+    """
+    import cantera as ct
+    from mechanismRegistry import get_solution
+    from premixedCounterflow import seed_flame, solve_flame
+    from postProcessingFlameStretch import stretch_flame
+    from profileWriter import profile_layout
+    from flamesProps import compute_flame_props
+    from sweepManifest import SweepManifest
+
+    start = time.time()
+    gas = get_solution(task['mechanism'])
+    gas.set_multiplier(1.)
+    if task['reaction'] is not None:
+        gas.set_multiplier(task['factor'], task['reaction'])
+    seed = SweepManifest(task['seed'])
+    layout = profile_layout(gas, task['fuel'])
+
+    rows = []
+    failed = []
+    try:
+        for u in task['velocities']:
+            gas.set_equivalence_ratio(task['phi'], task['fuel'], {'O2':1.0, 'N2':3.76})
+            gas.TP = task['T'], task['p']
+            guess = seed_flame(gas, seed, u, task['width'], task['transport_model'])
+            try:
+                oppFlame = solve_flame(gas, gas.density*u, guess, task['width'],
+                                       task['transport_model'], loglevel = 0)
+            except ct.CanteraError as error:
+                reason = [line for line in str(error).splitlines()
+                          if line.strip() and not line.startswith('*')][-1]
+                failed.append({'u': u, 'reason': reason})
+                continue
+            if np.max(oppFlame.T) < 500:
+                failed.append({'u': u, 'reason': 'extinction'})
+                continue
+            row = {'u': u}
+            try:
+                row.update(stretch_flame(oppFlame, gas, task['fuel'], task['method']))
+            except ValueError as error:
+                failed.append({'u': u, 'reason': str(error)})
+                continue
+            rows.append(row)
+        # the laminar flame of the perturbed mechanism (not stored in flamesProps)
+        props = compute_flame_props(task['mechanism'], task['fuel'], task['phi'],
+                                    task['T'], task['p'], task['transport_model'])
+    finally:
+        gas.set_multiplier(1.)
+    return {'reaction': task['reaction'], 'rows': rows, 'failed': failed,
+            'D_th': float(props['D_th']), 'Sl_o': float(props['Sl_o']),
+            'time': time.time() - start}
+
+
+def complete(entry, velocities):
+    """ True if the flames of entry were all solved, at velocities """
+    solved = [row['u'] for row in entry['rows']]
+    return len(solved) == len(velocities) and np.allclose(solved, velocities)
+
+
+def read_sensitivity(fileName, key):
+    """ Perturbed reactions of a previous run with the same key """
+    done = {}
+    if os.path.isfile(fileName):
+        with open(fileName) as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # line of an interrupted run
+                    continue
+                if entry.pop('key') == key:
+                    done[entry['reaction']] = entry
+    return done
+
+
+def markstein_sensitivity(case, reactions = None, factor = 1.1, threshold = 10.,
+                          method = 'ols', extrema = 'spline', workers = None):
+    """
+    Sensitivities of the Markstein numbers of one sweepDriver case to the
+    rates of reactions (indices, all by default). Returns the table of the
+    reactions with their Markstein numbers and dMa/dln(k), ranked by the
+    magnitude of the burnt gas sensitivity. The reactions without all the
+    perturbed flames of the fit are ranked last, without Markstein numbers,
+    with the velocities not solved and why in the failed column.
+    """
+    from sweepDriver import run_case, _init_worker
+    from sweepManifest import SweepManifest
+    from mechanismRegistry import get_solution, mechanism_hash
+    from postProcessingMarksteinNumber import markstein_numbers, linear_mask, speedDefinitions
+
+    # base sweep, with its saved flames
+    run_case(case)
+    task = {key: case[key] for key in ['mechanism', 'fuel', 'phi', 'width',
+                                       'transport_model', 'T', 'p']}
+    task.update(seed = case['path'], method = extrema, factor = factor, reaction = None)
+    points = [point for point in SweepManifest(case['path']).points
+              if point['status'] == 'converged' and point.get('solution')]
+    # without the first and last flames, as the stretch stage
+    task['velocities'] = [point['u'] for point in points[1:-1]]
+    base = perturbed_points(task)
+
+    # only the points of the fit are solved again
+    data = pd.DataFrame(base['rows'])
+    deltaL = base['D_th']/base['Sl_o']
+    Ka = np.asarray(data['Kb'], dtype=float)*deltaL/base['Sl_o']
+    mask = linear_mask(Ka, data['Su_b'], threshold)
+    task['velocities'] = data['u'][mask].tolist()
+    base['rows'] = [row for row, fit in zip(base['rows'], mask) if fit]
+    if len(task['velocities']) < 2:
+        raise RuntimeError('{} points in the linear stretch range'.format(len(task['velocities'])))
+
+    gas = get_solution(case['mechanism'])
+    if reactions is None:
+        reactions = range(gas.n_reactions)
+    reactions = list(reactions)
+    fileName = os.path.join(case['path'], sensitivityFile)
+    key = dict(task, hash = mechanism_hash(case['mechanism']))
+    done = read_sensitivity(fileName, key)
+    tasks = [dict(task, reaction = i) for i in reactions if i not in done]
+    print('{} reactions, {} points, {} left to solve'.format(len(reactions),
+          len(task['velocities']), len(tasks)))
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=([case['mechanism']],)) as pool:
+        futures = [pool.submit(perturbed_points, task) for task in tasks]
+        for future in as_completed(futures):
+            try:
+                entry = future.result()
+            except Exception as error:
+                print('** Failed: {}'.format(error))
+                continue
+            done[entry['reaction']] = entry
+            with open(fileName, 'a') as f:
+                f.write(json.dumps(dict(entry, key = key)) + '\n')
+            print('{:4d}/{} reaction {:4d} in {:.1f} s{}'.format(
+                  len(done), len(reactions), entry['reaction'], entry['time'],
+                  ', failed at ' + ', '.join('{:.3f} m/s ({})'.format(f['u'], f['reason'])
+                                             for f in entry['failed'])
+                  if entry['failed'] else ''))
+
+    # Markstein numbers of the base and of every complete reaction, in one
+    # fit, on the same velocities
+    flagged = [done[i] for i in reactions
+               if i in done and not complete(done[i], task['velocities'])]
+    if flagged:
+        print('** {} reactions without all the perturbed flames, not fitted: {}'.format(
+              len(flagged), ' '.join(str(e['reaction']) for e in flagged)))
+    entries = [base] + [done[i] for i in reactions
+                        if i in done and complete(done[i], task['velocities'])]
+    results = [pd.DataFrame(entry['rows'], columns=base['rows'][0].keys()) for entry in entries]
+    fits = markstein_numbers(results, [e['D_th']/e['Sl_o'] for e in entries],
+                             [e['Sl_o'] for e in entries], threshold, method)
+
+    ranked = entries[1:] + flagged
+    table = pd.DataFrame({'reaction': [e['reaction'] for e in ranked],
+                          'equation': [gas.reaction(e['reaction']).equation
+                                       for e in ranked],
+                          'Sl_o': [e['Sl_o'] for e in ranked],
+                          'failed': [''] * (len(entries) - 1) +
+                                    ['; '.join('{:.3f} m/s: {}'.format(f['u'], f['reason'])
+                                               for f in e.get('failed', []))
+                                     or 'solved at other velocities than the base fit'
+                                     for e in flagged]})
+    for name, _, _ in speedDefinitions:
+        Ma = np.append(fits[name]['Ma'], np.full(len(flagged), np.nan))
+        table['Ma_' + name] = Ma[1:]
+        table['dMa_' + name] = (Ma[1:] - Ma[0])/np.log(factor)
+    table = table.sort_values('dMa_burnt', key=np.abs, ascending=False,
+                              na_position='last', kind='stable').reset_index(drop=True)
+    table.attrs['Ma'] = {name: float(fits[name]['Ma'][0]) for name, _, _ in speedDefinitions}
+    return table
+
+
+def main(argv = None):
+
+    parser = argparse.ArgumentParser(description='Sensitivity of the Markstein '
+                                     'numbers to the reaction rates')
+    parser.add_argument('--fuel', default='CH4')
+    parser.add_argument('--phi', type=float, default=1.)
+    parser.add_argument('--mechanism', default='chemicalMechanism/kee.xml')
+    parser.add_argument('--velocity', nargs=3, type=float, default=[1., 5., 10],
+                        metavar=('START', 'STOP', 'NUM'),
+                        help='inlet velocity range of the base sweep (m/s)')
+    parser.add_argument('--transport', default='Mix')
+    parser.add_argument('--T', type=float, default=300., help='reactants temperature (K)')
+    parser.add_argument('--p', type=float, default=1., help='pressure (atm)')
+    parser.add_argument('--width', type=float, default=0.025)
+    parser.add_argument('--results', default='./counterFlowResults',
+                        help='folder of the base sweep')
+    parser.add_argument('--reactions', nargs='+', type=int, default=None,
+                        help='indices of the perturbed reactions, all by default')
+    parser.add_argument('--factor', type=float, default=1.1,
+                        help='multiplier of the perturbed rates')
+    parser.add_argument('--threshold', type=float, default=10.,
+                        help='largest Karlovitz number of the linear fit')
+    parser.add_argument('--method', default='ols', choices=['ols', 'huber', 'theil-sen'])
+    parser.add_argument('--extrema', choices=['grid', 'spline'], default='spline',
+                        help='extrema of the profiles (see postProcessingFlameStretch)')
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--top', type=int, default=20, help='reactions shown')
+    parser.add_argument('--output', default='sensitivity.csv')
+    args = parser.parse_args(argv)
+
+    from sweepDriver import make_cases
+
+    u = np.linspace(args.velocity[0], args.velocity[1], int(args.velocity[2]))
+    case, = make_cases([args.fuel], [args.phi], u, [args.mechanism], args.results,
+                       width = args.width, transport_model = args.transport,
+                       T = args.T, p = args.p*101325., telemetry = None)
+    table = markstein_sensitivity(case, args.reactions, args.factor, args.threshold,
+                                  args.method, args.extrema, args.workers)
+    table.to_csv(args.output, index = False)
+    print('\nMa of the base mechanism: ' + ', '.join('{} {:.3f}'.format(name, Ma)
+                                                     for name, Ma in table.attrs['Ma'].items()))
+    pd.options.display.width = 200
+    print(table.head(args.top).to_string(index = False))
+    print('Sensitivities written: ' + args.output)
+
+
+if __name__=='__main__':
+    main()
@@ -0,0 +1,140 @@
+"""
+Reaction mechanisms of chemicalMechanism/ and their YAML conversion.
+
+The XML, CTI and CHEMKIN files are converted to YAML once, with the
+converters shipped with Cantera, and the result is cached in cachePath under
+a hash of the source files, so a mechanism is only converted again when its
+files (or the Cantera version) change. get_solution hands out one Solution
+per mechanism and process.
+
+Requires: cantera >= 2.5.0
+"""
+
+import os
+import hashlib
+
+cachePath = './mechanismCache/'
+
+# Source files of the mechanisms, by name
+mechanisms = {
+    'kee': {'source': 'chemicalMechanism/kee.xml'},
+    'Li': {'source': 'chemicalMechanism/Li.xml'},
+    'dmeSkelSandia': {'source': 'chemicalMechanism/dmeSkelSandia.xml'},
+    'mecNH3': {'source': 'chemicalMechanism/nh3mec/mecNH3.inp',
+               'thermo': 'chemicalMechanism/nh3mec/thermNH3.dat',
+               'transport': 'chemicalMechanism/nh3mec/transNH3.dat'},
+}
+
+# Solution objects of the process, by mechanism
+_solutions = {}
+
+
+def mechanism_entry(mechanism):
+    """
+    Source files of a mechanism given by name or by path. The CHEMKIN files
+    are expected next to the input file, as therm*.dat and trans*.dat.
+    """
+    if mechanism in mechanisms:
+        return mechanisms[mechanism]
+    for entry in mechanisms.values():
+        if os.path.abspath(entry['source']) == os.path.abspath(mechanism):
+            return entry
+
+    entry = {'source': mechanism}
+    if os.path.splitext(mechanism)[1] in ('.inp', '.ck', '.mech'):
+        folder = os.path.dirname(mechanism)
+        for fileName in sorted(os.listdir(folder or '.')):
+            if fileName.startswith('therm') and 'thermo' not in entry:
+                entry['thermo'] = os.path.join(folder, fileName)
+            elif fileName.startswith('tran') and 'transport' not in entry:
+                entry['transport'] = os.path.join(folder, fileName)
+    return entry
+
+
+def cantera_version():
+    """
+    Version of Cantera, read without importing it (post-processing stages)
+    """
+    try:
+        from importlib.metadata import version
+        return version('cantera')
+    except Exception:
+        import cantera as ct
+        return ct.__version__
+
+
+def source_hash(entry):
+    """
+    Hash of the source files and of the Cantera version
+    """
+    sha = hashlib.sha1(cantera_version().encode())
+    for key in ('source', 'thermo', 'transport'):
+        if key in entry:
+            with open(entry[key], 'rb') as f:
+                sha.update(f.read())
+    return sha.hexdigest()[:16]
+
+
+def mechanism_hash(mechanism):
+    """
+    Hash of the source files of a mechanism (name or path), to key results
+    computed with it
+    """
+    entry = mechanism_entry(mechanism)
+    if not os.path.isfile(entry['source']):
+        # Cantera data file, e.g. gri30.yaml
+        return hashlib.sha1((cantera_version() + entry['source']).encode()).hexdigest()[:16]
+    return source_hash(entry)
+
+
+def convert(entry, fileName):
+    """
+    Convert the source files of a mechanism to YAML
+    """
+    source = entry['source']
+    extension = os.path.splitext(source)[1]
+    if extension == '.xml':
+        from cantera import ctml2yaml
+        ctml2yaml.convert(source, fileName)
+    elif extension == '.cti':
+        from cantera import cti2yaml
+        cti2yaml.convert(source, fileName)
+    else:
+        from cantera import ck2yaml
+        convert_mech = getattr(ck2yaml, 'convert_mech', None) or ck2yaml.Parser.convert_mech
+        # thermNH3.dat repeats a few species, the first entry is kept
+        convert_mech(source, thermo_file=entry.get('thermo'),
+                     transport_file=entry.get('transport'), out_name=fileName,
+                     quiet=True, permissive=True)
+
+
+def mechanism_yaml(mechanism):
+    """
+    YAML file of a mechanism (name or path), converted on the first call
+    """
+    entry = mechanism_entry(mechanism)
+    source = entry['source']
+    if os.path.splitext(source)[1] in ('.yaml', '.yml'):
+        return source
+
+    stem = os.path.splitext(os.path.basename(source))[0]
+    fileName = os.path.join(cachePath, stem + '-' + source_hash(entry) + '.yaml')
+    if not os.path.isfile(fileName):
+        if not os.path.isdir(cachePath):
+            os.makedirs(cachePath, exist_ok=True)
+        print('Converting ' + source + ' to ' + fileName)
+        # another process may convert the same mechanism at the same time
+        tmpName = fileName + '.{}.tmp'.format(os.getpid())
+        convert(entry, tmpName)
+        os.replace(tmpName, fileName)
+    return fileName
+
+
+def get_solution(mechanism):
+    """
+    Solution object of the current process for the mechanism
+    """
+    import cantera as ct
+    if mechanism not in _solutions:
+        _solutions[mechanism] = ct.Solution(mechanism_yaml(mechanism))
+    return _solutions[mechanism]
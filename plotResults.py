@@ -0,0 +1,347 @@
+#!/usr/bin/env python3
+"""
+Figures of the flame stretch and Markstein number post-processing.
+
+The figures are drawn on a given matplotlib Figure, either the pyplot
+figures shown by the post-processing scripts, or one Agg figure reused to
+write the PNG/PDF files of many cases in batch (no display needed):
+
+    python plotResults.py stretchResults/ [other results folders] --format png pdf
+"""
+
+import numpy as np
+import pandas as pd
+import os
+import json
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+
+from profileStore import ProfileStore
+
+# Define fonts
+font = {'family': 'serif'}
+
+fontLegend3 = {'family': 'serif',
+        'weight': 'normal',
+        'size': 11,
+        }
+
+def set_fonts(rcParams):
+  # Define fonts of plots [Math symbols and expressions]
+  fonts1 = ["serif"]
+  fonts2 = ["stix","stixsans","cm"]
+  for font1,font2 in zip(fonts1,fonts2):
+      rcParams["font.family"] = font1
+      rcParams["mathtext.fontset"] = font2
+      rcParams["font.size"] = 11
+
+#----------------------------------------------------------
+# FLAME STRETCH
+
+def stretch_quantities(data, Ku_local, fuel = 'CH4', method = 'grid', plane = 'O2'):
+  """
+  Profiles shown in the flame stretch figures, with the reference plane and
+  the extrema (method) of the results (see postProcessingFlameStretch)
+  """
+  from StretchRate import ProfileFeatures, spline_extremum
+  from referencePlanes import reference_scalar
+
+  q = {}
+  features = ProfileFeatures(data['x'], data['velocity'], data['rho'], data)
+  x, velocity = features.x, features.velocity
+  # the reference plane defines the point to take the flame speed
+  ref_Scalar = reference_scalar(features, plane, fuel)
+  q['refPoint'] = refPoint = ref_Scalar.argmin()
+
+  q['Ku'] = Ku = features.velocityGradient
+
+  # S_mass = m(x)/rho_u
+  q['S_mass_u'] = data['rho']*data['velocity']/data['rho'][0]
+
+  # Characteristic Strain Rate = K
+  q['strainRatePoint'] = strainRatePoint = features.strainRatePoints[2]
+  q['x_ref'], q['x_K'], q['u_K'] = x[refPoint], x[strainRatePoint], velocity[strainRatePoint]
+  if method == 'spline':
+    q['x_ref'] = spline_extremum(x, ref_Scalar, refPoint, 'min')[0]
+    kind = 'min' if Ku[strainRatePoint] < 0 else 'max'
+    q['x_K'], spline = spline_extremum(x, velocity, strainRatePoint, kind, derivative = 1)
+    q['u_K'] = float(spline(q['x_K']))
+
+  # Characteristic Flame Speed Su
+  q['S_extrap'] = q['u_K'] - Ku_local*(x[strainRatePoint:] - q['x_K'])
+
+  # S_mass = m(x)/rho_b
+  q['S_mass_b'] = data['rho']*data['velocity']/data['rho'][data['rho'].size-1]
+
+  """ Kb = 1/rho*(grad(rho*u)) """
+  grad = np.gradient(data['rho'][refPoint:-1]*data['velocity'][refPoint:-1],data['x'][refPoint:-1])
+  q['Kb'] = np.array(-(1./(data['rho'][refPoint:-1]))*grad)
+  return q
+
+def draw_preheat_speed(fig, data, q, Su):
+  # PLOT STRETCH RATE AND FLAME SPEED AT PRE-HEAT ZONE
+  strainRatePoint = q['strainRatePoint']
+  ax = fig.add_subplot(111)
+  # Axial Velocity Plot
+  L1 = ax.plot(data['x'],q['S_mass_u'], 'magenta', lw=2, label=r'$m(x)/ \rho_u$')
+  L2 = ax.plot(data['x'], data['velocity'], 'r', lw=2, label=r'$u$')
+  L3 = ax.plot(data['x'][strainRatePoint:], q['S_extrap'], 'k', linestyle = '--',lw=3, label=r'$S_u\ extrapolation$')
+  ax.set_xlim(data['x'][0], data['x'][data['x'].size-1])
+
+  # Identify the point where the strain rate is calculated
+  ax.plot(q['x_K'], q['u_K'], 'gs')
+  ax.annotate('Strain-Rate point',
+               xy=(q['x_K'], q['u_K']),
+               xytext=(0.001, 0.1),
+               arrowprops={'arrowstyle': '->'})
+
+  # Identify the point where the strain rate is calculated
+  ax.plot(q['x_ref'], Su, 'gs')
+  ax.annotate('Su point',
+               xy=(q['x_ref'], Su),
+               xytext=(0.01, 0.5),
+               arrowprops={'arrowstyle': '->'})
+  ax.set_xlabel('x axis (m)')
+  ax.set_ylabel('Axial Velocity (m/s)')
+  ax2 = ax.twinx()
+  L4 = ax2.plot(data['x'], data['Qdot'], 'b', lw=2, label=r'$HRR$')
+  ax2.set_ylabel('HRR (Watt/m^3)')
+  ax2.axvline(x=q['x_ref'])
+  ax2.legend(L1+L2+L3+L4,[line.get_label() for line in L1+L2+L3+L4], \
+             loc='upper right',framealpha = 1,edgecolor='k',prop=fontLegend3)
+  fig.tight_layout()
+
+def draw_preheat_stretch(fig, data, q, Ku_local):
+  ax = fig.add_subplot(111)
+  # Axial Velocity Plot
+  L1 = ax.plot(data['x'], data['velocity'], 'r', lw=2,label=r'$u$')
+  ax.set_xlim(data['x'][0], data['x'][data['x'].size-1])
+  ax.set_xlabel('x axis (m)')
+  ax.set_ylabel('Axial Velocity (m/s)')
+  ax2 = ax.twinx()
+  L2 = ax2.plot(data['x'], -q['Ku'], 'b', lw=2,label=r'$K_u$')
+  ax2.set_ylabel('Stretch (s^-1)')
+  ax2.set_ylim([0,100])
+  # Identify the point where the strain rate is calculated
+  ax2.plot(q['x_K'], Ku_local, 'gs')
+  ax2.annotate('Strain-Rate point',
+               xy=(q['x_K'], Ku_local),
+               xytext=(0.001, 60),
+               arrowprops={'arrowstyle': '->'})
+  ax2.axvline(x=q['x_ref'])
+  ax2.legend(L1+L2,[line.get_label() for line in L1+L2], \
+             loc='upper right',framealpha = 1,edgecolor='k',prop=fontLegend3)
+  fig.tight_layout()
+
+def draw_reaction_speed(fig, data, q):
+  # PLOT STRETCH RATE AND FLAME SPEED AT REACTION ZONE
+  refPoint = q['refPoint']
+  ax = fig.add_subplot(111)
+  # Axial Velocity Plot
+  ax.set_title('Reaction zone')
+  L1 = ax.plot(data['x'],q['S_mass_b'], 'magenta', lw=2,label=r'$m(x)/\rho_b$')
+  L2 = ax.plot(data['x'], data['velocity'], 'r', lw=2,label=r'$u$')
+  L3 = ax.plot(data['x'][refPoint:],q['S_mass_b'][refPoint:], 'k', lw = 1.5,label=r'$S_b\ extrapolation$')
+  L4 = ax.plot(data['x'],data['rho']*data['velocity']/data['rho'][0], 'b',lw = 1.5,label=r'$S_u$')
+  ax.set_xlim(data['x'][0], data['x'][data['x'].size-1])
+  ax.set_xlabel('Distance (m)')
+  ax.set_ylabel('Axial Velocity (m/s)')
+  ax2 = ax.twinx()
+  ax2.set_ylabel('HRR (Watt/m^3)')
+  ax2.legend(L1+L2+L3+L4,[line.get_label() for line in L1+L2+L3+L4], \
+             loc='upper right',framealpha = 1,edgecolor='k',prop=fontLegend3)
+  fig.tight_layout()
+
+def draw_reaction_stretch(fig, data, q, Kb_local):
+  refPoint = q['refPoint']
+  ax = fig.add_subplot(111)
+  ax.set_title('Reaction zone')
+  L1 = ax.plot(data['x'], data['velocity'], 'r', lw=2,label=r'$u$')
+  ax.set_xlim(data['x'][0], data['x'][data['x'].size-1])
+  ax.set_xlabel('x axis (m)')
+  ax.set_ylabel('Axial Velocity (m/s)')
+  ax2 = ax.twinx()
+  L2 = ax2.plot(data['x'][refPoint:-1], q['Kb'], 'b', lw=2,label=r'$K_b$')
+  ax2.set_ylabel('Stretch (s^-1)')
+  # Identify the point where the strain rate is calculated
+  ax2.plot(q['x_ref'], Kb_local, 'gs')
+  ax2.annotate('Strain-Rate point',
+               xy=(q['x_ref'], Kb_local),
+               xytext=(0.001, 0.1),
+               arrowprops={'arrowstyle': '->'})
+  ax2.axvline(x=q['x_ref'])
+  ax2.legend(L1+L2,[line.get_label() for line in L1+L2],\
+             loc='upper right',framealpha = 1,edgecolor='k',prop=fontLegend3)
+  fig.tight_layout()
+
+def stretch_figures(data, Su, Ku_local, Kb_local, fuel = 'CH4', method = 'grid',
+                    planes = ('O2',)):
+  """
+  (name, size, draw function) of the flame stretch figures, at the first of
+  the reference planes of the results
+  """
+  q = stretch_quantities(data, Ku_local, fuel, method, planes[0])
+  return [('preHeatSpeed', (7,5), lambda fig: draw_preheat_speed(fig, data, q, Su)),
+          ('preHeatStretch', (7,5), lambda fig: draw_preheat_stretch(fig, data, q, Ku_local)),
+          ('reactionSpeed', (7,5), lambda fig: draw_reaction_speed(fig, data, q)),
+          ('reactionStretch', (7,5), lambda fig: draw_reaction_stretch(fig, data, q, Kb_local))]
+
+#----------------------------------------------------------
+# MARKSTEIN NUMBER
+
+def draw_markstein(fig, x, y, line, ylabel, xlabel, xlim = None):
+  ax = fig.add_subplot(111)
+  ax.scatter(x,y,s=6,color='k', lw =3)
+  if line is not None:
+    ax.plot(line[0],line[1],lw=2)
+  ax.set_ylabel(ylabel,fontsize=17, fontdict=font)
+  ax.set_xlabel(xlabel,fontsize=17, fontdict=font)
+  ax.set_ylim([0.,1.2])
+  if xlim is not None:
+    ax.set_xlim(xlim)
+  fig.tight_layout()
+  ax.grid(color='gray', linestyle='--',lw=.5)
+
+def markstein_figures(data, deltaL, Sl_o, burntgas, unburntgas, consSpeed):
+  """
+  (name, size, draw function) of the Markstein number figures
+  """
+  Ka = r'$\rm Ka$'
+  Sd = r'$\rm \tilde{S}_d/S^0_l$'
+  return [('marksteinBurnt', (6,5), lambda fig: draw_markstein(fig,
+              data['Kb']*deltaL/Sl_o, data['Su_b']/Sl_o, burntgas.marks_line(),
+              Sd, Ka, [0,1.2])),
+          ('stretchBurnt', (6,5), lambda fig: draw_markstein(fig,
+              data['Kb'], data['Su_b']/Sl_o, None,
+              Sd, r'$\rm Stretch\ rate\ (s^{-1})$')),
+          ('marksteinUnburnt', (6,5), lambda fig: draw_markstein(fig,
+              data['Ku']*deltaL/Sl_o, data['Su']/Sl_o, unburntgas.marks_line(),
+              r'$\rm {S}_u/S^0_l$', Ka, [0,1.1])),
+          ('marksteinConsumption', (6,5), lambda fig: draw_markstein(fig,
+              data['Kb']*deltaL/Sl_o, data['Sc']/Sl_o, consSpeed.marks_line(),
+              r'$\rm {S}_c/S^0_l$', Ka, [0,1.1]))]
+
+#----------------------------------------------------------
+# INTERACTIVE AND BATCH OUTPUT
+
+def show_figures(figures, perWindow = 2):
+  """
+  Show the figures with pyplot, perWindow at a time
+  """
+  import matplotlib.pyplot as plt
+  set_fonts(plt.rcParams)
+  for i, (name, size, draw) in enumerate(figures):
+    fig = plt.figure(i % perWindow + 1, figsize=size, facecolor='w')
+    draw(fig)
+    if (i + 1) % perWindow == 0 or i == len(figures) - 1:
+      plt.show()
+
+# Figure reused by all the plots of the process
+_figure = None
+
+def save_figures(figures, pathToSave, formats = ('png',)):
+  """
+  Write the figures as files with the Agg backend, on one reused figure
+  """
+  global _figure
+  import matplotlib
+  from matplotlib.figure import Figure
+  from matplotlib.backends.backend_agg import FigureCanvasAgg
+  if _figure is None:
+    set_fonts(matplotlib.rcParams)
+    _figure = Figure(facecolor='w')
+    FigureCanvasAgg(_figure)
+  if not os.path.isdir(pathToSave):
+    os.makedirs(pathToSave, exist_ok=True)
+  for name, size, draw in figures:
+    _figure.clf()
+    _figure.set_size_inches(size)
+    draw(_figure)
+    for extension in formats:
+      _figure.savefig(os.path.join(pathToSave, name + '.' + extension))
+
+def write_case(pathToSave, source, fuel, phi, mechanism, **conditions):
+  """
+  Save where the results of pathToSave come from, for the plotting stage,
+  with the conditions of the sweep (T, p, transport_model)
+  """
+  case = {'source': source, 'fuel': fuel, 'phi': phi, 'mechanism': mechanism}
+  case.update(conditions)
+  with open(os.path.join(pathToSave, 'case.json'), 'w') as f:
+    json.dump(case, f, indent=1)
+
+def case_conditions(case):
+  """ Conditions of the flame properties of a case (flamesProps.flame_props) """
+  return {'T': case.get('T', 300.), 'p': case.get('p', 101325.),
+          'transport_model': case.get('transport_model', 'Mix')}
+
+def read_case(pathToSave):
+  with open(os.path.join(pathToSave, 'case.json')) as f:
+    return json.load(f)
+
+def plot_case(pathToSave, formats = ('png',)):
+  """
+  Write the figures of one results folder (results.csv and case.json) in
+  pathToSave/figures
+  """
+  from postProcessingMarksteinNumber import markstein_fits
+  from flamesProps import flame_props
+
+  case = read_case(pathToSave)
+  results = pd.read_csv(os.path.join(pathToSave, 'results.csv'), index_col=None,
+                        dtype={'u': str})
+  figures = []
+
+  # Profile of the last result
+  uData = results['u'].iloc[-1]
+  if ProfileStore.exists(case['source']):
+    data = ProfileStore(case['source']).frame(uData)
+  else:
+    data = pd.read_csv(os.path.join(case['source'], uData), index_col=None)
+  last = results.iloc[-1]
+  figures += stretch_figures(data, last['Su'], last['Ku'], last['Kb'], case['fuel'],
+                             case.get('extrema', 'grid'), case.get('planes', ['O2']))
+
+  # no laminar flame is solved here, the Markstein stage computes them
+  props = flame_props(case['fuel'], case['phi'], case['mechanism'],
+                      interpolate = True, compute = False, **case_conditions(case))
+  if props is None:
+    print('No flame properties for {} phi={}, no Markstein figures'.format(
+          case['fuel'], case['phi']))
+  else:
+    deltaL = props['D_th']/props['Sl_o']
+    fits = markstein_fits(results, deltaL, props['Sl_o'])
+    figures += markstein_figures(results, deltaL, props['Sl_o'], *fits)
+
+  save_figures(figures, os.path.join(pathToSave, 'figures'), formats)
+  return pathToSave
+
+def plot_cases(folders, formats = ('png',), workers = None):
+  """
+  Write the figures of many results folders in parallel
+  """
+  with ProcessPoolExecutor(max_workers=workers) as pool:
+    futures = [pool.submit(plot_case, results, tuple(formats))
+               for results in folders]
+    for future in futures:
+      try:
+        print('Figures written: ' + future.result())
+      except Exception as error:
+        print('** Failed: {}'.format(error))
+
+def main(argv = None):
+
+  parser = argparse.ArgumentParser(description='Write the figures of the '
+                                   'post-processing results (headless)')
+  parser.add_argument('results', nargs='+',
+                      help='results folders (results.csv and case.json)')
+  parser.add_argument('--format', nargs='+', default=['png'],
+                      help='file formats, e.g. png pdf')
+  parser.add_argument('--workers', type=int, default=None)
+  args = parser.parse_args(argv)
+
+  plot_cases(args.results, args.format, args.workers)
+
+
+if __name__=='__main__':
+  main()
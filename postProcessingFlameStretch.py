@@ -1,229 +1,310 @@
 #!/usr/bin/env python3
 
 import numpy as np
-import matplotlib.pyplot as plt
 import pandas as pd
 import os
-import pdb
 import time
-
-from StretchRate import*
-
-def main():
-
-  phi = 1.
-  path = './counterFlowResults/CH4/' + '{:.2f}'.format(phi) + '/'
+import argparse
+
+from StretchRate import FlameSpeeds, ProfileFeatures, stretch_batch
+from referencePlanes import plane_speeds, plane_columns, plane_label
+from profileStore import ProfileStore
+from plotResults import write_case
+
+resultColumns = ['Su', 'Ku', 'Su_b', 'Kb', 'Sc']
+planeColumns = ['Su', 'Ku', 'Su_b', 'Kb']
+
+def result_columns(planes = ('O2',)):
+  """
+  Columns of the results: those of the first reference plane, then the
+  speeds and strain rates of the other planes suffixed by their label
+  """
+  return resultColumns + [column + '_' + plane_label(plane)
+                          for plane in planes[1:] for column in planeColumns]
+
+def profile_velocity(fileName):
+  """
+  Inlet velocity of a csv profile file, NaN for the other files
+  """
+  try:
+    return float(fileName)
+  except ValueError:
+    return np.nan
+
+def profile_signatures(path, settle = 0.):
+  """
+  Signature of every profile of a case: offset and size in the binary store,
+  or modification time and size of the csv files. Files modified less than
+  settle seconds ago are left for later, as they may still be written.
+  """
+  if ProfileStore.exists(path):
+    store = ProfileStore(path)
+    signatures = {}
+    for uData in store.labels:
+      info = store.info(uData)
+      signatures[uData] = '{}:{}'.format(info['offset'], info['size'])
+    return store, signatures
+
+  signatures = {}
+  now = time.time()
+  for uData in sorted(os.listdir(path), key=profile_velocity):
+    if np.isnan(profile_velocity(uData)):
+      # sweep manifest and saved flames
+      continue
+    stat = os.stat(os.path.join(path, uData))
+    if now - stat.st_mtime < settle:
+      continue
+    signatures[uData] = '{}:{}'.format(stat.st_mtime_ns, stat.st_size)
+  return None, signatures
+
+def stretch_profile(data, fuel = 'CH4', method = 'grid', planes = ('O2',),
+                    verbose = True):
+  """
+  Flame speeds and strain rates of one profile for every reference plane
+  (see referencePlanes), with the extrema taken at the grid points or on
+  local splines (method, see StretchRate.PreHeat). Printed if verbose.
+  """
+  features = ProfileFeatures(data['x'], data['velocity'], data['rho'], data)
+  speeds = plane_speeds(features, planes, fuel, method)
+
+  values = {}
+  for i, plane in enumerate(planes):
+    suffix = '' if i == 0 else '_' + plane_label(plane)
+    title = '' if len(planes) == 1 else ' (' + plane + ')'
+    if verbose:
+      print('** Pre-heat zone' + title)
+      print('Flame speed: {:.3f}'.format(speeds[plane]['Su']))
+      print('Straint rate: {:.2f}'.format(speeds[plane]['Ku']))
+      print('\n')
+
+      print('** Reaction zone' + title)
+      print('Flame speed: {:.3f}'.format(speeds[plane]['Su_b']))
+      print('Straint rate: {:.2f}\n'.format(speeds[plane]['Kb']))
+    for column in planeColumns:
+      values[column + suffix] = speeds[plane][column]
+
+  fs = FlameSpeeds(data['x'],data['rho'],data[fuel],data['wdot' + fuel])
+  Sc = fs.consumption_speed()
+
+  if verbose:
+    print('** Global')
+    print('Flame consumption speed: {:.3f}\n'.format(Sc))
+
+  values['Sc'] = Sc
+  return values
+
+def stretch_flame(oppFlame, gas, fuel = 'CH4', method = 'grid', planes = ('O2',),
+                  layout = None, verbose = False):
+  """
+  Flame speeds and strain rates of a solved flame, from its arrays, without
+  writing its profile. layout is that of profileWriter.profile_layout.
+  """
+  from profileWriter import profile_layout, profile_snapshot, snapshot_columns
+
+  if layout is None:
+    layout = profile_layout(gas, fuel)
+  data = snapshot_columns(profile_snapshot(oppFlame, gas, layout))
+  return stretch_profile(data, fuel, method, planes, verbose)
+
+def stretch_store(store, labels, fuel = 'CH4'):
+  """
+  Flame speeds and strain rates of many profiles of a ProfileStore in one
+  StretchRate.stretch_batch call: extrema at the grid points and the O2
+  reference plane only, the default of update_results. NaN where the
+  profile does not have the expected shape.
+  """
+  values, offsets = store.ragged(labels, ['wdotO2', 'x', 'velocity', 'rho', fuel,
+                                          'wdot' + fuel])
+  results = stretch_batch(values['wdotO2'], values['x'], values['velocity'],
+                          values['rho'], values[fuel], values['wdot' + fuel],
+                          offsets = offsets)
+  return [{'Su': r['Su'], 'Ku': r['Ku'], 'Su_b': r['Sl_d'], 'Kb': r['Kb'],
+           'Sc': r['Sc']} for r in results]
+
+def update_results(path, pathToSave, fuel = 'CH4', dropEnds = True, settle = 0.,
+                   method = 'grid', planes = ('O2',)):
+  """
+  Incremental post-processing of a case.
+  The results of every profile are kept with its signature in
+  results.cache.csv, so only new or changed profiles are read and processed.
+  The extraction method and the reference planes are part of the signature.
+  The profiles of a binary store are processed in one batch (stretch_store)
+  with the grid extrema and the O2 plane, one by one otherwise.
+  results.csv is then rewritten from the cache, without the first and last
+  profiles of the sweep if dropEnds.
+  """
+  cacheFile = os.path.join(pathToSave, 'results.cache.csv')
+  if os.path.isfile(cacheFile):
+    cache = pd.read_csv(cacheFile, index_col=None,
+                        dtype={'source': str, 'u': str, 'signature': str})
+  else:
+    cache = pd.DataFrame(columns=['source', 'u', 'signature'] + resultColumns)
+
+  planes = list(planes)
+  # with or without a trailing separator
+  source = os.path.normpath(path)
+  columns = result_columns(planes)
+  store, signatures = profile_signatures(path, settle)
+  options = ([] if method == 'grid' else [method]) + ([] if planes == ['O2'] else planes)
+  if options:
+    signatures = {uData: ':'.join([signature] + options) for uData, signature in signatures.items()}
+  case = cache[cache['source'] == source]
+  known = dict(zip(case['u'], case['signature']))
+  uDatas = [uData for uData in signatures if known.get(uData) != signatures[uData]]
+
+  # Only the columns used to compute the speeds are read
+  profileColumns = ['x', 'rho', 'velocity', fuel, 'wdot' + fuel]
+  profileColumns += [c for c in plane_columns(planes, fuel) if c not in profileColumns]
+  rows = []
+  if store is not None and method == 'grid' and planes == ['O2'] and uDatas:
+    for uData, values in zip(uDatas, stretch_store(store, uDatas, fuel)):
+      row = {'source': source, 'u': uData, 'signature': signatures[uData]}
+      row.update(values)
+      rows.append(row)
+    uDatas = []
+  for uData in uDatas:
+    try:
+      if store is None:
+        data = pd.read_csv(os.path.join(path, uData), index_col=None, usecols=profileColumns)
+      else:
+        data = store.frame(uData, profileColumns)
+    except (pd.errors.EmptyDataError, pd.errors.ParserError):
+      # csv file of a running sweep, read it next time
+      print('Skipping incomplete profile: ' + uData)
+      continue
+
+    try:
+      values = stretch_profile(data, fuel, method, planes)
+    except ValueError as error:
+      print('No flame speed for profile ' + uData + ': ' + str(error))
+      values = dict.fromkeys(columns, np.nan)
+    row = {'source': source, 'u': uData, 'signature': signatures[uData]}
+    row.update(values)
+    rows.append(row)
+
+  # Merge: drop the old results of the recomputed and removed profiles
+  processed = set(row['u'] for row in rows)
+  keep = (cache['source'] != source) | (cache['u'].isin(signatures) & ~cache['u'].isin(processed))
+  if rows:
+    # the columns of new planes are added to the cache
+    cache = pd.concat([cache[keep], pd.DataFrame(rows)], ignore_index=True)
+  else:
+    cache = cache[keep]
+  cache = cache.astype(dict.fromkeys(cache.columns.drop(['source', 'u', 'signature']), float))
+  cache.to_csv(cacheFile, index = False)
+  print('{} new or changed profiles, {} in the case'.format(len(rows), len(signatures)))
+
+  case = cache[cache['source'] == source]
+  case = case.iloc[np.argsort(case['u'].astype(float).values)]
+  if dropEnds and len(case):
+    print('First and last profiles left out ({} of {} kept), see --keep-ends'.format(
+          max(len(case) - 2, 0), len(case)))
+    case = case.iloc[1:-1]
+
+  df = case[['u'] + columns]
+  pd.options.display.float_format = '{:.6f}'.format
+  df.to_csv(os.path.join(pathToSave, 'results.csv'), index = False)
+  return df
+
+def watch(path, pathToSave, fuel = 'CH4', dropEnds = True, interval = 10.,
+          method = 'grid', planes = ('O2',)):
+  """
+  Follow a case folder written by a running sweep
+  """
+  print('Watching ' + path + ' (Ctrl-C to stop)')
+  try:
+    while True:
+      # files modified in the last interval may be incomplete
+      update_results(path, pathToSave, fuel, dropEnds, interval, method, planes)
+      time.sleep(interval)
+  except KeyboardInterrupt:
+    update_results(path, pathToSave, fuel, dropEnds, 0., method, planes)
+
+def run_stretch(fuel = 'CH4', phi = 1., path = None,
+                pathToSave = './stretchResults/', mechanism = None,
+                dropEnds = True, watchCase = False, interval = 10., plot = True,
+                method = 'grid', planes = ('O2',)):
+  """
+  Flame speeds and stretch rates of one case, in pathToSave/results.csv.
+  path defaults to the sweep folder of fuel and phi, mechanism to the one of
+  the sweep. The figures of the last flame are shown if plot. method 'spline'
+  locates the extrema on local splines, for coarse solution grids. The
+  first of the reference planes gives the Su, Ku, Su_b and Kb columns.
+  """
+  if path is None:
+    path = './counterFlowResults/' + fuel + '/' + '{:.2f}'.format(phi) + '/'
   print('Data source: ' + path)
-  pathToSave = './stretchResults/'
   if not os.path.isdir(pathToSave):
       os.makedirs(pathToSave)
       print("create folder : ", pathToSave)
   else:
       print(pathToSave, "folder already exists.")
   print('Path to Save: ' + pathToSave) 
-  time.sleep(6) 
-  
-  uDatas = os.listdir(path)
-  uDatas = sorted(uDatas, key=float)
-
-  ulist = []
-  Sulist = []
-  Kulist = []
-  Su_blist = []
-  Kblist = []
-  Sclist = []
-
-  for uData in uDatas[1:-1]:  
-
-    data = pd.read_csv( path + uData ,index_col=None)  
-
-    # wdotO2 defines the point to take the flame speed
-    refPoint = data['wdotO2'].argmin()
-
-    Ku = np.gradient(data['velocity'],data['x'])
-    maxStrLocation = abs(Ku).argmax()
-    minVelocityPoint = data['velocity'][:maxStrLocation].argmin()
 
-    # S_mass = m(x)/rho_u
-    S_mass_u = data['rho']*data['velocity']/data['rho'][0]
-
-    # Characteristic Strain Rate = K
-    strainRatePoint = abs(Ku[:minVelocityPoint]).argmax()
-
-    ph = PreHeat(data['wdotO2'],data['x'],data['velocity'],data['rho'])
-    Su = ph.flame_speed_u()
-    Ku_local =  ph.strain_rate_u()
-
-    # Characteristic Flame Speed Su
-    S_extrap = data['velocity'][strainRatePoint] - Ku_local*(data['x'][strainRatePoint:]-data['x'][strainRatePoint])
-
-    print('** Pre-heat zone')
-    print('Flame speed: {:.3f}'.format(Su))
-    print('Straint rate: {:.2f}'.format(Ku_local))
-    print('\n')
-
-    # S_mass = m(x)/rho_b
-    S_mass_b = data['rho']*data['velocity']/data['rho'][data['rho'].size-1]
-
-    """ Kb = 1/rho*(grad(rho*u)) """
-    grad = np.gradient(data['rho'][refPoint:-1]*data['velocity'][refPoint:-1],data['x'][refPoint:-1])
-    Kb = np.array(-(1./(data['rho'][refPoint:-1]))*grad)
-
-    rz = Reaction(data['wdotO2'],data['x'],data['velocity'],data['rho'])
-    Sl_d = rz.flame_speed_b()
-    Kb_local =  rz.strain_rate_b()
-
-    print('** Reaction zone')
-    print('Flame speed: {:.3f}'.format(Sl_d))
-    print('Straint rate: {:.2f}\n'.format(Kb_local))
-
-    fs = FlameSpeeds(data['x'],data['rho'],data['CH4'],data['wdotCH4'])
-    Sc = fs.consumption_speed()
-    
-    print('** Global')
-    print('Flame consumption speed: {:.3f}\n'.format(Sc))           
-
-    ulist.append(uData)
-    Sulist.append(Su)
-    Kulist.append(Ku_local)
-    Su_blist.append(Sl_d)
-    Kblist.append(Kb_local)
-    Sclist.append(Sc)
-
-
-  df = pd.DataFrame()
-  pd.options.display.float_format = '{:.6f}'.format  
-  df['u'] = ulist
-  df['Su'] = Sulist
-  df['Ku'] = Kulist
-  df['Su_b'] = Su_blist
-  df['Kb'] = Kblist
-  df['Sc'] = Sclist
-  df.to_csv( pathToSave + 'results.csv', index = False)
-
-  #--------------------------------------------------
-  # PLOTS
-
-  # Define fonts
-  font = {'family': 'serif'}
-
-  fontLegend = {'family': 'serif',
-          'weight': 'normal',
-          'size': 14,
-          }
-
-  fontLegend2 = {'family': 'serif',
-          'weight': 'normal',
-          'size': 14,
-          }
-
-  fontLegend3 = {'family': 'serif',
-          'weight': 'normal',
-          'size': 11,
-          }
-  #----------------------------------------------------------------------
-  # Define fonts of plots [Math symbols and expressions]
-  fonts1 = ["serif"]
-  fonts2 = ["stix","stixsans","cm"]
-  for font1,font2 in zip(fonts1,fonts2):
-      plt.rcParams["font.family"] = font1
-      plt.rcParams["mathtext.fontset"] = font2
-      plt.rcParams["font.size"] = 11
-
-  #----------------------------------------------------------
-  # PLOT STRETCH RATE AND FLAME SPEED AT PRE-HEAT ZONE
-  fig = plt.figure(1,figsize=(7,5),facecolor='w')
-  # Axial Velocity Plot
-  L1 = plt.plot(data['x'],S_mass_u, 'magenta', lw=2, label=r'$m(x)/ \rho_u$')
-  L2 = plt.plot(data['x'], data['velocity'], 'r', lw=2, label=r'$u$')
-  L3 = plt.plot(data['x'][strainRatePoint:], S_extrap, 'k', linestyle = '--',lw=3, label=r'$S_u\ extrapolation$')
-  plt.xlim(data['x'][0], data['x'][data['x'].size-1])
-
-  # Identify the point where the strain rate is calculated
-  plt.plot(data['x'][strainRatePoint], data['velocity'][strainRatePoint], 'gs')
-  plt.annotate('Strain-Rate point',
-               xy=(data['x'][strainRatePoint],
-                   data['velocity'][strainRatePoint]),
-               xytext=(0.001, 0.1),
-               arrowprops={'arrowstyle': '->'})
-
-
-  # Identify the point where the strain rate is calculated
-  plt.plot(data['x'][refPoint],Su , 'gs')
-  plt.annotate('Su point',
-               xy=(data['x'][refPoint],Su),
-               xytext=(0.01, 0.5),
-               arrowprops={'arrowstyle': '->'})
-  plt.xlabel('x axis (m)')
-  plt.ylabel('Axial Velocity (m/s)')
-  plt.twinx()
-  L4 = plt.plot(data['x'], data['Qdot'], 'b', lw=2, label=r'$HRR$')
-  plt.ylabel('HRR (Watt/m^3)')
-  plt.axvline(x=data['x'][refPoint])
-  plt.legend(L1+L2+L3+L4,[line.get_label() for line in L1+L2+L3+L4], \
-             loc='upper right',framealpha = 1,edgecolor='k',prop=fontLegend3) 
-  plt.tight_layout()
-
-  fig = plt.figure(2,figsize=(7,5),facecolor='w')
-  # Axial Velocity Plot
-  L1 = plt.plot(data['x'], data['velocity'], 'r', lw=2,label=r'$u$')
-  plt.xlim(data['x'][0], data['x'][data['x'].size-1])
-  plt.xlabel('x axis (m)')
-  plt.ylabel('Axial Velocity (m/s)')
-  plt.twinx()
-  L2 = plt.plot(data['x'], -Ku, 'b', lw=2,label=r'$K_u$')
-  plt.ylabel('Stretch (s^-1)')
-  plt.ylim([0,100])
-  # Identify the point where the strain rate is calculated
-  plt.plot(data['x'][strainRatePoint], Ku_local, 'gs')
-  plt.annotate('Strain-Rate point',
-               xy=(data['x'][strainRatePoint],Ku_local),
-               xytext=(0.001, 60),
-               arrowprops={'arrowstyle': '->'})
-  plt.axvline(x=data['x'][refPoint])
-  plt.legend(L1+L2,[line.get_label() for line in L1+L2], \
-             loc='upper right',framealpha = 1,edgecolor='k',prop=fontLegend3) 
-  plt.tight_layout()
-  plt.show()
-
-  # PLOT STRETCH RATE AND FLAME SPEED AT REACTION ZONE
-  fig = plt.figure(1,figsize=(7,5),facecolor='w')
-  # Axial Velocity Plot
-  plt.title('Reaction zone')
-  L1 = plt.plot(data['x'],S_mass_b, 'magenta', lw=2,label=r'$m(x)/\rho_b$')
-  L2 = plt.plot(data['x'], data['velocity'], 'r', lw=2,label=r'$u$')
-  L3 = plt.plot(data['x'][refPoint:],S_mass_b[refPoint:], 'k', lw = 1.5,label=r'$S_b\ extrapolation$')
-  L4 = plt.plot(data['x'],data['rho']*data['velocity']/data['rho'][0], 'b',lw = 1.5,label=r'$S_u$')
-  plt.xlim(data['x'][0], data['x'][data['x'].size-1])
-  plt.xlabel('Distance (m)')
-  plt.ylabel('Axial Velocity (m/s)')
-  plt.twinx()
-  plt.ylabel('HRR (Watt/m^3)')
-  plt.legend(L1+L2+L3+L4,[line.get_label() for line in L1+L2+L3+L4], \
-             loc='upper right',framealpha = 1,edgecolor='k',prop=fontLegend3) 
-  plt.tight_layout()
-
-  fig = plt.figure(2,figsize=(7,5),facecolor='w')
-  plt.title('Reaction zone')
-  L1 = plt.plot(data['x'], data['velocity'], 'r', lw=2,label=r'$u$')
-  plt.xlim(data['x'][0], data['x'][data['x'].size-1])
-  plt.xlabel('x axis (m)')
-  plt.ylabel('Axial Velocity (m/s)')
-  plt.twinx()
-  L2 = plt.plot(data['x'][refPoint:-1], Kb, 'b', lw=2,label=r'$K_b$')
-  plt.ylabel('Stretch (s^-1)')
-  # Identify the point where the strain rate is calculated
-  plt.plot(data['x'][refPoint], Kb_local, 'gs')
-  plt.annotate('Strain-Rate point',
-               xy=(data['x'][refPoint],
-                   Kb_local),
-               xytext=(0.001, 0.1),
-               arrowprops={'arrowstyle': '->'})
-  plt.axvline(x=data['x'][refPoint])
-  plt.legend(L1+L2,[line.get_label() for line in L1+L2],\
-             loc='upper right',framealpha = 1,edgecolor='k',prop=fontLegend3) 
-  plt.tight_layout()
-  plt.show()
+  mec = mechanism or 'chemicalMechanism/kee.xml'
+  conditions = {}
+  if ProfileStore.exists(path):
+    run = ProfileStore(path).run
+    if mechanism is None:
+      mec = run.get('mechanism', mec)
+    # T, p and transport model of the sweep, for the flame properties
+    conditions = {key: run[key] for key in ['T', 'p', 'transport_model'] if key in run}
+  write_case(pathToSave, path, fuel, phi, mec, extrema = method,
+             planes = list(planes), **conditions)
+  if watchCase:
+    watch(path, pathToSave, fuel, dropEnds, interval, method, planes)
+    return
+  results = update_results(path, pathToSave, fuel, dropEnds, 0., method, planes)
+  if results.empty:
+    print('No flame to plot')
+    return results
+
+  if not plot:
+    return results
+
+  # Profile of the last result, shown in the plots
+  uData = results['u'].iloc[-1]
+  if ProfileStore.exists(path):
+    data = ProfileStore(path).frame(uData)
+  else:
+    data = pd.read_csv(os.path.join(path, uData), index_col=None)
+
+  last = results.iloc[-1]
+  from plotResults import show_figures, stretch_figures
+  show_figures(stretch_figures(data, last['Su'], last['Ku'], last['Kb'], fuel,
+                               method, planes))
+  return results
+
+def main(argv = None):
+
+  parser = argparse.ArgumentParser(description='Flame speeds and stretch rates '
+                                   'of the counter-flow flames')
+  parser.add_argument('--fuel', default='CH4')
+  parser.add_argument('--phi', type=float, default=1.)
+  parser.add_argument('--source', default=None,
+                      help='sweep folder, ./counterFlowResults/FUEL/PHI/ by default')
+  parser.add_argument('--results', default='./stretchResults/',
+                      help='folder of results.csv')
+  parser.add_argument('--watch', action='store_true',
+                      help='follow the results folder of a running sweep')
+  parser.add_argument('--interval', type=float, default=10.,
+                      help='polling interval of --watch (s)')
+  parser.add_argument('--no-plot', action='store_true',
+                      help='only compute, without figures (see plotResults.py)')
+  parser.add_argument('--extrema', choices=['grid', 'spline'], default='grid',
+                      help='extrema of the profiles at the grid points or on '
+                      'local cubic splines (resolution independent)')
+  parser.add_argument('--planes', nargs='+', default=['O2'],
+                      help='reference planes: O2, fuel, hrr, T:<K>, c:<level> '
+                      '(the first one gives the Su, Ku, Su_b and Kb columns)')
+  parser.add_argument('--keep-ends', action='store_true',
+                      help='keep the first and last flames of the sweep, left '
+                      'out of the results by default')
+  args = parser.parse_args(argv)
+
+  run_stretch(args.fuel, args.phi, args.source, args.results, None, not args.keep_ends,
+              args.watch, args.interval, not args.no_plot, args.extrema,
+              args.planes)
 
 
 if __name__=='__main__':
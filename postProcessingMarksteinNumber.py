@@ -1,12 +1,161 @@
 #!/usr/bin/env python3
 import numpy as np
-import matplotlib.pyplot as plt
 import pandas as pd
 import os
-from scipy import interpolate
-import pdb
+import argparse
+
+from flamesProps import flame_props
+
+# Result of one linear fit S/Sl_o = intercept - Ma*Ka, with the confidence
+# intervals of Ma and of the intercept
+fitDtype = np.dtype([('Ma', 'f8'), ('intercept', 'f8'), ('rms', 'f8'),
+                     ('Ma_low', 'f8'), ('Ma_high', 'f8'),
+                     ('intercept_low', 'f8'), ('intercept_high', 'f8'),
+                     ('points', 'i8')])
+
+# Speed definitions: name, stretch rate and flame speed of results.csv
+speedDefinitions = [('burnt', 'Kb', 'Su_b'),
+                    ('unburnt', 'Ku', 'Su'),
+                    ('consumption', 'Kb', 'Sc')]
+
+def linear_mask(Ka, S, threshold = 10):
+  """
+  Points of the linear stretch range, along the last axis: every point
+  before the first Ka above threshold, without the NaN values (flames
+  without a speed, padding)
+  """
+  Ka = np.asarray(Ka, dtype=float)
+  S = np.asarray(S, dtype=float)
+  return (np.cumsum(Ka > threshold, axis=-1) == 0) & np.isfinite(Ka) & np.isfinite(S)
+
+def _weighted_lines(x, y, w):
+  # Weighted least squares of all the fits at once, w is 0 out of the mask
+  sw = w.sum(-1)
+  xm = (w*x).sum(-1)/sw
+  ym = (w*y).sum(-1)/sw
+  dx = x - xm[..., None]
+  Sxx = (w*dx**2).sum(-1)
+  slope = (w*dx*(y - ym[..., None])).sum(-1)/Sxx
+  return slope, ym - slope*xm, sw, xm, Sxx
+
+def _theil_sen(x, y, mask, z):
+  # Median of the slopes of all the pairs of points, with the rank based
+  # confidence interval of Sen (1968)
+  n = x.shape[-1]
+  i, j = np.triu_indices(n, 1)
+  dx = x[..., j] - x[..., i]
+  valid = mask[..., i] & mask[..., j] & (dx != 0)
+  slopes = np.where(valid, (y[..., j] - y[..., i])/np.where(valid, dx, 1.), np.nan)
+  slope = np.nanmedian(slopes, axis=-1)
+  intercept = np.nanmedian(np.where(mask, y - slope[..., None]*x, np.nan), axis=-1)
+
+  pairs = valid.sum(-1)
+  points = mask.sum(-1)
+  sigma = np.sqrt(points*(points - 1)*(2*points + 5)/18.)
+  high = np.clip(np.round((pairs + z*sigma)/2.).astype(int), 0, np.maximum(pairs - 1, 0))
+  low = np.clip(np.round((pairs - z*sigma)/2.).astype(int) - 1, 0, np.maximum(pairs - 1, 0))
+  slopes = np.sort(slopes, axis=-1)
+  bounds = (np.take_along_axis(slopes, low[..., None], -1)[..., 0],
+            np.take_along_axis(slopes, high[..., None], -1)[..., 0])
+  return slope, intercept, bounds
+
+def linear_fits(Ka, S, threshold = 10, method = 'ols', confidence = 0.95,
+                mask = None):
+  """
+  Markstein numbers of many fits in one call.
+  Ka and S hold one fit along the last axis (padded with NaN), e.g. of shape
+  (definitions, cases, points). Returns a fitDtype array of shape
+  Ka.shape[:-1].
+  method: 'ols' least squares, 'huber' least squares with Huber weights
+  (IRLS), 'theil-sen' median of the pairwise slopes.
+  """
+  # scipy takes longer to import than the fits
+  from scipy import stats
+
+  Ka = np.asarray(Ka, dtype=float)
+  S = np.asarray(S, dtype=float)
+  if mask is None:
+    mask = linear_mask(Ka, S, threshold)
+  x = np.where(mask, Ka, 0.)
+  y = np.where(mask, S, 0.)
+  points = mask.sum(-1)
+  fit = np.zeros(Ka.shape[:-1], dtype=fitDtype)
+
+  with np.errstate(invalid='ignore', divide='ignore'):
+    w = mask.astype(float)
+    slope, intercept, sw, xm, Sxx = _weighted_lines(x, y, w)
+    if method == 'huber':
+      # scale of the residuals from their median absolute deviation
+      for i in range(50):
+        r = np.where(mask, y - intercept[..., None] - slope[..., None]*x, np.nan)
+        scale = 1.4826*np.nanmedian(np.abs(r), axis=-1)
+        scale = np.where(scale > 0, scale, np.nan)
+        u = np.abs(r)/(1.345*scale[..., None])
+        w = np.where(mask, np.where(u > 1, 1./np.where(u > 1, u, 1.), 1.), 0.)
+        previous = slope
+        slope, intercept, sw, xm, Sxx = _weighted_lines(x, y, w)
+        if np.all((np.abs(slope - previous) <= 1e-10*np.abs(slope)) | np.isnan(slope)):
+          break
+    elif method != 'ols' and method != 'theil-sen':
+      raise ValueError('Unknown fitting method: ' + str(method))
+
+    if method == 'theil-sen':
+      z = stats.norm.ppf(0.5 + confidence/2.)
+      slope, intercept, (slopeLow, slopeHigh) = _theil_sen(x, y, mask, z)
+      # the line goes through the mean point within the slope interval
+      xm = x.sum(-1)/points
+      interceptLow = intercept - (slopeHigh - slope)*xm
+      interceptHigh = intercept + (slope - slopeLow)*xm
+
+    r = np.where(mask, y - intercept[..., None] - slope[..., None]*x, 0.)
+    fit['rms'] = np.sqrt((r**2).sum(-1)/points)
+
+    if method != 'theil-sen':
+      # standard errors of the (weighted) least squares
+      t = stats.t.ppf(0.5 + confidence/2., points - 2)
+      s2 = (w*r**2).sum(-1)/(points - 2)
+      dSlope = t*np.sqrt(s2/Sxx)
+      dIntercept = t*np.sqrt(s2*(1./sw + xm**2/Sxx))
+      slopeLow, slopeHigh = slope - dSlope, slope + dSlope
+      interceptLow, interceptHigh = intercept - dIntercept, intercept + dIntercept
+
+  fit['Ma'] = -slope
+  fit['intercept'] = intercept
+  fit['Ma_low'] = -slopeHigh
+  fit['Ma_high'] = -slopeLow
+  fit['intercept_low'] = np.minimum(interceptLow, interceptHigh)
+  fit['intercept_high'] = np.maximum(interceptLow, interceptHigh)
+  fit['points'] = points
+  return fit
+
+def markstein_numbers(results, deltaL, Sl_o, threshold = 10, method = 'ols',
+                      confidence = 0.95):
+  """
+  Markstein numbers of the three speed definitions of many cases, in one
+  fit. results is a list of results.csv tables, deltaL and Sl_o are given
+  by case (or one value for all).
+  Returns an array of shape (cases,) with the fields burnt, unburnt and
+  consumption, each a fitDtype record, e.g. fits['burnt']['Ma'].
+  """
+  cases = len(results)
+  deltaL = np.broadcast_to(np.asarray(deltaL, dtype=float), (cases,))
+  Sl_o = np.broadcast_to(np.asarray(Sl_o, dtype=float), (cases,))
+  size = max([len(data) for data in results] + [1])
+
+  # (definition, case, point), padded with NaN
+  Ka = np.full((len(speedDefinitions), cases, size), np.nan)
+  S = np.full((len(speedDefinitions), cases, size), np.nan)
+  for i, (name, stretch, speed) in enumerate(speedDefinitions):
+    for j, data in enumerate(results):
+      Ka[i, j, :len(data)] = np.asarray(data[stretch], dtype=float)*deltaL[j]/Sl_o[j]
+      S[i, j, :len(data)] = np.asarray(data[speed], dtype=float)/Sl_o[j]
+  fit = linear_fits(Ka, S, threshold, method, confidence)
+
+  fits = np.zeros(cases, dtype=[(name, fitDtype) for name, _, _ in speedDefinitions])
+  for i, (name, _, _) in enumerate(speedDefinitions):
+    fits[name] = fit[i]
+  return fits
 
-from flamesProps import*
 
 class MarksteinNumber:
 
@@ -15,52 +164,36 @@ class MarksteinNumber:
         self.Sl_norm = Sl_norm
         self.localName = str(localName)
 
-    def linear_fitting(self,Ka_threshold = 10):
+    def linear_fitting(self,Ka_threshold = 10, method = 'ols'):
         """ Linear Fitting  """
         print("\nMarkstein number: " + self.localName)
-        self.x = []
-        self.y = []
-        for i in range(0,len(self.Ka)-1):
-            if self.Ka[i] > Ka_threshold:
-                break
-            else:
-                self.x.append(self.Ka[i])
-                self.y.append(self.Sl_norm[i])        
-        n = len(self.x)
-        (ar, br) = np.polyfit(self.x, self.y, 1)
-        xr = np.polyval([ar, br], self.x)
-        # compute the mean square error
-        err = np.sqrt(sum((xr - self.y)**2)/n)
-        print('Linear regression:')
-        print('regression: a=%.3f b=%.3f, ms error= %.3f' % ( ar, br, err))
+        mask = linear_mask(self.Ka, self.Sl_norm, Ka_threshold)
+        self.x = np.asarray(self.Ka, dtype=float)[mask]
+        self.y = np.asarray(self.Sl_norm, dtype=float)[mask]
+        self.fit = linear_fits(self.Ka, self.Sl_norm, method=method, mask=mask)
+        ar, br = -self.fit['Ma'], self.fit['intercept']
+        print('Linear regression ({}):'.format(method))
+        print('regression: a=%.3f b=%.3f, ms error= %.3f' % ( ar, br, self.fit['rms']))
         # Predict values
         self.x_fit = np.linspace(min(self.x),max(self.x),50)
         self.y_preditc = ar*self.x_fit + br
-        print('Ma = {:.2f}\n'.format( -ar ) )
+        print('Ma = {:.2f} [{:.2f}, {:.2f}]\n'.format(
+              self.fit['Ma'], self.fit['Ma_low'], self.fit['Ma_high']))
+        return self.fit
         
     def marks_line(self):
         return self.x_fit, self.y_preditc 
 
 
-def main():
-
-  data = pd.read_csv('./stretchResults/' + 'results.csv',index_col=None)
-  
-  phi = 1.
-  phi = round(phi,1)
-  D_th = flamesProp_CH4[phi]['D_th'] 
-  Sl_o = flamesProp_CH4[phi]['Sl_o']
-  deltaL = D_th/Sl_o
-   
-  # It limits to the linear stretch effect
-  #threshold = 0.01
-  threshold = 10 # For Sc
-  
+def markstein_fits(data, deltaL, Sl_o, threshold = 10, method = 'ols'):
+  """
+  Markstein number of the burnt gas, unburnt gas and consumption speeds
+  """
   # Burnt gas
   x = np.array(data['Kb']*deltaL/Sl_o)
   y = np.array(data['Su_b']/Sl_o)
   burntgas = MarksteinNumber(x,y,'Burnt gas') 
-  burntgas.linear_fitting(Ka_threshold=threshold)
+  burntgas.linear_fitting(Ka_threshold=threshold, method=method)
 
   # Unburnt gas
   x = np.array(data['Ku']*deltaL/Sl_o)
@@ -68,89 +201,130 @@ def main():
   #x = x[:-15]
   #y = y[:-15]
   unburntgas = MarksteinNumber(x,y,'Unburnt gas') 
-  unburntgas.linear_fitting(Ka_threshold=threshold)
+  unburntgas.linear_fitting(Ka_threshold=threshold, method=method)
 
   # Consumption speed
   x = np.array(data['Kb']*deltaL/Sl_o)
   y = np.array(data['Sc']/Sl_o)
   consSpeed = MarksteinNumber(x,y,'Consumption speed') 
-  consSpeed.linear_fitting(Ka_threshold=threshold)
-
-
-  #--------------------------------------------------
-  # PLOTS
-
-  # Define fonts
-  font = {'family': 'serif'}
-
-  fontLegend = {'family': 'serif',
-          'weight': 'normal',
-          'size': 14,
-          }
-
-  fontLegend2 = {'family': 'serif',
-          'weight': 'normal',
-          'size': 14,
-          }
-
-  fontLegend3 = {'family': 'serif',
-          'weight': 'normal',
-          'size': 11,
-          }
-  #----------------------------------------------------------------------
-  # Define fonts of plots [Math symbols and expressions]
-  fonts1 = ["serif"]
-  fonts2 = ["stix","stixsans","cm"]
-  for font1,font2 in zip(fonts1,fonts2):
-      plt.rcParams["font.family"] = font1
-      plt.rcParams["mathtext.fontset"] = font2
-      plt.rcParams["font.size"] = 11
-
-  #----------------------------------------------------------
-
-  fig = plt.figure(1,figsize=(6,5),facecolor='w')
-  plt.scatter(data['Kb']*deltaL/Sl_o,data['Su_b']/Sl_o,s=6,color='k', lw =3)
-  plt.plot(burntgas.marks_line()[0],burntgas.marks_line()[1],lw=2)
-  plt.ylabel('$\\rm \\tilde{S}_d/S^0_l$',fontsize=17, fontdict=font)
-  plt.xlabel('$\\rm Ka$',fontsize=17, fontdict=font)
-  #plt.legend(loc='upper right',framealpha = 1,edgecolor='k',prop=fontLegend3)           
-  plt.ylim([0.,1.2])
-  plt.xlim([0,1.2])
-  plt.tight_layout()
-  plt.grid(color='gray', linestyle='--',lw=.5)
-
-  fig = plt.figure(2,figsize=(6,5),facecolor='w')
-  plt.scatter(data['Kb'],data['Su_b']/Sl_o,s=6,color='k', lw =3)
-  plt.ylabel('$\\rm \\tilde{S}_d/S^0_l$',fontsize=17, fontdict=font)
-  plt.xlabel('$\\rm Stretch\ rate\ (s^{-1})$',fontsize=17, fontdict=font)
-  #plt.legend(loc='upper right',framealpha = 1,edgecolor='k',prop=fontLegend3)           
-  plt.ylim([0.,1.2])
-  #plt.xlim([0,350])
-  plt.tight_layout()
-  plt.grid(color='gray', linestyle='--',lw=.5)
-
-  fig = plt.figure(3,figsize=(6,5),facecolor='w')
-  plt.scatter(data['Ku']*deltaL/Sl_o,data['Su']/Sl_o,s=6,color='k', lw =3)
-  plt.plot(unburntgas.marks_line()[0],unburntgas.marks_line()[1],lw=2)
-  plt.ylabel('$\\rm {S}_u/S^0_l$',fontsize=17, fontdict=font)
-  plt.xlabel('$\\rm Ka$',fontsize=17, fontdict=font)
-  #plt.legend(loc='lower left',framealpha = 1,edgecolor='k',prop=fontLegend3)           
-  plt.ylim([0.,1.2])
-  plt.xlim([0,1.1])
-  plt.tight_layout()
-  plt.grid(color='gray', linestyle='--',lw=.5)
-
-  fig = plt.figure(4,figsize=(6,5),facecolor='w')
-  plt.scatter(data['Kb']*deltaL/Sl_o,data['Sc']/Sl_o,s=6,color='k', lw =3)
-  plt.plot(consSpeed.marks_line()[0],consSpeed.marks_line()[1],lw=2)
-  plt.ylabel('$\\rm {S}_c/S^0_l$',fontsize=17, fontdict=font)
-  plt.xlabel('$\\rm Ka$',fontsize=17, fontdict=font)
-  #plt.legend(loc='lower left',framealpha = 1,edgecolor='k',prop=fontLegend3)           
-  plt.ylim([0.,1.2])
-  plt.xlim([0,1.1])
-  plt.tight_layout()
-  plt.grid(color='gray', linestyle='--',lw=.5)
-  plt.show()
+  consSpeed.linear_fitting(Ka_threshold=threshold, method=method)
+
+  return burntgas, unburntgas, consSpeed
+
+def markstein_table(folders, threshold = 10, method = 'ols', confidence = 0.95):
+  """
+  Markstein numbers of many results folders (results.csv and case.json),
+  fitted in one call, as one row by case
+  """
+  from plotResults import read_case, case_conditions
+
+  cases, results, deltaL, Sl_o = [], [], [], []
+  for folder in folders:
+    case = read_case(folder)
+    props = flame_props(case['fuel'], case['phi'], case['mechanism'],
+                        **case_conditions(case))
+    cases.append(case)
+    results.append(pd.read_csv(os.path.join(folder, 'results.csv'), index_col=None))
+    deltaL.append(props['D_th']/props['Sl_o'])
+    Sl_o.append(props['Sl_o'])
+  fits = markstein_numbers(results, deltaL, Sl_o, threshold, method, confidence)
+
+  table = pd.DataFrame({'folder': folders,
+                        'source': [case.get('source') for case in cases],
+                        'fuel': [case['fuel'] for case in cases],
+                        'phi': [case['phi'] for case in cases],
+                        'mechanism': [case['mechanism'] for case in cases]})
+  for key, values in zip(['T', 'p', 'transport_model'],
+                         zip(*[case_conditions(case).values() for case in cases])):
+    table[key] = values
+  table['Sl_o'] = Sl_o
+  table['D_th'] = np.multiply(deltaL, Sl_o)
+  for name, _, _ in speedDefinitions:
+    for field in fitDtype.names:
+      table[name + '_' + field] = fits[name][field]
+  return table
+
+def run_markstein(pathToSave = './stretchResults/', fuel = None, phi = None,
+                  mechanism = None, threshold = 10, method = 'ols', plot = True):
+  """
+  Markstein numbers of one results folder. fuel, phi and mechanism default
+  to the case.json of the folder.
+  """
+  from plotResults import read_case, case_conditions
+
+  case = {'fuel': 'CH4', 'phi': 1., 'mechanism': 'chemicalMechanism/kee.xml'}
+  if os.path.isfile(os.path.join(pathToSave, 'case.json')):
+    case.update(read_case(pathToSave))
+  fuel = fuel or case['fuel']
+  phi = case['phi'] if phi is None else phi
+  mec = mechanism or case['mechanism']
+
+  data = pd.read_csv(os.path.join(pathToSave, 'results.csv'),index_col=None)
+  
+  # computed with the mechanism of the sweep on the first run
+  props = flame_props(fuel, phi, mec, **case_conditions(case))
+  D_th = props['D_th'] 
+  Sl_o = props['Sl_o']
+  deltaL = D_th/Sl_o
+   
+  burntgas, unburntgas, consSpeed = markstein_fits(data, deltaL, Sl_o, threshold,
+                                                   method)
+
+  if plot:
+    from plotResults import show_figures, markstein_figures
+    show_figures(markstein_figures(data, deltaL, Sl_o, burntgas, unburntgas,
+                                   consSpeed), perWindow = 4)
+  return burntgas, unburntgas, consSpeed
+
+def run_markstein_table(folders, threshold = 10, method = 'ols',
+                        output = 'markstein.csv', database = None):
+  """
+  Markstein numbers of many results folders, written as one table, and
+  added to the results database if given (see resultsDatabase.py)
+  """
+  if database is not None:
+    from resultsDatabase import ResultsDatabase
+    with ResultsDatabase(database) as db:
+      table = db.add_folders(folders, threshold, method)
+    print('Markstein numbers added to ' + database)
+  else:
+    table = markstein_table(folders, threshold, method)
+  table.to_csv(output, index = False)
+  print(table[['folder'] + [name + '_Ma' for name, _, _ in speedDefinitions]])
+  print('Markstein numbers written: ' + output)
+  return table
+
+def main(argv = None):
+
+  parser = argparse.ArgumentParser(description='Markstein number of the '
+                                   'counter-flow flames')
+  parser.add_argument('results', nargs='*',
+                      help='results folders (results.csv and case.json) fitted '
+                      'together into one table, instead of ./stretchResults/')
+  parser.add_argument('--fuel', default=None,
+                      help='fuel of ./stretchResults/, from case.json by default')
+  parser.add_argument('--phi', type=float, default=None)
+  parser.add_argument('--mechanism', default=None)
+  parser.add_argument('--no-plot', action='store_true',
+                      help='only compute, without figures (see plotResults.py)')
+  # It limits to the linear stretch effect (0.01), 10 For Sc
+  parser.add_argument('--threshold', type=float, default=10.,
+                      help='largest Karlovitz number of the linear fit')
+  parser.add_argument('--method', default='ols',
+                      choices=['ols', 'huber', 'theil-sen'])
+  parser.add_argument('--output', default='markstein.csv',
+                      help='table of the results folders')
+  parser.add_argument('--database', default=None,
+                      help='SQLite results database where the table is also '
+                      'added, by fuel, phi, mechanism, T, p and transport')
+  args = parser.parse_args(argv)
+
+  if args.results:
+    run_markstein_table(args.results, args.threshold, args.method, args.output,
+                        args.database)
+  else:
+    run_markstein('./stretchResults/', args.fuel, args.phi, args.mechanism,
+                  args.threshold, args.method, not args.no_plot)
 
 
 if __name__=='__main__':
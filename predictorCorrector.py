@@ -0,0 +1,126 @@
+"""
+Two-level sweeps: a cheap mechanism predicts the sweep, the detailed
+mechanism corrects the points of the Markstein fit.
+
+The whole velocity range of a case is solved with the predictor mechanism
+(in <case>/predictor) and post-processed. The points of its linear stretch
+range (Ka below the threshold of the fit) are then solved with the
+detailed mechanism, in <case>, from one to the next by continuation. With
+mapGuess, each detailed point starts instead from the predictor flame of
+the same velocity, restored on the species of the detailed mechanism (the
+others start at zero). A predictor flame with species the detailed
+mechanism does not have is not restored, that point is continued from the
+previous one.
+
+The speedup and the Markstein numbers of both levels are written in
+<case>/predictor.json. With compare, the whole range is also solved with
+the detailed mechanism (in <case>/detailed), for the measured speedup and
+the error of the corrector fit.
+"""
+
+import numpy as np
+import pandas as pd
+import os
+import json
+
+# options of the two-level sweeps of sweepDriver
+predictorOptions = {'mechanism': None, 'points': 6, 'threshold': 10.,
+                    'mapGuess': False, 'compare': False}
+
+
+def select_points(results, deltaL, Sl_o, threshold = 10., points = 6):
+    """
+    Inlet velocities of the points of the linear stretch range of the
+    predictor results (burnt gas Karlovitz number below threshold), at most
+    points of them spread over the range
+    """
+    from postProcessingMarksteinNumber import linear_mask
+
+    Ka = np.asarray(results['Kb'], dtype=float)*deltaL/Sl_o
+    mask = linear_mask(Ka, results['Su_b'], threshold)
+    u = np.sort(np.asarray(results['u'], dtype=float)[mask])
+    if u.size > points:
+        u = u[np.unique(np.round(np.linspace(0, u.size - 1, points)).astype(int))]
+    return u
+
+
+def stretch_case(case, dropEnds = True):
+    """
+    Flame speeds and stretch rates of a solved case, in <case>/stretchResults
+    """
+    from postProcessingFlameStretch import run_stretch
+
+    pathToSave = os.path.join(case['path'], 'stretchResults', '')
+    run_stretch(case['fuel'], case['phi'], os.path.join(case['path'], ''), pathToSave,
+                case['mechanism'], dropEnds, plot = False)
+    return pathToSave
+
+
+def predictor_corrector(case):
+    """
+    Solve one case of sweepDriver with the predictor mechanism of
+    case['predictor'], then the detailed mechanism at the points of the
+    Markstein fit. Returns the report written in <case>/predictor.json.
+    """
+    from sweepDriver import run_case
+    from sweepManifest import SweepManifest
+    from postProcessingMarksteinNumber import markstein_table, speedDefinitions
+
+    options = dict(predictorOptions, **case['predictor'])
+    detailed = dict(case, predictor = None)
+    predictor = dict(detailed, mechanism = options['mechanism'],
+                     path = os.path.join(case['path'], 'predictor'))
+
+    predictorTime = run_case(predictor)
+    predictorResults = stretch_case(predictor)
+    table = markstein_table([predictorResults], options['threshold'])
+    results = pd.read_csv(os.path.join(predictorResults, 'results.csv'), index_col=None)
+    u = select_points(results, table['D_th'][0]/table['Sl_o'][0], table['Sl_o'][0],
+                      options['threshold'], options['points'])
+    if u.size < 2:
+        raise RuntimeError('{} points of the predictor in the linear stretch '
+                           'range'.format(u.size))
+
+    detailed['axial_velocity'] = u
+    detailed['adaptive'] = False
+    if options['mapGuess']:
+        detailed['seed'] = predictor['path']
+    correctorTime = run_case(detailed)
+    folders = [predictorResults, stretch_case(detailed, dropEnds = False)]
+
+    predictorPoints = len([point for point in SweepManifest(predictor['path']).points
+                           if point['status'] != 'pending'])
+    report = {'predictor': options['mechanism'], 'mechanism': case['mechanism'],
+              'predictor_time': predictorTime, 'corrector_time': correctorTime,
+              'predictor_points': predictorPoints,
+              'corrector_velocities': u.tolist()}
+    # full detailed sweep, estimated from the time by corrector point
+    detailedTime = correctorTime/u.size*predictorPoints
+    if options['compare']:
+        full = dict(case, predictor = None, path = os.path.join(case['path'], 'detailed'))
+        detailedTime = run_case(full)
+        folders.append(stretch_case(full))
+    report['detailed_time'] = detailedTime
+    report['detailed_time_measured'] = options['compare']
+    report['speedup'] = detailedTime/(predictorTime + correctorTime)
+
+    table = markstein_table(folders, options['threshold'])
+    levels = ['predictor', 'corrector', 'detailed'][:len(folders)]
+    report['Ma'] = {}
+    for name, _, _ in speedDefinitions:
+        Ma = dict(zip(levels, table[name + '_Ma'].tolist()))
+        Ma['difference'] = Ma['corrector'] - Ma['predictor']
+        if 'detailed' in Ma:
+            Ma['error'] = Ma['corrector'] - Ma['detailed']
+        report['Ma'][name] = Ma
+    with open(os.path.join(case['path'], 'predictor.json'), 'w') as f:
+        json.dump(report, f, indent=1)
+
+    print('\n** {} -> {}: {} of {} points, {:.1f} + {:.1f} s, speedup {:.1f}{}'.format(
+          options['mechanism'], case['mechanism'], u.size, predictorPoints,
+          predictorTime, correctorTime, report['speedup'],
+          '' if options['compare'] else ' (estimated)'))
+    for name, Ma in report['Ma'].items():
+        print('   Ma {:12s}'.format(name) + '  '.join('{} {:.3f}'.format(level, value)
+                                                   for level, value in Ma.items()))
+    return report
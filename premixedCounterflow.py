@@ -13,102 +13,715 @@ import sys
 import pandas as pd
 import os
 import time
+import tempfile
 
-print('\n*** Computation of premixed counter-flow twin flames  ***\n\n')
+from profileStore import ProfileStore
+from mechanismRegistry import get_solution
+from solutionCache import SolutionCache
+from sweepManifest import SweepManifest
+from sweepTelemetry import SolveTelemetry, phase
+from profileWriter import (ProfileWriter, profile_layout, profile_snapshot,
+                           snapshot_columns, write_profile)
 
-# Select the reaction mechanism
-mec = 'chemicalMechanism/kee.xml'
-gas = ct.Solution(mec)
+# Grid refinement of the flames
+refineCriteria = {'ratio': 2, 'slope': 0.02, 'curve': 0.02, 'prune': 0.00}
+# exponent of the flame distance to the symmetry plane with the mass flux,
+# until two flames of the sweep give it (CH4/air, kee)
+flameShift = 0.8
+# names of the transport models in the sweeps and results: Cantera names
+transportModels = {'Mix': 'mixture-averaged', 'Multi': 'multicomponent',
+                   'UnityLewis': 'unity-Lewis-number'}
 
-Tmax_s = []
-Sc_s = []
-Sd_s = []
-strain_s = []
-massFlux_s = []
+def transport_name(transport_model):
+    """
+    Name of a transport model in the sweeps and results ('Mix', 'Multi',
+    'UnityLewis', with '+Soret'), also given by its Cantera name
+    """
+    model, plus, soret = transport_model.partition('+')
+    names = {value: name for name, value in transportModels.items()}
+    return names.get(model, model) + plus + soret
 
-#Set input velocity
-axial_velocity = np.linspace(1,5,10)
+def set_transport(flame, transport_model = 'Mix'):
+    """
+    Transport model of a flame: 'Mix' (mixture-averaged), 'Multi'
+    (multi-component), 'UnityLewis', or 'Multi+Soret' for the
+    multi-component model with thermal diffusion
+    """
+    model, _, soret = transport_name(transport_model).partition('+')
+    try:
+        flame.transport_model = transportModels.get(model, model)
+    except ct.CanteraError:
+        # the short names only, before Cantera 3
+        flame.transport_model = model
+    flame.soret_enabled = soret == 'Soret'
 
-phi = 1.
-folderName ='{:.2f}'.format(phi)
 
-path = './counterFlowResults/CH4/' + folderName
-if not os.path.isdir(path):
-    os.makedirs(path)
-    print("created folder : ", path)
-else:
-    print(path, " folder already exists.")
+def create_flame(gas, massFlux, width = 0.025, transport_model = 'Mix',
+                 grid = None):
+    """
+    Build a new twin premixed flame for the current state of gas, on grid
+    if given (positions from 0 to width).
+    """
+    if grid is None:
+        oppFlame = ct.CounterflowTwinPremixedFlame(gas, width=width)
+    else:
+        oppFlame = ct.CounterflowTwinPremixedFlame(gas, grid=grid)
+    oppFlame.max_grid_points = 5e4
+
+    # Mixture-averaged by default, 'Multi', 'Multi+Soret' or 'UnityLewis'
+    # (see set_transport)
+    set_transport(oppFlame, transport_model)
+
+    oppFlame.reactants.mdot = massFlux
+    oppFlame.set_refine_criteria(**refineCriteria)
+
+    return oppFlame
+
+
+def flame_distance(oppFlame):
+    """ Distance of the flame (largest temperature gradient) to the symmetry plane """
+    grid = oppFlame.grid
+    return grid[-1] - grid[np.argmax(np.gradient(oppFlame.T, grid))]
+
+
+def rescale_grid(grid, shift, edges):
+    """
+    Grid of a flame translated by shift towards the symmetry plane
+    (grid[-1]): the points of the flame, between its edges (upstream,
+    downstream), are translated, those of the inlet and of the burnt gas are
+    stretched or compressed around it, so that no point is added or removed.
+    The shift is limited to half of each of these regions.
+    """
+    start, end = grid[0], grid[-1]
+    upstream = max(edges[0], grid[1])
+    downstream = min(max(edges[1], upstream), grid[-2])
+    shift = np.clip(shift, 0.5*(start - upstream), 0.5*(end - downstream))
+    return np.interp(grid, [start, upstream, downstream, end],
+                     [start, upstream + shift, downstream + shift, end])
+
+
+def rescale_flame(oppFlame, gas, massFlux, width = 0.025, transport_model = 'Mix',
+                  history = None):
+    """
+    Rescale a converged flame to a new inlet mass flux, so that it can be used
+    as initial guess of the next point of the sweep.
+    The domain width is kept, the velocity and the spread rate scale with the
+    mass flux ratio and the pressure curvature with its square. The flame
+    structure is translated with its grid (rescale_grid) to the distance to
+    the symmetry plane extrapolated from the previous flames of the sweep
+    (history, the (mass flux, flame_distance) of the burning flames), or
+    as distance ~ mdot**-flameShift without one, so that the refinement of
+    the next solve only adds the points the new flame needs.
+    Returns the new flame, for the current state of gas.
+    """
+    mdot = oppFlame.reactants.mdot
+    ratio = massFlux/mdot
+    distance = flame_distance(oppFlame)
+    exponent = flameShift
+    previous = [(m, d) for m, d in (history or []) if abs(np.log(mdot/m)) > 1e-3]
+    if previous:
+        m, d = previous[-1]
+        exponent = -np.log(distance/d)/np.log(mdot/m)
+        if not 0. < exponent < 2.:
+            exponent = flameShift
+    # the flame starts where T rises by 1 % of the flame temperature, and
+    # ends as far downstream of the largest gradient
+    T = oppFlame.T
+    upstream = oppFlame.grid[np.argmax(T > T[0] + 0.01*(T.max() - T[0]))]
+    flame = oppFlame.grid[-1] - distance
+    edges = (upstream, min(2.*flame - upstream, flame + 0.25*distance))
+    grid = rescale_grid(oppFlame.grid, distance*(1. - ratio**-exponent), edges)
+
+    # velocity, spread rate, T, pressure curvature, ... (names change between
+    # Cantera versions, the order does not)
+    names = oppFlame.flame.component_names
+    exponents = {names[0]: 1., names[1]: 1., names[3]: 2.}
+
+    newFlame = create_flame(gas, massFlux, width, transport_model, grid)
+    # the profiles below replace the default guess, which solve() would
+    # otherwise set on a new flame
+    newFlame.set_initial_guess()
+    # profiles of the flow domain since Cantera 3.2, of Sim1D before
+    if hasattr(newFlame.flame, 'set_profile'):
+        get_values, set_profile = oppFlame.flame.values, newFlame.flame.set_profile
+    else:
+        get_values = lambda name: oppFlame.profile(oppFlame.flame, name)
+        set_profile = newFlame.set_profile
+    # the other components (eField, ...) are not solved by this flow
+    for name in names[:4] + gas.species_names:
+        set_profile(name, (grid - grid[0])/(grid[-1] - grid[0]),
+                    get_values(name)*ratio**exponents.get(name, 0.))
+    return newFlame
+
+
+def solve_flame(gas, massFlux, oppFlame = None, width = 0.025,
+                transport_model = 'Mix', loglevel = 1, telemetry = None,
+                history = None):
+    """
+    Solve one point of the sweep.
+    If a converged flame is given, it is rescaled to the new mass flux and used
+    as initial guess (continuation, with the history of the sweep, see
+    rescale_flame). The flame is solved from a cold start
+    when there is no previous solution or when Newton fails from it.
+    The phases are timed in telemetry (SolveTelemetry) if given.
+    """
+    if oppFlame is not None:
+        try:
+            with phase(telemetry, 'rescale'):
+                oppFlame = rescale_flame(oppFlame, gas, massFlux, width,
+                                         transport_model, history)
+            with phase(telemetry, 'warm_solve', oppFlame):
+                oppFlame.solve(loglevel = loglevel, refine_grid = True, auto = False)
+            return oppFlame
+        except ct.CanteraError:
+            print("\n** Continuation failed, restarting from a cold start")
+
+    oppFlame = create_flame(gas, massFlux, width, transport_model)
+    if loglevel > 0:
+        # show_solution was renamed show in Cantera 3
+        (getattr(oppFlame, 'show_solution', None) or oppFlame.show)()
+    with phase(telemetry, 'cold_solve', oppFlame):
+        oppFlame.solve(loglevel = loglevel, auto=True)
+    return oppFlame
+
+
+def cached_solve(gas, massFlux, oppFlame = None, width = 0.025,
+                 transport_model = 'Mix', loglevel = 1, cache = None,
+                 signature = None, telemetry = None, history = None):
+    """
+    solve_flame through the solution cache of the sweep (SolutionCache, with
+    the signature of the sweep). A cached flame is restored without solving.
+    Otherwise, without a previous flame, the cached flame of the closest mass
+    flux is the initial guess, and the converged flame is added to the cache.
+    """
+    if telemetry is not None:
+        telemetry.note(start = 'cold' if oppFlame is None else 'warm')
+    if cache is None:
+        return solve_flame(gas, massFlux, oppFlame, width, transport_model,
+                           loglevel, telemetry, history)
+
+    with phase(telemetry, 'cache_lookup'):
+        solution = cache.get(signature, massFlux)
+        if solution is None and oppFlame is None:
+            solution = cache.nearest(signature, massFlux)
+            hit = False
+        else:
+            hit = solution is not None
+    if solution is not None:
+        try:
+            with phase(telemetry, 'cache_restore'):
+                if oppFlame is None:
+                    oppFlame = create_flame(gas, massFlux, width, transport_model)
+                oppFlame.restore(solution, name = 'solution')
+            if telemetry is not None:
+                telemetry.note(start = 'cache' if hit else 'nearest')
+            if hit:
+                print("Cached flame: {0:.4f} kg/m2s".format(massFlux))
+                return oppFlame
+        except (ct.CanteraError, OSError):
+            # evicted by another process meanwhile
+            print("\n** Cached flame unreadable, solving it")
+
+    oppFlame = solve_flame(gas, massFlux, oppFlame, width, transport_model,
+                           loglevel, telemetry, history)
+    with phase(telemetry, 'cache_put'):
+        cache.put(signature, massFlux, oppFlame)
+    return oppFlame
+
+
+def flame_file(path, name):
+    """
+    File to save a flame solution with oppFlame.save. Cantera 2.x only
+    handles XML files, newer versions YAML.
+    """
+    extension = '.xml' if int(ct.__version__.split('.')[0]) < 3 else '.yaml'
+    return os.path.join(path, name + extension)
+
+
+def save_flame(oppFlame, fileName, name = 'solution'):
+    """
+    Save the whole solution, so that it can be restored as initial guess
+    """
+    if fileName.endswith('.xml'):
+        oppFlame.save(fileName, name = name, loglevel = 0)
+    else:
+        oppFlame.save(fileName, name = name, overwrite = True)
+
+
+def strain_rate(oppFlame, gas):
+    """
+    Strain rate of the flame: max. of the axial velocity gradient upstream of
+    the reaction zone (peak of O2 consumption)
+    """
+    iO2 = gas.species_index('O2')
+    refPoint = oppFlame.net_production_rates[iO2,:].argmin()
+    K = -np.gradient(oppFlame.velocity, oppFlame.grid)
+    return np.max(K[:refPoint + 1])
+
+
+def profile_columns(oppFlame, gas, fuel = 'CH4', export = 'profiles'):
+    """
+    Profiles used in the post-processing, or the full state of the flame
+    with export 'full' (see profileWriter)
+    """
+    return snapshot_columns(profile_snapshot(oppFlame, gas,
+                                             profile_layout(gas, fuel, export)))
+
+
+def save_profile(oppFlame, gas, path, velocity, fuel = 'CH4', store = None,
+                 writer = None, layout = None):
+    """
+    Save the profiles of one flame in the binary store of the case, or as a
+    csv file named by the inlet velocity. With a writer (ProfileWriter), only
+    the snapshot of the flame is taken here and the profiles are written in
+    the background. layout gives the species and elements of the profiles
+    (profile_layout, resolved once by sweep), the default profiles without.
+    """
+    fileName = '{:.3f}'.format(velocity)
+    snapshot = profile_snapshot(oppFlame, gas, layout or profile_layout(gas, fuel))
+    info = {}
+    if store is not None or (writer is not None and writer.store is not None):
+        criteria = oppFlame.get_refine_criteria()
+        info = dict(velocity = float(velocity),
+                    mdot = float(oppFlame.reactants.mdot),
+                    T_max = float(np.max(oppFlame.T)),
+                    grid_points = int(oppFlame.grid.size),
+                    transport_model = transport_name(oppFlame.transport_model),
+                    refine_criteria = {k: float(v) for k, v in criteria.items()})
+    if writer is not None:
+        writer.write(fileName, snapshot, **info)
+    else:
+        write_profile(path, fileName, snapshot_columns(snapshot), store, **info)
+
+
+def export_layout(gas, fuel, export = 'profiles', store = None):
+    """
+    Layout of the profiles of a sweep. The store keeps the export mode and,
+    for the full export, the molecular weights of the species (mole
+    fractions are derived on read).
+    """
+    layout = profile_layout(gas, fuel, export)
+    if store is not None:
+        store.run['export'] = export
+        if layout['full']:
+            store.run['molecular_weights'] = layout['W']
+    return layout
+
+
+def has_profile(path, label, store = None):
+    if store is not None:
+        return label in store.labels
+    return os.path.isfile(path + '/' + label)
+
+
+def recover_profiles(gas, manifest, path, fuel = 'CH4', store = None,
+                     width = 0.025, transport_model = 'Mix', layout = None):
+    """
+    Profiles of the converged points of the manifest that were never written
+    (sweep killed before its background writer), from their saved flames.
+    gas must be in the state of the sweep.
+    """
+    for point in manifest.points:
+        if point['status'] != 'converged' or not point.get('solution'):
+            continue
+        if has_profile(path, point['label'], store):
+            continue
+        print("\n** Writing the missing profile of {0} m/s".format(point['label']))
+        oppFlame = create_flame(gas, gas.density*point['u'], width, transport_model)
+        oppFlame.restore(manifest.solution(point), name = 'solution')
+        save_profile(oppFlame, gas, path, point['u'], fuel, store, layout = layout)
+
 
-print('Path to Save: ' + path) 
-time.sleep(6)     
+def resume_flame(gas, manifest, point, width = 0.025, transport_model = 'Mix'):
+    """
+    Flame of a converged point of the sweep manifest (SweepManifest), for
+    the current state of gas
+    """
+    print("\n** Resuming the sweep from {0} m/s".format(point['label']))
+    oppFlame = create_flame(gas, gas.density*point['u'], width, transport_model)
+    oppFlame.restore(manifest.solution(point), name = 'solution')
+    return oppFlame
 
-for i in range(0,axial_velocity.size):
-    # Create a CH4/Air premixed mixture with equivalence at room
-    # temperature and pressure.
+
+def seed_flame(gas, seed, u, width = 0.025, transport_model = 'Mix'):
+    """
+    Initial guess from a base sweep (SweepManifest seed, solved with another
+    transport model, T or p): the converged flame of the base sweep closest
+    to the inlet velocity u, with the reactants of gas and transport_model.
+    The mass flux is left to the base flame, solve_flame rescales it.
+    None if the base sweep has no converged flame, or if its flame does not
+    restore on the species of gas (base mechanism with other species).
+    """
+    point = seed.closest_converged(u)
+    if point is None:
+        return None
+    # the flame changes the state of gas, the reactants are kept here
+    T, p, Y = gas.T, gas.P, gas.Y
+    oppFlame = create_flame(gas, gas.density*point['u'], width)
+    try:
+        oppFlame.restore(seed.solution(point), name = 'solution')
+    except ct.CanteraError as error:
+        gas.TPY = T, p, Y
+        reason = [line for line in str(error).splitlines()
+                  if line.strip() and not line.startswith('*')][-1]
+        print("\n** Base flame of {0} m/s not restored, solved without it: {1}"
+              .format(point['label'], reason))
+        return None
+    oppFlame.P = p
+    oppFlame.reactants.T = T
+    oppFlame.reactants.Y = Y
+    set_transport(oppFlame, transport_model)
+    gas.TPY = T, p, Y
+    return oppFlame
+
+
+def velocity_sweep(gas, phi, fuel, axial_velocity, path, width = 0.025,
+                   transport_model = 'Mix', continuation = True, loglevel = 1,
+                   store = None, cache = None, manifest = None, telemetry = None,
+                   writer = None, export = 'profiles', T = 300., p = ct.one_atm,
+                   seed = None, onFlame = None):
+    """
+    Solve the flames along axial_velocity until extinction, for reactants at
+    T and p.
+    With continuation, each point starts from the previous converged flame,
+    or from the flame of the same point of the base sweep seed (its
+    SweepManifest) if given.
+    The profiles go to store (ProfileStore) if given, else to csv files,
+    written in the background by writer (ProfileWriter) if given, and are
+    not written without path. export 'full' writes the whole state of the
+    flames (profileWriter). onFlame(oppFlame, gas, u) is called with every
+    burning flame, as it is solved; the sweep stops there if it returns True
+    (the next points are not needed, see marksteinPipeline.OnlineMarkstein).
+    The flames of cache (SolutionCache) are restored instead of solved.
+    With a manifest (SweepManifest), every point is recorded and a restarted
+    sweep continues at its first unfinished point.
+    Each point is logged in telemetry (SolveTelemetry) if given.
+    """
+    oppFlame = None
+    signature = None
+    history = []
+    start = 0
+    labels = ['{:.3f}'.format(u) for u in axial_velocity]
+    layout = export_layout(gas, fuel, export, store)
+    if manifest is not None:
+        manifest.plan(labels, axial_velocity)
+        gas.set_equivalence_ratio(phi, fuel, {'O2':1.0, 'N2':3.76})
+        gas.TP = T, p
+        recover_profiles(gas, manifest, path, fuel, store, width, transport_model,
+                         layout)
+        if manifest.finished():
+            print("\n** Sweep already finished (flame extinction)")
+            return
+        if manifest.stopped():
+            print("\n** Sweep stopped early before, continued")
+        while start < len(labels) and manifest.status(labels[start]) == 'converged':
+            start += 1
+        last = manifest.last_converged(before = axial_velocity[start]
+                                       if start < len(labels) else None)
+        if continuation and last is not None and start < len(labels):
+            gas.set_equivalence_ratio(phi, fuel, {'O2':1.0, 'N2':3.76})
+            gas.TP = T, p
+            oppFlame = resume_flame(gas, manifest, last, width, transport_model)
+
+    for i in range(start,axial_velocity.size):
+        # Create a premixed mixture with equivalence at room
+        # temperature and pressure.
+        gas.set_equivalence_ratio(phi, fuel, {'O2':1.0, 'N2':3.76})
+        gas.TP = T, p
+
+        # Compute the mass flux, as this is what the Flame object requires
+        massFlux = gas.density * axial_velocity[i]  # units kg/m2/s
+
+        if cache is not None:
+            signature = cache.signature(fuel, phi, gas.T, gas.P, width,
+                                        transport_model, refineCriteria)
+        if telemetry is not None:
+            telemetry.start_point(label = labels[i], u = float(axial_velocity[i]),
+                                  mdot = float(massFlux))
+        guess = oppFlame if continuation else None
+        if seed is not None:
+            guess = seed_flame(gas, seed, axial_velocity[i], width,
+                               transport_model) or guess
+        solveStart = time.time()
+        try:
+            oppFlame = cached_solve(gas, massFlux, guess,
+                                    width, transport_model, loglevel, cache,
+                                    signature, telemetry, history)
+        except ct.CanteraError:
+            if manifest is not None:
+                manifest.update(labels[i], axial_velocity[i], 'failed',
+                                time.time() - solveStart)
+            if telemetry is not None:
+                telemetry.end_point(status = 'failed')
+            raise
+        solveTime = time.time() - solveStart
+        T_max = np.max(oppFlame.T)
+
+        if T_max < 500:
+            print("\n** Flame extinction\ " )
+            if manifest is not None:
+                manifest.update(labels[i], axial_velocity[i], 'extinguished',
+                                solveTime, finished = True)
+            if telemetry is not None:
+                telemetry.end_point(status = 'extinguished', T_max = T_max,
+                                    grid_points = int(oppFlame.grid.size))
+            break
+
+        print("Peak temperature: {0:.1f} K".format(T_max))
+        print("Mass flux: {0:.4f} Kg/m2s".format(massFlux))
+        history.append((massFlux, flame_distance(oppFlame)))
+
+        if path is not None:
+            with phase(telemetry, 'save_profile'):
+                save_profile(oppFlame, gas, path, axial_velocity[i], fuel, store,
+                             writer, layout)
+        stop = onFlame is not None and bool(onFlame(oppFlame, gas, axial_velocity[i]))
+        if manifest is not None:
+            with phase(telemetry, 'manifest'):
+                manifest.update(labels[i], axial_velocity[i], 'converged',
+                                solveTime, oppFlame, stopped = stop)
+        if telemetry is not None:
+            telemetry.end_point(status = 'converged', T_max = T_max,
+                                grid_points = int(oppFlame.grid.size))
+        if stop:
+            print("\n** Sweep stopped at {0:.3f} m/s, {1} points left".format(
+                  axial_velocity[i], axial_velocity.size - i - 1))
+            break
+
+
+def adaptive_sweep(gas, phi, fuel, path, u_start = 1., u_max = 50., du = 0.5,
+                   width = 0.025, transport_model = 'Mix', growth = 1.5,
+                   dT_max = 50., rtol = 1e-3, T_ext = 500., loglevel = 1,
+                   store = None, cache = None, manifest = None, telemetry = None,
+                   writer = None, export = 'profiles', T = 300., p = ct.one_atm,
+                   seed = None, onFlame = None, untilExtinction = True):
+    """
+    Solve the flames with an adaptive inlet velocity until extinction, for
+    reactants at T and p.
+    The step grows by growth while T_max drops less than dT_max between two
+    points and is halved otherwise. Once a point extinguishes (or fails), the
+    velocity is bisected between the last burning and the first extinguished
+    point, each trial starting from the last burning flame, until the bracket
+    is smaller than rtol*u.
+    The profiles go to store (ProfileStore) if given, else to csv files,
+    written in the background by writer (ProfileWriter) if given, with the
+    whole state of the flames if export is 'full' (not written without
+    path), and the flames of cache (SolutionCache) are restored instead of
+    solved. onFlame(oppFlame, gas, u) is called with every burning flame.
+    Once it returns True (the weak stretch points are not needed anymore),
+    the sweep stops there, or with untilExtinction goes on to the
+    extinction with a step growing at every point.
+    With a manifest (SweepManifest), every point and the state of the steps
+    are recorded, and a restarted sweep continues where it stopped.
+    Each point is logged in telemetry (SolveTelemetry) if given. With a base
+    sweep seed (SweepManifest), every point starts from the closest burning
+    flame of the base sweep.
+    Returns the extinction point (last burning flame) as a dict.
+    """
+    # the last burning flame is kept out of the results folder
+    with tempfile.TemporaryDirectory() as tempFolder:
+        checkpoint = flame_file(tempFolder, 'lastBurning')
+        oppFlame = None
+        u = u_start
+        u_burn = None
+        T_burn = None
+        u_fail = None
+        extinction = {'u': np.nan, 'mdot': np.nan, 'K': np.nan, 'T_max': np.nan}
+        nSolves = 0
+        signature = None
+        history = []
+        finished = False
+        stopped = False
+        halt = False
+        layout = export_layout(gas, fuel, export, store)
+
+        if manifest is not None and 'u' in manifest.state:
+            state = manifest.state
+            u, du, u_burn, T_burn, u_fail = (state['u'], state['du'], state['u_burn'],
+                                             state['T_burn'], state['u_fail'])
+            extinction = dict(state['extinction'])
+            nSolves = state['solves']
+            finished = state['finished']
+            last = manifest.last_converged()
+            gas.set_equivalence_ratio(phi, fuel, {'O2':1.0, 'N2':3.76})
+            gas.TP = T, p
+            recover_profiles(gas, manifest, path, fuel, store, width, transport_model,
+                             layout)
+            if not finished and last is not None:
+                oppFlame = resume_flame(gas, manifest, last, width, transport_model)
+                save_flame(oppFlame, checkpoint, 'lastBurning')
+
+        while u <= u_max and not finished:
+            # Create a premixed mixture with equivalence at room
+            # temperature and pressure.
+            gas.set_equivalence_ratio(phi, fuel, {'O2':1.0, 'N2':3.76})
+            gas.TP = T, p
+            massFlux = gas.density * u  # units kg/m2/s
+            if cache is not None:
+                signature = cache.signature(fuel, phi, gas.T, gas.P, width,
+                                            transport_model, refineCriteria)
+
+            nSolves += 1
+            if telemetry is not None:
+                telemetry.start_point(label = '{:.3f}'.format(u), u = float(u),
+                                      mdot = float(massFlux))
+            solveStart = time.time()
+            guess = oppFlame
+            if seed is not None:
+                guess = seed_flame(gas, seed, u, width, transport_model) or guess
+            try:
+                oppFlame = cached_solve(gas, massFlux, guess, width,
+                                        transport_model, loglevel, cache, signature,
+                                        telemetry, history)
+                T_max = np.max(oppFlame.T)
+                status = 'converged' if T_max >= T_ext else 'extinguished'
+            except ct.CanteraError:
+                T_max = 0.
+                status = 'failed'
+            solveTime = time.time() - solveStart
+            point = u
+
+            if T_max >= T_ext:
+                print("Velocity: {0:.4f} m/s, peak temperature: {1:.1f} K".format(u, T_max))
+                history.append((massFlux, flame_distance(oppFlame)))
+                with phase(telemetry, 'save_profile'):
+                    if path is not None:
+                        save_profile(oppFlame, gas, path, u, fuel, store, writer, layout)
+                    save_flame(oppFlame, checkpoint, 'lastBurning')
+                if onFlame is not None and onFlame(oppFlame, gas, u):
+                    stopped = True
+                    halt = not untilExtinction
+                if u_fail is None and u_burn is not None:
+                    if stopped or T_burn - T_max < dT_max:
+                        du *= growth
+                    else:
+                        du *= 0.5
+                u_burn = u
+                T_burn = T_max
+                extinction = {'u': u, 'mdot': massFlux,
+                              'K': strain_rate(oppFlame, gas), 'T_max': T_max}
+            else:
+                print("Velocity: {0:.4f} m/s, flame extinction".format(u))
+                u_fail = u
+                if u_burn is None:
+                    finished = True
+                else:
+                    oppFlame.restore(checkpoint, name = 'lastBurning')
+
+            if finished:
+                pass
+            elif u_fail is None:
+                u = u_burn + du
+            elif u_fail - u_burn > rtol*u_burn:
+                u = 0.5*(u_burn + u_fail)
+            else:
+                finished = True
+
+            if manifest is not None:
+                with phase(telemetry, 'manifest'):
+                    manifest.update('{:.3f}'.format(point), point, status, solveTime,
+                                    oppFlame if status == 'converged' else None,
+                                    u = u, du = du, u_burn = u_burn, T_burn = T_burn,
+                                    u_fail = u_fail, extinction = extinction,
+                                    solves = nSolves, finished = finished,
+                                    stopped = stopped)
+            if telemetry is not None:
+                telemetry.end_point(status = status, T_max = float(T_max),
+                                    grid_points = int(oppFlame.grid.size)
+                                    if oppFlame is not None else None)
+            if halt:
+                break
+
+    extinction['solves'] = nSolves
+    if u_burn is None:
+        print("\n** No burning flame at the first velocity")
+    elif halt:
+        print("\n** Sweep stopped at {0:.3f} m/s".format(u_burn))
+    elif u_fail is None:
+        print("\n** No extinction below {0:.3f} m/s".format(u_max))
+    else:
+        print("\n** Extinction strain rate: {0:.2f} 1/s".format(extinction['K']))
+        print("Inlet velocity: {0:.4f} m/s".format(extinction['u']))
+        print("Peak temperature: {0:.1f} K".format(extinction['T_max']))
+    print("Number of solves: {0}".format(nSolves))
+    return extinction
+
+
+def main():
+
+    print('\n*** Computation of premixed counter-flow twin flames  ***\n\n')
+
+    # Select the reaction mechanism
+    mec = 'chemicalMechanism/kee.xml'
+    gas = get_solution(mec)
+
+    #Set input velocity
+    axial_velocity = np.linspace(1,5,10)
+
+    phi = 1.
     fuel = 'CH4'
-    gas.set_equivalence_ratio(phi, fuel, {'O2':1.0, 'N2':3.76})
-    gas.TP = 300, ct.one_atm
-
-    # Domain half-width of 2.5 cm, meaning the whole domain is 5 cm wide
-    width = 0.025
-
-    # Done with initial conditions
-    # Compute the mass flux, as this is what the Flame object requires
-    massFlux = gas.density * axial_velocity[i]  # units kg/m2/s
-    
-    # Create the flame object
-    oppFlame = ct.CounterflowTwinPremixedFlame(gas, width=width)
-    oppFlame.max_grid_points = 5e4
+    folderName ='{:.2f}'.format(phi)
 
-    # Uncomment the following line to use a Multi-component formulation. Default is
-    # mixture-averaged
-    #oppFlame.transport_model = 'Multi'
-    #oppFlame.soret_enabled=True
-    #oppFlame.transport_model = 'UnityLewis'
-    oppFlame.transport_model = 'Mix'
-         
-    oppFlame.reactants.mdot = massFlux
-    oppFlame.set_refine_criteria(ratio=2, slope=0.02, curve=0.02, prune=0.00)
-
-    oppFlame.show_solution()
-    oppFlame.solve(loglevel = 1, auto=True)
-    T_max = np.max(oppFlame.T)
-
-    if T_max < 500:
-        print("\n** Flame extinction\ " )
-        break
-    
-    print("Peak temperature: {0:.1f} K".format(T_max))
-    print("Mass flux: {0:.4f} Kg/m2s".format(massFlux))
-
-    list_species = ['CH4','O2','CO','CO2',\
-                 'H2O','OH','CH2O','H2O2','HO2','HCO']
-
-    #list_species = ['H2','O2','H2O','OH','H2O2','HO2']
-
-    df = pd.DataFrame()
-    df['x'] =  oppFlame.grid
-    df['rho'] =  oppFlame.density
-    df['T'] =  oppFlame.T
-    df['velocity'] =  oppFlame.velocity
-    for species in list_species:
-      df[species] =  oppFlame.Y[gas.species_index(species),:]
-
-    for species in list_species:
-      df['wdot' + species] =  oppFlame.net_production_rates[gas.species_index(species),:]*gas.molecular_weights[gas.species_index(species)]  
-
-    for species in list_species:
-      df['diff' + species] =  oppFlame.mix_diff_coeffs_mass[gas.species_index(species),:]  
-
-    df['alpha'] =  oppFlame.thermal_conductivity/(oppFlame.cp_mass*oppFlame.density)
-    df['k'] =  oppFlame.thermal_conductivity
-    df['Qdot'] =  abs(oppFlame.heat_release_rate)
-
-    #df['Z_C'] =  oppFlame.elemental_mass_fraction('C')
-    df['Z_O'] =  oppFlame.elemental_mass_fraction('O')
-    df['Z_H'] =  oppFlame.elemental_mass_fraction('H')
-    df['Z_N'] =  oppFlame.elemental_mass_fraction('N')
-    
-    fileName = '{:.3f}'.format( axial_velocity[i] )    
-    df.to_csv(path + '/' + fileName, index = False)
-     
+    # Reactants and transport model ('Mix', 'Multi', 'Multi+Soret', 'UnityLewis')
+    T = 300.
+    p = ct.one_atm
+    transport_model = 'Mix'
+
+    path = './counterFlowResults/' + fuel + '/' + folderName
+    if not os.path.isdir(path):
+        os.makedirs(path)
+        print("created folder : ", path)
+    else:
+        print(path, " folder already exists.")
+
+    print('Path to Save: ' + path)
+
+    # Adaptive steps up to extinction instead of the fixed velocity list
+    adaptive = False
+
+    # Profiles of the post-processing, or 'full' for the whole state of the
+    # flames (all species, elements, cp, viscosity, ...)
+    export = 'profiles'
+
+    # Binary store of the case instead of one csv file by velocity
+    store = ProfileStore(path, run = {'mechanism': mec, 'fuel': fuel,
+                                      'phi': phi, 'width': 0.025, 'T': T, 'p': p,
+                                      'transport_model': transport_model})
+    #store = None
+
+    # Converged flames of previous runs, restored instead of solved
+    cache = SolutionCache(mec)
+    #cache = None
+
+    # Status of every point, to resume an interrupted sweep
+    manifest = SweepManifest(path, run = {'mechanism': mec, 'fuel': fuel,
+                                          'phi': phi, 'width': 0.025,
+                                          'transport_model': transport_model,
+                                          'T': T, 'p': p,
+                                          'adaptive': adaptive, 'export': export,
+                                          'axial_velocity': list(axial_velocity)})
+
+    # Wall time, grids and solver statistics of every point
+    telemetry = SolveTelemetry('./counterFlowResults/telemetry.jsonl',
+                               mechanism = mec, fuel = fuel, phi = phi)
+
+    # Profiles written in the background while the next flame is solved
+    with ProfileWriter(path, store) as writer:
+        # Domain half-width of 2.5 cm, meaning the whole domain is 5 cm wide
+        if adaptive:
+            adaptive_sweep(gas, phi, fuel, path, u_start = axial_velocity[0],
+                           u_max = 50., du = axial_velocity[1] - axial_velocity[0],
+                           width = 0.025, transport_model = transport_model,
+                           store = store, cache = cache, manifest = manifest,
+                           telemetry = telemetry, writer = writer, export = export,
+                           T = T, p = p)
+        else:
+            velocity_sweep(gas, phi, fuel, axial_velocity, path, width = 0.025,
+                           transport_model = transport_model, continuation = True,
+                           store = store, cache = cache, manifest = manifest,
+                           telemetry = telemetry, writer = writer, export = export,
+                           T = T, p = p)
+
+
+if __name__=='__main__':
+    main()
@@ -0,0 +1,94 @@
+"""
+Fields derived from the stored profiles, computed when they are read.
+
+Any stored column can be read from a ProfileStore, and also these derived
+fields, from the stored columns they need:
+
+    Le<species>   Lewis number of a species, alpha/D (LeH2, LeO2, ...)
+    Le_eff        Lewis number of the deficient reactant (the fuel of lean
+                  mixtures, O2 of rich ones)
+    c             progress variable (T - Tu)/(Tb - Tu)
+    X<species>    mole fraction, with the full export (W column and the
+                  molecular weights of the run metadata)
+
+Other fields are added with derived_field. A group named species in the
+pattern only matches the species of the run (those of its stored profiles,
+else of its mechanism), so that any species name, as CH2(S) or C2H5O-2,
+can be given.
+"""
+
+import re
+
+# (pattern of the names, dependencies, function)
+derivedFields = []
+
+def derived_field(pattern, dependencies):
+    """
+    Register a derived field. dependencies(match, run) gives the stored
+    columns needed, function(match, columns, run) the field from them.
+    """
+    def register(function):
+        derivedFields.append((re.compile(pattern + '$'), dependencies, function))
+        return function
+    return register
+
+def run_species(run):
+    """
+    Species of a run: those of its stored profiles, else of its mechanism,
+    None if unknown
+    """
+    if 'molecular_weights' in run:
+        return list(run['molecular_weights'])
+    if 'mechanism' in run:
+        from mechanismRegistry import get_solution
+        return get_solution(run['mechanism']).species_names
+    return None
+
+def deficient_reactant(run):
+    return run.get('fuel', 'CH4') if run.get('phi', 1.) <= 1. else 'O2'
+
+@derived_field(r'Le_eff', lambda match, run: ['alpha', 'diff' + deficient_reactant(run)])
+def effective_lewis(match, columns, run):
+    return columns['alpha']/columns['diff' + deficient_reactant(run)]
+
+@derived_field(r'Le(?P<species>.+)', lambda match, run: ['alpha', 'diff' + match.group('species')])
+def lewis(match, columns, run):
+    return columns['alpha']/columns['diff' + match.group('species')]
+
+@derived_field(r'c', lambda match, run: ['T'])
+def progress(match, columns, run):
+    T = columns['T']
+    return (T - T[0])/(T[-1] - T[0])
+
+@derived_field(r'X(?P<species>.+)', lambda match, run: [match.group('species'), 'W'])
+def mole_fraction(match, columns, run):
+    species = match.group('species')
+    return columns[species]*columns['W']/run['molecular_weights'][species]
+
+
+def field(name, run = None):
+    """
+    Function and stored columns of a derived field, None if unknown
+    """
+    species = None
+    for pattern, dependencies, function in derivedFields:
+        match = pattern.match(name)
+        if match is not None and 'species' in pattern.groupindex:
+            if species is None:
+                species = run_species(run or {}) or []
+            if species and match.group('species') not in species:
+                continue
+        if match is not None:
+            return (lambda columns, run: function(match, columns, run)), \
+                   dependencies(match, run or {})
+    return None
+
+def add_fields(columns, names, run = None):
+    """
+    Add the derived fields names to columns (dict or DataFrame of the stored
+    columns, with their dependencies)
+    """
+    for name in names:
+        function, _ = field(name, run)
+        columns[name] = function(columns, run or {})
+    return columns
@@ -0,0 +1,162 @@
+import numpy as np
+import pandas as pd
+import os
+import json
+
+from profileFields import field
+
+
+class ProfileStore:
+    """
+    BINARY STORE OF THE FLAME PROFILES OF ONE CASE
+    Every column (x, rho, T, velocity, Y, wdot, ...) is one raw float64 file
+    where the profiles of the sweep are appended one after the other. The
+    offsets of the profiles, their metadata and the metadata of the run
+    (mechanism, fuel, phi, ...) are kept in metadata.json.
+    The columns are read through np.memmap, so only the requested columns of
+    the requested profiles are loaded. The fields of profileFields (Lewis
+    numbers, progress variable, ...) are computed from them on read.
+    """
+    metadataFile = 'metadata.json'
+    extension = '.f8'
+
+    def __init__(self, path, run = None):
+        """
+        Open the store in path, or create it with the run metadata
+        """
+        self.path = path
+        self._memmaps = {}
+        if ProfileStore.exists(path):
+            with open(os.path.join(path, self.metadataFile)) as f:
+                self.metadata = json.load(f)
+            if run is not None:
+                self.metadata['run'].update(run)
+        else:
+            if not os.path.isdir(path):
+                os.makedirs(path)
+            self.metadata = {'run': dict(run or {}), 'columns': [], 'size': 0,
+                             'profiles': []}
+
+    @staticmethod
+    def exists(path):
+        return os.path.isfile(os.path.join(path, ProfileStore.metadataFile))
+
+    @property
+    def run(self):
+        return self.metadata['run']
+
+    @property
+    def columns(self):
+        return list(self.metadata['columns'])
+
+    @property
+    def labels(self):
+        """ Labels of the profiles, sorted by inlet velocity """
+        profiles = sorted(self.metadata['profiles'], key=lambda p: p['velocity'])
+        return [p['label'] for p in profiles]
+
+    def info(self, label):
+        """ Metadata of one profile (velocity, mdot, T_max, ...) """
+        for profile in self.metadata['profiles']:
+            if profile['label'] == label:
+                return profile
+        raise KeyError(label)
+
+    def _file(self, column):
+        return os.path.join(self.path, column + self.extension)
+
+    def _save_metadata(self):
+        fileName = os.path.join(self.path, self.metadataFile)
+        with open(fileName + '.tmp', 'w') as f:
+            json.dump(self.metadata, f, indent=1)
+        os.replace(fileName + '.tmp', fileName)
+
+    def append(self, label, columns, **info):
+        """
+        Add one profile. columns maps the column names to 1-D arrays of the
+        same size, info is saved as the profile metadata.
+        A profile with the same label is replaced in the index, its old
+        data is left in the files.
+        """
+        if not self.metadata['columns']:
+            self.metadata['columns'] = list(columns)
+        elif set(columns) != set(self.metadata['columns']):
+            raise ValueError('Columns of ' + label + ' do not match the store')
+
+        size = len(columns[self.metadata['columns'][0]])
+        offset = self.metadata['size']
+        for column in self.metadata['columns']:
+            values = np.ascontiguousarray(columns[column], dtype='<f8')
+            if values.size != size:
+                raise ValueError('Column ' + column + ' of ' + label + ' has a different size')
+            # write after the last indexed profile, dropping data of an
+            # append interrupted before the metadata was saved
+            mode = 'r+b' if os.path.isfile(self._file(column)) else 'wb'
+            with open(self._file(column), mode) as f:
+                f.seek(offset*8)
+                f.write(values.tobytes())
+                f.truncate()
+        self._memmaps = {}
+
+        self.metadata['profiles'] = [p for p in self.metadata['profiles']
+                                     if p['label'] != label]
+        profile = {'label': label, 'offset': offset, 'size': size}
+        profile.update(info)
+        self.metadata['profiles'].append(profile)
+        self.metadata['size'] = offset + size
+        self._save_metadata()
+
+    def _column(self, column):
+        if column not in self._memmaps:
+            if column not in self.metadata['columns']:
+                raise KeyError(column)
+            self._memmaps[column] = np.memmap(self._file(column), dtype='<f8', mode='r')
+        return self._memmaps[column]
+
+    def read(self, label, columns = None):
+        """
+        Columns of one profile as a dict of read-only arrays (memory-mapped),
+        and the derived fields requested, computed from the stored columns
+        """
+        profile = self.info(label)
+        start = profile['offset']
+        end = start + profile['size']
+        if columns is None:
+            columns = self.metadata['columns']
+
+        derived = {}
+        stored = []
+        for column in columns:
+            if column in self.metadata['columns']:
+                stored.append(column)
+                continue
+            derived[column] = field(column, self.run)
+            if derived[column] is None:
+                raise KeyError(column)
+            stored += derived[column][1]
+        values = {column: self._column(column)[start:end] for column in stored}
+        for column, (function, _) in derived.items():
+            values[column] = function(values, self.run)
+        return {column: values[column] for column in columns}
+
+    def ragged(self, labels, columns):
+        """
+        Stored columns of many profiles, concatenated in the order of labels,
+        and the offsets of the profiles in them (profile i in
+        values[offsets[i]:offsets[i+1]]), as read by StretchRate.stretch_batch
+        """
+        profiles = [self.info(label) for label in labels]
+        offsets = np.concatenate([[0], np.cumsum([p['size'] for p in profiles])])
+        values = {}
+        for column in columns:
+            data = self._column(column)
+            values[column] = np.concatenate([data[p['offset']:p['offset'] + p['size']]
+                                             for p in profiles])
+        return values, offsets
+
+    def frame(self, label, columns = None):
+        """
+        Columns of one profile as a DataFrame, as read from the csv files
+        """
+        return pd.DataFrame(self.read(label, columns))
+
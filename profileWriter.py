@@ -0,0 +1,167 @@
+import numpy as np
+import pandas as pd
+import os
+import queue
+import threading
+
+# Species written in the profiles, when they are in the mechanism
+profileSpecies = ['CH4','O2','CO','CO2',\
+                  'H2O','OH','CH2O','H2O2','HO2','HCO']
+
+#profileSpecies = ['H2','O2','H2O','OH','H2O2','HO2']
+profileElements = ['O', 'H', 'N']
+
+# Export modes: 'profiles' writes the species of profileSpecies, 'full' all
+# the species and elements of the mechanism, with cp, viscosity and mean
+# molecular weight, so that any field can be derived later (profileFields)
+exportModes = ['profiles', 'full']
+
+
+def profile_layout(gas, fuel = 'CH4', export = 'profiles'):
+    """
+    Species of the profiles and their indices, and elements, resolved once
+    by sweep
+    """
+    if export not in exportModes:
+        raise ValueError('Unknown export mode: ' + str(export))
+    full = export == 'full'
+    if full:
+        names = list(gas.species_names)
+        elements = list(gas.element_names)
+    else:
+        names = list(profileSpecies)
+        if fuel not in names:
+            names = [fuel] + names
+        names = [species for species in names if species in gas.species_names]
+        elements = profileElements
+    indices = [gas.species_index(species) for species in names]
+    return {'species': names, 'indices': indices, 'elements': elements,
+            'full': full, 'W': dict(zip(names, gas.molecular_weights[indices].tolist()))}
+
+
+def profile_snapshot(oppFlame, gas, layout):
+    """
+    Solution arrays of the flame used in the profiles, taken on the solver
+    thread. The arrays returned by Cantera are not views of the solver
+    state, so they are kept as they are; only the rows of the species of
+    the profiles are selected.
+    """
+    indices = layout['indices']
+    snapshot = {'species': layout['species'],
+                'x': oppFlame.grid,
+                'rho': oppFlame.density,
+                'T': oppFlame.T,
+                'velocity': oppFlame.velocity,
+                'Y': oppFlame.Y[indices, :],
+                'wdot': oppFlame.net_production_rates[indices, :],
+                'W': gas.molecular_weights[indices],
+                'diff': oppFlame.mix_diff_coeffs_mass[indices, :],
+                'k': oppFlame.thermal_conductivity,
+                'cp': oppFlame.cp_mass,
+                'Qdot': oppFlame.heat_release_rate}
+    for element in layout['elements']:
+        snapshot['Z_' + element] = oppFlame.elemental_mass_fraction(element)
+    if layout['full']:
+        snapshot['full'] = {'cp': snapshot['cp'], 'mu': oppFlame.viscosity,
+                            'W': oppFlame.mean_molecular_weight}
+    return snapshot
+
+
+def snapshot_columns(snapshot):
+    """
+    Columns of the profile file from a snapshot
+    """
+    names = snapshot['species']
+    df = {}
+    for column in ['x', 'rho', 'T', 'velocity']:
+        df[column] = snapshot[column]
+    for species, Y in zip(names, snapshot['Y']):
+        df[species] = Y
+    wdot = snapshot['wdot']*snapshot['W'][:, None]
+    for species, values in zip(names, wdot):
+        df['wdot' + species] = values
+    for species, values in zip(names, snapshot['diff']):
+        df['diff' + species] = values
+
+    df['alpha'] = snapshot['k']/(snapshot['cp']*snapshot['rho'])
+    df['k'] = snapshot['k']
+    df['Qdot'] = abs(snapshot['Qdot'])
+    for column in snapshot:
+        if column.startswith('Z_'):
+            df[column] = snapshot[column]
+    df.update(snapshot.get('full', {}))
+    return df
+
+
+def write_profile(path, fileName, columns, store = None, **info):
+    """
+    Write one profile in the store of the case, or as a csv file (written
+    then renamed, so that a partial file is never read)
+    """
+    if store is not None:
+        store.append(fileName, columns, **info)
+        return
+    fileName = path + '/' + fileName
+    pd.DataFrame(columns).to_csv(fileName + '.tmp', index = False)
+    os.replace(fileName + '.tmp', fileName)
+
+
+class ProfileWriter:
+    """
+    BACKGROUND WRITER OF THE PROFILES OF A SWEEP
+    The snapshots of the flames (profile_snapshot) are turned into columns
+    and written (csv files or ProfileStore) on a writer thread, while the
+    solver moves on to the next point. At most depth profiles wait to be
+    written. An error of the writer is raised by the next write or by close.
+    """
+    def __init__(self, path, store = None, depth = 2):
+        self.path = path
+        self.store = store
+        self.error = None
+        self.queue = queue.Queue(maxsize = depth)
+        self.thread = threading.Thread(target = self._run, name = 'ProfileWriter',
+                                       daemon = True)
+        self.thread.start()
+
+    def _run(self):
+        while True:
+            item = self.queue.get()
+            try:
+                if item is None:
+                    return
+                if self.error is None:
+                    fileName, snapshot, info = item
+                    write_profile(self.path, fileName, snapshot_columns(snapshot),
+                                  self.store, **info)
+            except Exception as error:
+                self.error = error
+            finally:
+                self.queue.task_done()
+
+    def _raise(self):
+        if self.error is not None:
+            error, self.error = self.error, None
+            raise error
+
+    def write(self, fileName, snapshot, **info):
+        """ Queue one profile, waiting if depth profiles are already queued """
+        self._raise()
+        self.queue.put((fileName, snapshot, info))
+
+    def flush(self):
+        """ Wait for the queued profiles """
+        self.queue.join()
+        self._raise()
+
+    def close(self):
+        """ Write the queued profiles and stop the thread """
+        if self.thread.is_alive():
+            self.queue.put(None)
+            self.thread.join()
+        self._raise()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
@@ -0,0 +1,101 @@
+"""
+Reference planes of the flame speeds and strain rates.
+
+PreHeat and Reaction take the reference plane at the minimum of a reference
+scalar of the profile. Each definition builds its scalar from the
+ProfileFeatures of the profile, so that the gradients and extrema of a
+profile are computed once for all the definitions studied:
+
+    O2        max. O2 consumption (min. of wdotO2), the default
+    fuel      max. fuel consumption
+    hrr       max. heat release rate
+    T:1200    isotherm T = 1200 K
+    c:0.5     iso-level of the progress variable c = (T - Tu)/(Tb - Tu)
+
+Other definitions are added with register_plane.
+"""
+
+from StretchRate import PreHeat, Reaction
+
+# name: (reference scalar function, profile columns, default level)
+referencePlanes = {}
+
+def register_plane(name, columns, level = None):
+    """
+    Register a reference plane. The function returns the reference scalar
+    (minimum at the plane) from the features, the fuel and the level.
+    '{fuel}' in the columns is replaced by the fuel.
+    """
+    def register(function):
+        referencePlanes[name] = (function, columns, level)
+        return function
+    return register
+
+@register_plane('O2', ['wdotO2'])
+def oxygen_consumption(features, fuel, level):
+    return features['wdotO2']
+
+@register_plane('fuel', ['wdot{fuel}'])
+def fuel_consumption(features, fuel, level):
+    return features['wdot' + fuel]
+
+@register_plane('hrr', ['Qdot'])
+def heat_release(features, fuel, level):
+    return -features['Qdot']
+
+@register_plane('T', ['T'])
+def isotherm(features, fuel, level):
+    if level is None:
+        raise ValueError('the isotherm plane needs a temperature, as T:1200')
+    return (features['T'] - level)**2
+
+@register_plane('c', ['T'], level = 0.5)
+def progress_level(features, fuel, level):
+    return (features.progress - level)**2
+
+
+def parse_plane(plane):
+    """
+    Name and level of a plane, 'T:1200' -> ('T', 1200.)
+    """
+    name, _, level = plane.partition(':')
+    if name not in referencePlanes:
+        raise KeyError('Unknown reference plane: {} ({})'.format(
+                       name, ', '.join(referencePlanes)))
+    return name, float(level) if level else referencePlanes[name][2]
+
+def plane_label(plane):
+    """ Suffix of the result columns of a plane, 'T:1200' -> 'T1200' """
+    return plane.replace(':', '')
+
+def plane_columns(planes, fuel = 'CH4'):
+    """
+    Profile columns read for the planes
+    """
+    columns = []
+    for plane in planes:
+        for column in referencePlanes[parse_plane(plane)[0]][1]:
+            column = column.format(fuel = fuel)
+            if column not in columns:
+                columns.append(column)
+    return columns
+
+def reference_scalar(features, plane, fuel = 'CH4'):
+    name, level = parse_plane(plane)
+    return referencePlanes[name][0](features, fuel, level)
+
+def plane_speeds(features, planes = ('O2',), fuel = 'CH4', method = 'grid'):
+    """
+    Flame speeds and strain rates of one profile for every reference plane,
+    {plane: {'Su', 'Ku', 'Su_b', 'Kb'}}, from the shared features
+    """
+    results = {}
+    for plane in planes:
+        ref_Scalar = reference_scalar(features, plane, fuel)
+        ph = PreHeat(ref_Scalar, features.x, features.velocity, features.rho,
+                     method, features)
+        rz = Reaction(ref_Scalar, features.x, features.velocity, features.rho,
+                      method, features)
+        results[plane] = {'Su': ph.flame_speed_u(), 'Ku': ph.strain_rate_u(),
+                          'Su_b': rz.flame_speed_b(), 'Kb': rz.strain_rate_b()}
+    return results
@@ -0,0 +1,373 @@
+#!/usr/bin/env python3
+"""
+Database of the Markstein numbers of many cases.
+
+The stretch results (results.csv) and the Markstein numbers fitted from
+them are kept in one SQLite file, by case: fuel, phi, mechanism, T, p and
+transport model. A case added again replaces its old rows, so the cases
+are gathered without renaming the results folders.
+
+    python resultsDatabase.py add stretchResults/H2/*/
+    python resultsDatabase.py map --fuel H2 --mechanism chemicalMechanism/kee.xml
+    python resultsDatabase.py fill --fuels H2 --phis 0.5 0.6 0.7 0.8
+
+fill solves, post-processes and fits only the cells of the map missing in
+the database.
+"""
+
+import numpy as np
+import pandas as pd
+import os
+import sqlite3
+import time
+import argparse
+
+caseKeys = ['fuel', 'phi', 'mechanism', 'T', 'p', 'transport_model']
+fitFields = ['Ma', 'intercept', 'rms', 'Ma_low', 'Ma_high',
+             'intercept_low', 'intercept_high', 'points']
+
+schema = """
+CREATE TABLE IF NOT EXISTS cases (
+    id INTEGER PRIMARY KEY,
+    fuel TEXT NOT NULL, phi REAL NOT NULL, mechanism TEXT NOT NULL,
+    T REAL NOT NULL, p REAL NOT NULL, transport_model TEXT NOT NULL,
+    source TEXT, results TEXT, Sl_o REAL, D_th REAL, updated REAL,
+    UNIQUE (fuel, phi, mechanism, T, p, transport_model));
+CREATE TABLE IF NOT EXISTS series (
+    case_id INTEGER NOT NULL REFERENCES cases(id) ON DELETE CASCADE,
+    u TEXT NOT NULL, name TEXT NOT NULL, value REAL,
+    PRIMARY KEY (case_id, u, name));
+CREATE TABLE IF NOT EXISTS fits (
+    case_id INTEGER NOT NULL REFERENCES cases(id) ON DELETE CASCADE,
+    definition TEXT NOT NULL, method TEXT NOT NULL, threshold REAL NOT NULL,
+    Ma REAL, intercept REAL, rms REAL, Ma_low REAL, Ma_high REAL,
+    intercept_low REAL, intercept_high REAL, points INTEGER,
+    PRIMARY KEY (case_id, definition, method, threshold));
+"""
+
+
+def case_key(fuel, phi, mechanism, T = 300., p = 101325., transport_model = 'Mix'):
+    """
+    Values of the case columns. phi is rounded as the results folders are
+    named, so that the same case is found from any source.
+    """
+    from premixedCounterflow import transport_name
+
+    transport_model = transport_name(transport_model)
+    return {'fuel': fuel, 'phi': round(float(phi), 6), 'mechanism': mechanism,
+            'T': float(T), 'p': float(p), 'transport_model': transport_model}
+
+
+class ResultsDatabase:
+    """
+    SQLITE DATABASE OF THE STRETCH RESULTS AND MARKSTEIN NUMBERS
+    cases: one row by (fuel, phi, mechanism, T, p, transport model), with
+    the folders it comes from and the laminar flame (Sl_o, D_th).
+    series: the columns of results.csv by inlet velocity (long format, so
+    that the speeds of any reference plane are kept).
+    fits: the Markstein numbers of the speed definitions, by fitting method
+    and Karlovitz threshold.
+    """
+
+    def __init__(self, fileName = 'markstein.db'):
+        folder = os.path.dirname(fileName)
+        if folder and not os.path.isdir(folder):
+            os.makedirs(folder)
+        self.fileName = fileName
+        self.connection = sqlite3.connect(fileName)
+        self.connection.execute('PRAGMA foreign_keys = ON')
+        self.connection.executescript(schema)
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def case_id(self, create = False, **case):
+        """
+        Id of a case, None if unknown (a new row if create)
+        """
+        key = case_key(**case)
+        where = ' AND '.join(name + ' = ?' for name in caseKeys)
+        row = self.connection.execute('SELECT id FROM cases WHERE ' + where,
+                                      [key[name] for name in caseKeys]).fetchone()
+        if row is not None:
+            return row[0]
+        if not create:
+            return None
+        cursor = self.connection.execute(
+            'INSERT INTO cases ({}) VALUES ({})'.format(', '.join(caseKeys),
+                                                       ', '.join('?'*len(caseKeys))),
+            [key[name] for name in caseKeys])
+        return cursor.lastrowid
+
+    def add_case(self, results, fits, Sl_o, D_th, method = 'ols', threshold = 10.,
+                 source = None, folder = None, **case):
+        """
+        Add or replace one case: results is its results.csv table, fits the
+        fitted Markstein numbers {definition: fitDtype record}
+        """
+        with self.connection:
+            caseId = self.case_id(create = True, **case)
+            self.connection.execute(
+                'UPDATE cases SET source = ?, results = ?, Sl_o = ?, D_th = ?, '
+                'updated = ? WHERE id = ?',
+                (source, folder, float(Sl_o), float(D_th), time.time(), caseId))
+
+            self.connection.execute('DELETE FROM series WHERE case_id = ?', (caseId,))
+            columns = [column for column in results.columns if column != 'u']
+            self.connection.executemany(
+                'INSERT INTO series VALUES (?, ?, ?, ?)',
+                [(caseId, str(u), column, float(value))
+                 for u, values in zip(results['u'], results[columns].values)
+                 for column, value in zip(columns, values)])
+
+            self.connection.execute('DELETE FROM fits WHERE case_id = ? AND method = ? '
+                                    'AND threshold = ?', (caseId, method, float(threshold)))
+            self.connection.executemany(
+                'INSERT INTO fits VALUES ({})'.format(', '.join('?'*(4 + len(fitFields)))),
+                [[caseId, definition, method, float(threshold)] +
+                 [fit[name].item() for name in fitFields]
+                 for definition, fit in fits.items()])
+        return caseId
+
+    def add_table(self, table, results, method = 'ols', threshold = 10.):
+        """
+        Add the cases of a Markstein table (postProcessingMarksteinNumber.
+        markstein_table) with their results.csv tables
+        """
+        from postProcessingMarksteinNumber import fitDtype, speedDefinitions
+
+        for (_, row), data in zip(table.iterrows(), results):
+            fits = {}
+            for name, _, _ in speedDefinitions:
+                fit = np.zeros((), dtype=fitDtype)
+                for field in fitDtype.names:
+                    fit[field] = row[name + '_' + field]
+                fits[name] = fit
+            self.add_case(data, fits, row['Sl_o'], row['D_th'], method, threshold,
+                          source = row.get('source'), folder = row['folder'],
+                          **{key: row[key] for key in caseKeys})
+
+    def add_folders(self, folders, threshold = 10., method = 'ols'):
+        """
+        Fit and add results folders (results.csv and case.json)
+        """
+        from postProcessingMarksteinNumber import markstein_table
+
+        table = markstein_table(folders, threshold, method)
+        results = [pd.read_csv(os.path.join(folder, 'results.csv'), index_col=None,
+                               dtype={'u': str}) for folder in folders]
+        self.add_table(table, results, method, threshold)
+        return table
+
+    def cases(self, **filters):
+        """
+        Cases of the database, optionally those of some case columns, e.g.
+        cases(fuel='H2', p=101325.)
+        """
+        where, values = self._where(filters)
+        return pd.read_sql_query('SELECT * FROM cases' + where + ' ORDER BY ' +
+                                 ', '.join(caseKeys), self.connection, params=values)
+
+    def _where(self, filters, table = ''):
+        filters = {name: value for name, value in filters.items() if value is not None}
+        if not filters:
+            return '', []
+        if 'phi' in filters:
+            filters['phi'] = round(float(filters['phi']), 6)
+        for name in ['T', 'p']:
+            if name in filters:
+                filters[name] = float(filters[name])
+        return (' WHERE ' + ' AND '.join(table + name + ' = ?' for name in filters),
+                list(filters.values()))
+
+    def series(self, **case):
+        """
+        Stretch results of one case, as its results.csv table
+        """
+        caseId = self.case_id(**case)
+        if caseId is None:
+            raise KeyError(case_key(**case))
+        data = pd.read_sql_query('SELECT u, name, value FROM series WHERE case_id = ?',
+                                 self.connection, params=(caseId,))
+        data = data.pivot(index='u', columns='name', values='value')
+        data = data.iloc[np.argsort(data.index.astype(float))].reset_index()
+        data.columns.name = None
+        return data
+
+    def markstein_map(self, fuel = None, mechanism = None, definition = 'burnt',
+                      method = 'ols', threshold = 10., **conditions):
+        """
+        Markstein numbers Ma(phi) of one speed definition, with their
+        confidence intervals, one row by case sorted by phi. The case
+        columns not given (fuel, mechanism, T, p, transport_model) are
+        returned, so one call gives the maps of many conditions.
+        """
+        filters = dict(conditions, fuel = fuel, mechanism = mechanism)
+        where, values = self._where(filters, 'cases.')
+        where = (where + ' AND ' if where else ' WHERE ') + \
+                'fits.definition = ? AND fits.method = ? AND fits.threshold = ?'
+        values += [definition, method, float(threshold)]
+        query = ('SELECT {}, Sl_o, D_th, {} FROM cases JOIN fits ON fits.case_id = '
+                 'cases.id'.format(', '.join('cases.' + key for key in caseKeys),
+                                   ', '.join('fits.' + field for field in fitFields)))
+        order = ' ORDER BY ' + ', '.join('cases.' + key for key in caseKeys
+                                         if key != 'phi') + ', cases.phi'
+        table = pd.read_sql_query(query + where + order, self.connection, params=values)
+        # NULL (fits without enough points) as NaN
+        return table.astype(dict.fromkeys(['Sl_o', 'D_th'] + fitFields[:-1], float))
+
+    def missing(self, fuels, phis, mechanisms, method = 'ols', threshold = 10.,
+                **conditions):
+        """
+        Cells of the map (fuel, phi, mechanism) without Markstein numbers
+        """
+        cells = []
+        for mechanism in mechanisms:
+            for fuel in fuels:
+                known = self.markstein_map(fuel, mechanism, method = method,
+                                           threshold = threshold, **conditions)
+                for phi in phis:
+                    if not np.isclose(known['phi'].values, phi, rtol=0., atol=1e-6).any():
+                        cells.append(dict(conditions, fuel = fuel, phi = float(phi),
+                                          mechanism = mechanism))
+        return cells
+
+
+def cell_folder(root, cell, mechanisms):
+    """
+    Folder of a cell, as the folders of sweepDriver, with the transport,
+    T and p label for the other conditions than the defaults
+    """
+    from sweepDriver import study_label
+
+    folder = root
+    if len(mechanisms) > 1:
+        folder = os.path.join(folder, os.path.splitext(os.path.basename(cell['mechanism']))[0])
+    folder = os.path.join(folder, cell['fuel'], '{:.2f}'.format(cell['phi']))
+    conditions = (cell['transport_model'], cell['T'], cell['p'])
+    if conditions != ('Mix', 300., 101325.):
+        folder = os.path.join(folder, study_label(*conditions))
+    return folder + '/'
+
+
+def fill_map(database, fuels, phis, mechanisms, axial_velocity,
+             resultsPath = './counterFlowResults', stretchPath = './stretchResults',
+             transport_model = 'Mix', T = 300., p = 101325., threshold = 10.,
+             method = 'ols', extrema = 'grid', planes = ('O2',), workers = None,
+             **options):
+    """
+    Fill the missing cells of the Markstein maps of fuels x phis x
+    mechanisms: the sweeps are solved in parallel (resumed from their
+    manifests when already started), post-processed in
+    stretchPath/<fuel>/<phi>, fitted together and added to the database.
+    options are those of sweepDriver.make_cases.
+    """
+    from sweepDriver import make_cases, run_sweep, case_name
+    from postProcessingFlameStretch import run_stretch
+
+    conditions = {'transport_model': transport_model, 'T': float(T), 'p': float(p)}
+    cells = database.missing(fuels, phis, mechanisms, method, threshold, **conditions)
+    if not cells:
+        print('No missing cell')
+        return []
+    print('{} missing cells'.format(len(cells)))
+
+    cases = []
+    for cell in cells:
+        case, = make_cases([cell['fuel']], [cell['phi']], axial_velocity,
+                           [cell['mechanism']], resultsPath, **dict(options, **conditions))
+        case['path'] = cell_folder(resultsPath, cell, mechanisms)
+        cases.append(case)
+    failed = set(case['path'] for case, status in run_sweep(cases, workers)
+                 if isinstance(status, Exception))
+
+    folders, results = [], []
+    for cell, case in zip(cells, cases):
+        if case['path'] in failed:
+            continue
+        folder = cell_folder(stretchPath, cell, mechanisms)
+        data = run_stretch(cell['fuel'], cell['phi'], case['path'], folder,
+                           cell['mechanism'], plot = False, method = extrema,
+                           planes = planes)
+        if data is None or len(data) < 2:
+            print('** No results for {}'.format(case_name(case)))
+            continue
+        folders.append(folder)
+    if folders:
+        database.add_folders(folders, threshold, method)
+    return folders
+
+
+def main(argv = None):
+
+    parser = argparse.ArgumentParser(description='Database of the Markstein '
+                                     'numbers of many cases')
+    parser.add_argument('--database', default='markstein.db')
+    parser.add_argument('--threshold', type=float, default=10.,
+                        help='largest Karlovitz number of the linear fits')
+    parser.add_argument('--method', default='ols',
+                        choices=['ols', 'huber', 'theil-sen'])
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    add = commands.add_parser('add', help='add results folders (results.csv '
+                              'and case.json)')
+    add.add_argument('results', nargs='+')
+
+    query = commands.add_parser('map', help='Markstein numbers Ma(phi)')
+    query.add_argument('--fuel', default=None)
+    query.add_argument('--mechanism', default=None)
+    query.add_argument('--definition', default='burnt',
+                       choices=['burnt', 'unburnt', 'consumption'])
+    query.add_argument('--transport', default=None)
+    query.add_argument('--T', type=float, default=None, help='K')
+    query.add_argument('--p', type=float, default=None, help='atm')
+    query.add_argument('--output', default=None, help='csv file of the map')
+
+    fill = commands.add_parser('fill', help='solve and add the missing cells '
+                               'of the maps')
+    fill.add_argument('--fuels', nargs='+', default=['CH4'])
+    fill.add_argument('--phis', nargs='+', type=float, default=[1.])
+    fill.add_argument('--mechanisms', nargs='+', default=['chemicalMechanism/kee.xml'])
+    fill.add_argument('--velocity', nargs=3, type=float, default=[1., 5., 10],
+                      metavar=('START', 'STOP', 'NUM'),
+                      help='inlet velocity range (m/s), as np.linspace')
+    fill.add_argument('--transport', default='Mix')
+    fill.add_argument('--T', type=float, default=300., help='K')
+    fill.add_argument('--p', type=float, default=1., help='atm')
+    fill.add_argument('--results', default='./counterFlowResults')
+    fill.add_argument('--stretch', default='./stretchResults')
+    fill.add_argument('--adaptive', action='store_true')
+    fill.add_argument('--extrema', choices=['grid', 'spline'], default='grid')
+    fill.add_argument('--planes', nargs='+', default=['O2'])
+    fill.add_argument('--workers', type=int, default=None)
+    args = parser.parse_args(argv)
+
+    with ResultsDatabase(args.database) as database:
+        if args.command == 'add':
+            database.add_folders(args.results, args.threshold, args.method)
+            print('{} cases in {}'.format(len(database.cases()), args.database))
+        elif args.command == 'map':
+            table = database.markstein_map(
+                args.fuel, args.mechanism, args.definition, args.method, args.threshold,
+                transport_model = args.transport, T = args.T,
+                p = None if args.p is None else args.p*101325.)
+            pd.options.display.width = 200
+            print(table.to_string(index = False))
+            if args.output:
+                table.to_csv(args.output, index = False)
+        else:
+            u = np.linspace(args.velocity[0], args.velocity[1], int(args.velocity[2]))
+            fill_map(database, args.fuels, args.phis, args.mechanisms, u, args.results,
+                     args.stretch, args.transport, args.T, args.p*101325.,
+                     args.threshold, args.method, args.extrema, args.planes,
+                     args.workers, adaptive = args.adaptive)
+
+
+if __name__=='__main__':
+    main()
@@ -0,0 +1,145 @@
+import cantera as ct
+import numpy as np
+import os
+import json
+import time
+import hashlib
+
+from mechanismRegistry import mechanism_hash
+
+
+class SolutionCache:
+    """
+    CACHE OF THE CONVERGED COUNTER-FLOW FLAMES
+    Every solution is saved with oppFlame.save under a hash of its full
+    signature: mechanism files, fuel, phi, T, p, width, transport model,
+    refine criteria and inlet mass flux. A sweep restores a known flame
+    instead of solving it again, and starts a new one from the cached flame
+    of the closest mass flux with the same signature.
+    Each entry is one solution file and one json file of its signature, so
+    that several processes can share the cache folder. The least recently
+    used entries are removed above maxSize bytes.
+    """
+
+    def __init__(self, mechanism, path = './solutionCache/', maxSize = 1e9):
+        self.mechanism = mechanism
+        self.mechanismHash = mechanism_hash(mechanism)
+        self.path = path
+        self.maxSize = maxSize
+        if not os.path.isdir(path):
+            os.makedirs(path, exist_ok=True)
+
+    def signature(self, fuel, phi, T, p, width, transport_model, refine_criteria):
+        """
+        Signature of a sweep, all but the mass flux
+        """
+        return {'mechanism': self.mechanismHash, 'fuel': fuel,
+                'phi': float(phi), 'T': float(T), 'p': float(p),
+                'width': float(width), 'transport_model': transport_model,
+                'refine_criteria': {k: float(v) for k, v in
+                                    sorted(refine_criteria.items())},
+                'cantera': ct.__version__}
+
+    @staticmethod
+    def _hash(data):
+        return hashlib.sha1(json.dumps(data, sort_keys=True).encode()).hexdigest()
+
+    def key(self, signature, mdot):
+        # mass flux rounded, as it comes from gas.density*u
+        return self._hash({'signature': signature, 'mdot': '{:.10g}'.format(mdot)})
+
+    def _files(self, key):
+        from premixedCounterflow import flame_file
+        return flame_file(self.path, key), os.path.join(self.path, key + '.json')
+
+    def _entries(self):
+        entries = []
+        for fileName in os.listdir(self.path):
+            if not fileName.endswith('.json'):
+                continue
+            try:
+                with open(os.path.join(self.path, fileName)) as f:
+                    entries.append(json.load(f))
+            except (OSError, ValueError):
+                # removed or being written by another process
+                continue
+        return entries
+
+    def get(self, signature, mdot):
+        """
+        Solution file of the flame, or None
+        """
+        solution, info = self._files(self.key(signature, mdot))
+        if not (os.path.isfile(solution) and os.path.isfile(info)):
+            return None
+        try:
+            # last use, for the eviction
+            os.utime(solution)
+        except OSError:
+            return None
+        return solution
+
+    def info(self, signature, mdot):
+        with open(self._files(self.key(signature, mdot))[1]) as f:
+            return json.load(f)
+
+    def nearest(self, signature, mdot):
+        """
+        Solution file of the cached flame of the same signature with the
+        closest mass flux, or None
+        """
+        base = self._hash(signature)
+        best = None
+        for entry in self._entries():
+            if entry['base'] != base:
+                continue
+            distance = abs(np.log(entry['mdot']/mdot))
+            if best is None or distance < best[0]:
+                best = (distance, entry['key'])
+        if best is None:
+            return None
+        solution = self._files(best[1])[0]
+        return solution if os.path.isfile(solution) else None
+
+    def put(self, signature, mdot, oppFlame):
+        """
+        Save a converged flame and evict the least recently used entries
+        """
+        from premixedCounterflow import flame_file, save_flame
+        key = self.key(signature, mdot)
+        solution, info = self._files(key)
+        tmp = flame_file(self.path, key + '.{}.tmp'.format(os.getpid()))
+        save_flame(oppFlame, tmp)
+        os.replace(tmp, solution)
+
+        entry = {'key': key, 'base': self._hash(signature), 'mdot': float(mdot),
+                 'T_max': float(np.max(oppFlame.T)),
+                 'grid_points': int(oppFlame.grid.size),
+                 'signature': signature, 'created': time.time()}
+        with open(info + '.{}.tmp'.format(os.getpid()), 'w') as f:
+            json.dump(entry, f, indent=1)
+        os.replace(info + '.{}.tmp'.format(os.getpid()), info)
+        self.evict()
+
+    def evict(self):
+        """
+        Remove the least recently used solutions above maxSize
+        """
+        files = []
+        for entry in self._entries():
+            solution, info = self._files(entry['key'])
+            try:
+                stat = os.stat(solution)
+            except OSError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, solution, info))
+        total = sum(size for _, size, _, _ in files)
+        for _, size, solution, info in sorted(files):
+            if total <= self.maxSize:
+                break
+            for fileName in (info, solution):
+                try:
+                    os.remove(fileName)
+                except OSError:
+                    pass
+            total -= size
@@ -0,0 +1,401 @@
+#!/usr/bin/env python3
+"""
+Run the counter-flow sweeps of several mixtures in parallel.
+
+A case is one velocity chain of one (fuel, phi, mechanism). The chains are
+distributed over a process pool, each worker keeping one ct.Solution per
+mechanism (see mechanismRegistry.py), while the velocities of a chain are solved in order so that each
+point is warm-started from the previous one.
+
+With --predictor, each case is first solved with a cheap mechanism, and
+the detailed mechanism only at the points of the Markstein fit (see
+predictorCorrector.py).
+
+With --tolerance, the sweep of each case stops as soon as its Markstein
+fit has converged (see marksteinPipeline.OnlineMarkstein): the flames of
+higher stretch, above the Karlovitz threshold of the fit, are not solved.
+
+With --study, each mixture is first solved with the base transport model,
+T and p, then the other transport models (Multi, Multi+Soret, ...) and
+the T and p perturbations are solved in parallel, every point starting
+from the flame of the base case.
+
+Requires: cantera >= 2.5.0
+"""
+
+import numpy as np
+import os
+import argparse
+import time
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+from premixedCounterflow import velocity_sweep, adaptive_sweep, transport_name
+from profileStore import ProfileStore
+from profileWriter import ProfileWriter
+from mechanismRegistry import get_solution, mechanism_yaml
+from solutionCache import SolutionCache
+from sweepManifest import SweepManifest
+from sweepTelemetry import SolveTelemetry, report
+
+# options of the sweeps stopped on the converged Markstein fit
+earlyStopOptions = {'tolerance': 0.1, 'threshold': 10., 'method': 'ols',
+                    'definition': 'burnt', 'extinction': False}
+
+def _init_worker(mechanisms):
+    # Solution objects of the worker, built once from the cached YAML files
+    for mechanism in mechanisms:
+        get_solution(mechanism)
+
+
+def make_cases(fuels, phis, axial_velocity, mechanisms,
+               resultsPath = './counterFlowResults', width = 0.025,
+               transport_model = 'Mix', adaptive = False, csv = False,
+               cachePath = './solutionCache/', cacheSize = 1e9, restart = False,
+               telemetry = None, export = 'profiles', T = 300., p = 101325.,
+               predictor = None, earlyStop = None):
+    """
+    Build the grid of cases. The results are saved in
+    resultsPath/<fuel>/<phi>, with one more level by mechanism name when
+    several mechanisms are swept. The converged flames are shared through
+    the solution cache in cachePath (None to solve every flame). A case
+    interrupted before is resumed from its manifest, unless restart.
+    Every point is logged in the telemetry file if given. export 'full'
+    writes the whole state of the flames (see profileWriter). T and p are
+    those of the reactants. predictor holds the options of the two-level
+    sweeps (predictorCorrector.predictorOptions), None for one level.
+    earlyStop holds the options of the sweeps stopped on the converged
+    Markstein fit (earlyStopOptions), None to solve the whole sweeps.
+    """
+    cases = []
+    for mechanism in mechanisms:
+        root = resultsPath
+        if len(mechanisms) > 1:
+            root = os.path.join(resultsPath,
+                                os.path.splitext(os.path.basename(mechanism))[0])
+        for fuel in fuels:
+            for phi in phis:
+                cases.append({'fuel': fuel,
+                              'phi': float(phi),
+                              'mechanism': mechanism,
+                              'axial_velocity': np.asarray(axial_velocity),
+                              'width': width,
+                              'transport_model': transport_name(transport_model),
+                              'T': float(T),
+                              'p': float(p),
+                              'seed': None,
+                              'adaptive': adaptive,
+                              'csv': csv,
+                              'cachePath': cachePath,
+                              'cacheSize': cacheSize,
+                              'restart': restart,
+                              'telemetry': telemetry,
+                              'export': export,
+                              'predictor': predictor,
+                              'earlyStop': earlyStop,
+                              'path': os.path.join(root, fuel, '{:.2f}'.format(phi))})
+    return cases
+
+
+def study_label(transport_model, T, p):
+    return '{}-{:.0f}K-{:.4g}atm'.format(transport_model, T, p/101325.)
+
+
+def make_study(fuels, phis, axial_velocity, mechanisms, resultsPath = './counterFlowResults',
+               transport_model = 'Mix', T = 300., p = 101325., variants = ('Multi',),
+               temperatures = (), pressures = (), **options):
+    """
+    Cases of a transport and T/p study. For each mixture, the base case
+    (transport_model, T, p) and every other combination of the transport
+    models variants, the temperatures and the pressures, each seeded from
+    the base case. The cases are saved in
+    <mixture folder>/<transport>-<T>K-<p>atm.
+    """
+    transport_model = transport_name(transport_model)
+    transports = [transport_model] + [v for v in map(transport_name, variants)
+                                      if v != transport_model]
+    temperatures = [T] + [v for v in temperatures if v != T]
+    pressures = [p] + [v for v in pressures if v != p]
+
+    cases = []
+    for base in make_cases(fuels, phis, axial_velocity, mechanisms, resultsPath,
+                           transport_model = transport_model, T = T, p = p, **options):
+        root = base['path']
+        base['path'] = os.path.join(root, study_label(transport_model, T, p))
+        cases.append(base)
+        for transport in transports:
+            for T_ in temperatures:
+                for p_ in pressures:
+                    if (transport, T_, p_) == (transport_model, T, p):
+                        continue
+                    cases.append(dict(base, transport_model = transport, T = float(T_),
+                                      p = float(p_), seed = base['path'],
+                                      path = os.path.join(root, study_label(transport, T_, p_))))
+    return cases
+
+
+def case_name(case):
+    name = '{} phi={:.2f} ({})'.format(case['fuel'], case['phi'], case['mechanism'])
+    if case['seed'] is not None or case['T'] != 300. or case['p'] != 101325.:
+        name += ' ' + study_label(case['transport_model'], case['T'], case['p'])
+    return name
+
+
+def early_stop(case, manifest = None, gas = None):
+    """
+    OnlineMarkstein of a case, with the laminar flame of flamesProps and
+    the options of case['earlyStop']. The flames already converged in the
+    manifest (SweepManifest) of a resumed case are fitted first.
+    """
+    from flamesProps import flame_props
+    from marksteinPipeline import OnlineMarkstein
+
+    options = dict(earlyStopOptions, **case['earlyStop'])
+    props = flame_props(case['fuel'], case['phi'], case['mechanism'], case['T'],
+                        case['p'], case['transport_model'])
+    online = OnlineMarkstein(case['fuel'], props['D_th']/props['Sl_o'], props['Sl_o'],
+                             options['threshold'], options['method'], verbose = False,
+                             tolerance = options['tolerance'],
+                             definition = options['definition'])
+    if manifest is not None:
+        gas.set_equivalence_ratio(case['phi'], case['fuel'], {'O2':1.0, 'N2':3.76})
+        gas.TP = case['T'], case['p']
+        online.resume(manifest, gas, case['width'], case['transport_model'])
+    return online
+
+
+def run_case(case):
+    """
+    Solve the velocity chain of one case in the current process
+    """
+    if case.get('predictor'):
+        from predictorCorrector import predictor_corrector
+        start = time.time()
+        predictor_corrector(case)
+        return time.time() - start
+
+    gas = get_solution(case['mechanism'])
+    if not os.path.isdir(case['path']):
+        os.makedirs(case['path'], exist_ok=True)
+
+    store = None
+    if not case['csv']:
+        store = ProfileStore(case['path'], run = {'mechanism': case['mechanism'],
+                                                  'fuel': case['fuel'],
+                                                  'phi': case['phi'],
+                                                  'width': case['width'],
+                                                  'T': case['T'], 'p': case['p'],
+                                                  'transport_model': case['transport_model']})
+
+    cache = None
+    if case['cachePath'] is not None:
+        cache = SolutionCache(case['mechanism'], case['cachePath'],
+                              case['cacheSize'])
+
+    u = case['axial_velocity']
+    manifest = SweepManifest(case['path'], run = {
+                                 'mechanism': case['mechanism'],
+                                 'fuel': case['fuel'], 'phi': case['phi'],
+                                 'width': case['width'],
+                                 'transport_model': case['transport_model'],
+                                 'T': case['T'], 'p': case['p'],
+                                 'adaptive': case['adaptive'],
+                                 'export': case['export'],
+                                 'axial_velocity': [float(v) for v in u]},
+                             restart = case['restart'])
+
+    telemetry = None
+    if case['telemetry'] is not None:
+        telemetry = SolveTelemetry(case['telemetry'], mechanism = case['mechanism'],
+                                   fuel = case['fuel'], phi = case['phi'],
+                                   transport_model = case['transport_model'],
+                                   T = case['T'], p = case['p'])
+
+    # converged flames of the base case of a study
+    seed = None
+    if case['seed'] is not None:
+        seed = SweepManifest(case['seed'])
+
+    # flames fitted as they are solved, the sweep stops once Ma has converged
+    onFlame = None
+    untilExtinction = not case.get('earlyStop') or case['earlyStop'].get('extinction', False)
+    if case.get('earlyStop'):
+        online = early_stop(case, manifest, gas)
+        if online.stopped is not None and not untilExtinction:
+            print('\n** {}: Ma converged on the flames already solved'.format(case_name(case)))
+            return 0.
+        onFlame = online.add
+
+    start = time.time()
+    # the profiles are written while the next flame is solved
+    with ProfileWriter(case['path'], store) as writer:
+        if case['adaptive']:
+            # the velocity range gives the first point, first step and max.
+            adaptive_sweep(gas, case['phi'], case['fuel'], case['path'],
+                           u_start = u[0], u_max = u[-1], du = u[1] - u[0],
+                           width = case['width'],
+                           transport_model = case['transport_model'], loglevel = 0,
+                           store = store, cache = cache, manifest = manifest,
+                           telemetry = telemetry, writer = writer,
+                           export = case['export'], T = case['T'], p = case['p'],
+                           seed = seed, onFlame = onFlame,
+                           untilExtinction = untilExtinction)
+        else:
+            velocity_sweep(gas, case['phi'], case['fuel'], u, case['path'],
+                           width = case['width'],
+                           transport_model = case['transport_model'],
+                           continuation = True, loglevel = 0, store = store,
+                           cache = cache, manifest = manifest,
+                           telemetry = telemetry, writer = writer,
+                           export = case['export'], T = case['T'], p = case['p'],
+                           seed = seed, onFlame = onFlame)
+    return time.time() - start
+
+
+def run_sweep(cases, workers = None):
+    """
+    Spread the cases over a process pool. A case seeded from another one
+    (study) starts once its base case is finished.
+    Returns the list of (case, elapsed time or exception).
+    """
+    mechanisms = sorted(set([case['mechanism'] for case in cases] +
+                            [case['predictor']['mechanism'] for case in cases
+                             if case.get('predictor')]))
+    # convert the mechanisms before the workers start
+    for mechanism in mechanisms:
+        mechanism_yaml(mechanism)
+    results = []
+    waiting = list(cases)
+    unfinished = set(case['path'] for case in cases)
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(mechanisms,)) as pool:
+        futures = {}
+        while waiting or futures:
+            for case in [case for case in waiting if case['seed'] not in unfinished]:
+                waiting.remove(case)
+                futures[pool.submit(run_case, case)] = case
+            done, _ = wait(futures, return_when=FIRST_COMPLETED)
+            for future in done:
+                case = futures.pop(future)
+                unfinished.discard(case['path'])
+                try:
+                    status = future.result()
+                    print('** Done {} in {:.1f} s'.format(case_name(case), status))
+                except Exception as error:
+                    status = error
+                    print('** Failed {}: {}'.format(case_name(case), error))
+                results.append((case, status))
+    return results
+
+
+def main(argv = None):
+
+    parser = argparse.ArgumentParser(description='Parallel sweep of premixed '
+                                     'counter-flow twin flames')
+    parser.add_argument('--fuels', nargs='+', default=['CH4'])
+    parser.add_argument('--phis', nargs='+', type=float, default=[1.])
+    parser.add_argument('--velocity', nargs=3, type=float, default=[1., 5., 10],
+                        metavar=('START', 'STOP', 'NUM'),
+                        help='inlet velocity range (m/s), as np.linspace')
+    parser.add_argument('--mechanisms', nargs='+',
+                        default=['chemicalMechanism/kee.xml'])
+    parser.add_argument('--transport', default='Mix',
+                        help='transport model: Mix, Multi, Multi+Soret, UnityLewis '
+                        '(base model of --study)')
+    parser.add_argument('--T', type=float, default=300., help='reactants temperature (K)')
+    parser.add_argument('--p', type=float, default=1., help='pressure (atm)')
+    parser.add_argument('--study', action='store_true',
+                        help='solve each mixture with --transport, --T and --p, then '
+                        'the variants, temperatures and pressures from it')
+    parser.add_argument('--variants', nargs='+', default=['Multi', 'Multi+Soret'],
+                        help='transport models of --study')
+    parser.add_argument('--temperatures', nargs='+', type=float, default=[],
+                        help='reactants temperatures of --study (K)')
+    parser.add_argument('--pressures', nargs='+', type=float, default=[],
+                        help='pressures of --study (atm)')
+    parser.add_argument('--predictor', default=None, metavar='MECHANISM',
+                        help='cheap mechanism solving the whole sweep first, the '
+                        '--mechanisms are then solved at the points of the fit')
+    parser.add_argument('--fit-points', type=int, default=6,
+                        help='detailed points of --predictor, spread over the '
+                        'linear stretch range')
+    parser.add_argument('--threshold', type=float, default=10.,
+                        help='largest Karlovitz number of the fit of --predictor '
+                        'and --tolerance')
+    parser.add_argument('--map-guess', action='store_true',
+                        help='start the detailed points of --predictor from the '
+                        'predictor flames instead of by continuation')
+    parser.add_argument('--compare', action='store_true',
+                        help='also solve the whole sweep with the detailed '
+                        'mechanism, for the measured speedup and Ma error')
+    parser.add_argument('--tolerance', type=float, default=None,
+                        help='stop each sweep once the confidence interval of '
+                        'its Ma (burnt gas) is narrower, or its flames are above '
+                        '--threshold')
+    parser.add_argument('--until-extinction', action='store_true',
+                        help='with --adaptive and --tolerance, go on to the '
+                        'extinction once the fit has converged')
+    parser.add_argument('--width', type=float, default=0.025)
+    parser.add_argument('--results', default='./counterFlowResults')
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--adaptive', action='store_true',
+                        help='adaptive steps up to extinction, the velocity '
+                        'range gives the first point, first step and max.')
+    parser.add_argument('--csv', action='store_true',
+                        help='one csv file by velocity instead of the binary '
+                        'store of each case')
+    parser.add_argument('--export', choices=['profiles', 'full'], default='profiles',
+                        help='full: all the species, elements and transport '
+                        'properties of the flames, for fields derived later')
+    parser.add_argument('--cache', default='./solutionCache/',
+                        help='folder of the converged flames, restored '
+                        'instead of solved on the next runs')
+    parser.add_argument('--cache-size', type=float, default=1000.,
+                        help='size limit of the cache (MB), least recently '
+                        'used flames are removed first')
+    parser.add_argument('--no-cache', action='store_true',
+                        help='solve every flame')
+    parser.add_argument('--restart', action='store_true',
+                        help='start the cases again instead of resuming them '
+                        'from their sweep manifest')
+    parser.add_argument('--telemetry', default=None,
+                        help='log of every solve (JSON lines), '
+                        'RESULTS/telemetry.jsonl by default')
+    parser.add_argument('--no-telemetry', action='store_true')
+    args = parser.parse_args(argv)
+
+    telemetry = args.telemetry or os.path.join(args.results, 'telemetry.jsonl')
+    if args.no_telemetry:
+        telemetry = None
+
+    axial_velocity = np.linspace(args.velocity[0], args.velocity[1],
+                                 int(args.velocity[2]))
+    options = dict(width = args.width, adaptive = args.adaptive, csv = args.csv,
+                   cachePath = None if args.no_cache else args.cache,
+                   cacheSize = args.cache_size*1e6, restart = args.restart,
+                   telemetry = telemetry, export = args.export)
+    if args.predictor is not None:
+        options['predictor'] = {'mechanism': args.predictor, 'points': args.fit_points,
+                                'threshold': args.threshold,
+                                'mapGuess': args.map_guess, 'compare': args.compare}
+    if args.tolerance is not None:
+        options['earlyStop'] = {'tolerance': args.tolerance, 'threshold': args.threshold,
+                                'extinction': args.until_extinction}
+    if args.study:
+        cases = make_study(args.fuels, args.phis, axial_velocity, args.mechanisms,
+                           args.results, args.transport, args.T, args.p*101325.,
+                           args.variants, args.temperatures,
+                           [p*101325. for p in args.pressures], **options)
+    else:
+        cases = make_cases(args.fuels, args.phis, axial_velocity, args.mechanisms,
+                           args.results, transport_model = args.transport,
+                           T = args.T, p = args.p*101325., **options)
+    print('Cases: {}'.format(len(cases)))
+    run_sweep(cases, args.workers)
+    if telemetry is not None and os.path.isfile(telemetry):
+        print('')
+        report(telemetry)
+
+
+if __name__=='__main__':
+    print('\n*** Parallel sweep of premixed counter-flow twin flames  ***\n\n')
+    main()
@@ -0,0 +1,132 @@
+import os
+import json
+import time
+
+
+class SweepManifest:
+    """
+    MANIFEST OF A COUNTER-FLOW SWEEP
+    Status of every point of the sweep (pending, converged, extinguished or
+    failed), its solve time and the file of its converged flame, kept in
+    sweep.json of the case folder. The flames are saved with oppFlame.save in
+    the solutions/ subfolder, so that a sweep killed or timed out can be
+    restarted at its first unfinished point, from the last converged flame.
+    """
+    manifestFile = 'sweep.json'
+    solutionFolder = 'solutions'
+    statuses = ('pending', 'converged', 'extinguished', 'failed')
+
+    def __init__(self, path, run = None, restart = False):
+        """
+        Open the manifest of the case folder path. A manifest of another run
+        (mechanism, fuel, phi, ...) is started again, as with restart.
+        """
+        self.path = path
+        fileName = os.path.join(path, self.manifestFile)
+        self.manifest = None
+        if os.path.isfile(fileName) and not restart:
+            with open(fileName) as f:
+                self.manifest = json.load(f)
+            if run is not None and self.manifest['run'] != run:
+                print('Sweep manifest of another run, starting again')
+                self.manifest = None
+        if self.manifest is None:
+            if not os.path.isdir(path):
+                os.makedirs(path)
+            self.manifest = {'run': dict(run or {}), 'points': [], 'state': {}}
+
+    @property
+    def points(self):
+        return self.manifest['points']
+
+    @property
+    def state(self):
+        """ State of the sweep algorithm, saved with every point """
+        return self.manifest['state']
+
+    def _save(self):
+        fileName = os.path.join(self.path, self.manifestFile)
+        with open(fileName + '.tmp', 'w') as f:
+            json.dump(self.manifest, f, indent=1)
+        os.replace(fileName + '.tmp', fileName)
+
+    def point(self, label):
+        for point in self.points:
+            if point['label'] == label:
+                return point
+        return None
+
+    def plan(self, labels, velocities):
+        """
+        Add the points of the sweep not in the manifest yet, as pending
+        """
+        for label, u in zip(labels, velocities):
+            if self.point(label) is None:
+                self.points.append({'label': label, 'u': float(u),
+                                    'status': 'pending'})
+        self.points.sort(key=lambda point: point['u'])
+        self._save()
+
+    def status(self, label):
+        point = self.point(label)
+        return 'pending' if point is None else point['status']
+
+    def finished(self):
+        """ True once the sweep reached the extinction """
+        return self.state.get('finished', False)
+
+    def stopped(self):
+        """ True if the sweep was stopped before the extinction (early stop) """
+        return self.state.get('stopped', False)
+
+    def update(self, label, velocity, status, solveTime = None, oppFlame = None,
+               **state):
+        """
+        Record one point. The flame of a converged point is saved, state
+        updates the saved state of the sweep.
+        """
+        from premixedCounterflow import flame_file, save_flame
+        if status not in self.statuses:
+            raise ValueError('Unknown status: ' + str(status))
+        point = self.point(label)
+        if point is None:
+            point = {'label': label, 'u': float(velocity)}
+            self.points.append(point)
+            self.points.sort(key=lambda point: point['u'])
+        point.update({'status': status, 'solve_time': solveTime,
+                      'time': time.time(), 'solution': None})
+        if status == 'converged' and oppFlame is not None:
+            folder = os.path.join(self.path, self.solutionFolder)
+            if not os.path.isdir(folder):
+                os.makedirs(folder, exist_ok=True)
+            fileName = flame_file(folder, label)
+            save_flame(oppFlame, fileName)
+            point['solution'] = os.path.relpath(fileName, self.path)
+        self.state.update(state)
+        self._save()
+
+    def last_converged(self, before = None):
+        """
+        Last converged point with a saved flame, below the velocity before
+        """
+        last = None
+        for point in self.points:
+            if before is not None and point['u'] >= before:
+                break
+            if point['status'] == 'converged' and point.get('solution'):
+                last = point
+        return last
+
+    def closest_converged(self, u):
+        """
+        Converged point with a saved flame closest to the velocity u
+        """
+        points = [point for point in self.points
+                  if point['status'] == 'converged' and point.get('solution')]
+        if not points:
+            return None
+        return min(points, key=lambda point: abs(point['u'] - u))
+
+    def solution(self, point):
+        """ File of the saved flame of a point """
+        return os.path.join(self.path, point['solution'])
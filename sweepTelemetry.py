@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+"""
+Per-solve telemetry of the counter-flow sweeps, and its summary report.
+
+Every point of a sweep is one JSON line of the log: wall time of each phase
+(rescaling, warm and cold solves, cache, profile output, ...), the solver
+statistics of Cantera (grid refinements and sizes, residual evaluations,
+Jacobians, time steps), how the point was started and ended, and the peak
+memory of the process. The report sums the log up by case:
+
+    python sweepTelemetry.py counterFlowResults/telemetry.jsonl
+"""
+
+import numpy as np
+import pandas as pd
+import os
+import sys
+import json
+import time
+import argparse
+import contextlib
+
+# Solver statistics of Sim1D, one value per grid of the last solve
+solverStats = ['grid_size_stats', 'eval_count_stats', 'eval_time_stats',
+               'jacobian_count_stats', 'jacobian_time_stats', 'time_step_stats']
+
+
+def peak_memory():
+    """ Peak resident memory of the process (MB) """
+    import resource
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # bytes on macOS, kB on Linux
+    return rss/1e6 if sys.platform == 'darwin' else rss/1e3
+
+
+class SolveTelemetry:
+    """
+    LOG OF THE POINTS OF A SWEEP
+    One record by point, from start_point to end_point, appended as one JSON
+    line to fileName. context (fuel, phi, mechanism, ...) is written in
+    every record, so that several sweeps can share the log.
+    """
+
+    def __init__(self, fileName, **context):
+        self.fileName = fileName
+        self.context = context
+        self.record = None
+        folder = os.path.dirname(fileName)
+        if folder and not os.path.isdir(folder):
+            os.makedirs(folder, exist_ok=True)
+
+    def start_point(self, **fields):
+        self.record = dict(self.context)
+        self.record.update(fields)
+        self.record.update({'phases': {}, 'grids': [], 'evals': 0, 'eval_time': 0.,
+                            'jacobians': 0, 'jacobian_time': 0., 'time_steps': 0,
+                            'solves': 0, 'failed_solves': 0})
+        self._start = time.time()
+
+    def note(self, **fields):
+        if self.record is not None:
+            self.record.update(fields)
+
+    @contextlib.contextmanager
+    def phase(self, name, oppFlame = None):
+        """
+        Time one phase of the point. With oppFlame, the phase is a solve and
+        the solver statistics are added to the record.
+        """
+        if oppFlame is not None and hasattr(oppFlame, 'clear_stats'):
+            oppFlame.clear_stats()
+        start = time.time()
+        converged = False
+        try:
+            yield
+            converged = True
+        finally:
+            if self.record is not None:
+                phases = self.record['phases']
+                phases[name] = phases.get(name, 0.) + time.time() - start
+                if oppFlame is not None:
+                    self.add_stats(oppFlame, converged)
+
+    def add_stats(self, oppFlame, converged = True):
+        stats = {name: list(getattr(oppFlame, name, [])) for name in solverStats}
+        self.record['grids'] += [int(n) for n in stats['grid_size_stats']]
+        self.record['evals'] += int(sum(stats['eval_count_stats']))
+        self.record['eval_time'] += float(sum(stats['eval_time_stats']))
+        self.record['jacobians'] += int(sum(stats['jacobian_count_stats']))
+        self.record['jacobian_time'] += float(sum(stats['jacobian_time_stats']))
+        self.record['time_steps'] += int(sum(stats['time_step_stats']))
+        self.record['solves'] += 1
+        if not converged:
+            self.record['failed_solves'] += 1
+
+    def end_point(self, **fields):
+        """
+        Close the record of the point and append it to the log
+        """
+        if self.record is None:
+            return
+        self.record.update(fields)
+        self.record['refinements'] = max(len(self.record['grids']) - self.record['solves'], 0)
+        self.record['wall_time'] = time.time() - self._start
+        self.record['peak_memory'] = peak_memory()
+        self.record['pid'] = os.getpid()
+        self.record['time'] = time.time()
+        # one write of the whole line, the sweep workers append to the same log
+        line = json.dumps(self.record, default=float) + '\n'
+        with open(self.fileName, 'a') as f:
+            f.write(line)
+        self.record = None
+
+
+def phase(telemetry, name, oppFlame = None):
+    """
+    telemetry.phase, or nothing without telemetry
+    """
+    if telemetry is None:
+        return contextlib.nullcontext()
+    return telemetry.phase(name, oppFlame)
+
+
+def read_log(fileName):
+    """
+    Records of the log as a DataFrame, one column by phase (phase_<name>)
+    """
+    records = []
+    with open(fileName) as f:
+        for line in f:
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                # line of a killed process
+                continue
+    for record in records:
+        for name, value in record.pop('phases', {}).items():
+            record['phase_' + name] = value
+        grids = record.pop('grids', [])
+        record['grid_points'] = record.get('grid_points', grids[-1] if grids else np.nan)
+    return pd.DataFrame(records)
+
+
+def report(fileName, keys = ('mechanism', 'fuel', 'phi', 'transport_model', 'T', 'p'),
+           worst = 5):
+    """
+    Summary of the log by case, and the most expensive points
+    """
+    log = read_log(fileName)
+    if log.empty:
+        print('Empty log: ' + fileName)
+        return log
+    keys = [key for key in keys if key in log.columns]
+    phases = [column for column in log.columns if column.startswith('phase_')]
+    log[phases] = log[phases].fillna(0.)
+
+    # logs of older sweeps have no transport model, T and p
+    summary = log.groupby(keys, dropna=False).agg(points=('wall_time', 'size'),
+                                    wall_time=('wall_time', 'sum'),
+                                    mean_time=('wall_time', 'mean'),
+                                    max_time=('wall_time', 'max'),
+                                    max_grid=('grid_points', 'max'),
+                                    refinements=('refinements', 'sum'),
+                                    failed_solves=('failed_solves', 'sum'),
+                                    time_steps=('time_steps', 'sum'),
+                                    jacobians=('jacobians', 'sum'),
+                                    peak_memory=('peak_memory', 'max'))
+    if 'status' in log.columns:
+        summary = summary.join(pd.crosstab([log[key] for key in keys], log['status']))
+    summary = summary.sort_values('wall_time', ascending=False)
+
+    pd.options.display.width = 200
+    pd.options.display.max_columns = 30
+    print('** Sweep telemetry: {} points, {:.1f} s'.format(len(log), log['wall_time'].sum()))
+    print(summary.to_string(float_format='{:.2f}'.format))
+    print('\n** Time by phase (s)')
+    print(log[phases].sum().sort_values(ascending=False).to_string(float_format='{:.2f}'.format))
+    columns = [c for c in keys + ['u', 'start', 'status', 'wall_time', 'grid_points',
+                                  'refinements', 'time_steps', 'failed_solves']
+               if c in log.columns]
+    print('\n** Most expensive points')
+    print(log.nlargest(worst, 'wall_time')[columns].to_string(
+          index=False, float_format='{:.2f}'.format))
+    return summary
+
+
+def main(argv = None):
+
+    parser = argparse.ArgumentParser(description='Summary of the sweep telemetry')
+    parser.add_argument('log', help='telemetry file (JSON lines)')
+    parser.add_argument('--csv', default=None,
+                        help='also write the summary by case as csv')
+    parser.add_argument('--worst', type=int, default=5,
+                        help='number of most expensive points listed')
+    args = parser.parse_args(argv)
+
+    summary = report(args.log, worst = args.worst)
+    if args.csv is not None and not summary.empty:
+        summary.to_csv(args.csv)
+
+
+if __name__=='__main__':
+    main()